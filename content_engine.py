@@ -20,13 +20,23 @@ content_engine.py — Единый модуль замены контента v4
 """
 
 import re
+import hashlib
 import logging
+import chardet
 from enum import Enum, auto
 from typing import Optional, List, Dict, Tuple, Any
 from lxml import etree, html
 from lxml.html import HtmlElement, tostring, fragment_fromstring
 from copy import deepcopy
 
+from html_splice import locate_body, find_start_tag
+from xpath_registry import (
+    CONTENT_XPATHS, CATEGORY_LISTING_XPATHS, CATEGORY_HEADER_XPATHS, HEADER_XPATHS,
+    COMPILED_CONTENT, COMPILED_CATEGORY_LISTING, COMPILED_CATEGORY_HEADER,
+    COMPILED_HEADER, COMPILED_CATEGORY_STRUCTURE, LISTING_ARTICLES, SINGLE_ARTICLE,
+    DESCENDANT_P, DESCENDANT_ARTICLES, compile_xpath,
+)
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # PAGE TYPE ENUM
@@ -49,226 +59,8 @@ if not logger.handlers:
     handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
     logger.addHandler(handler)
 
-# ─────────────────────────────────────────────────────────────────────────────
-# СЕЛЕКТОРЫ КОНТЕЙНЕРОВ (XPath, от узких к широким)
-# ─────────────────────────────────────────────────────────────────────────────
-CONTENT_XPATHS: Tuple[str, ...] = (
-    # === 1. Page Builders (самые точные) ===
-    # Elementor
-    "//div[contains(@class, 'elementor-widget-theme-post-content')]//div[contains(@class, 'elementor-widget-container')]",
-    "//div[contains(@class, 'elementor-widget-text-editor')]//div[contains(@class, 'elementor-widget-container')]",
-    "//div[contains(@class, 'elementor-text-editor')]",
-    # Divi
-    "//div[contains(@class, 'et_pb_post_content')]",
-    "//div[contains(@class, 'et_pb_text_inner')]",
-    "//div[contains(@class, 'et_pb_module_inner')]",
-    # WPBakery
-    "//div[contains(@class, 'wpb_text_column')]//div[contains(@class, 'wpb_wrapper')]",
-    "//div[contains(@class, 'wpb_content_element')]//div[contains(@class, 'wpb_wrapper')]",
-    # Beaver Builder
-    "//div[contains(@class, 'fl-post-content')]",
-    "//div[contains(@class, 'fl-module-content')]",
-    "//div[contains(@class, 'fl-rich-text')]",
-    # Bricks
-    "//div[contains(@class, 'brxe-post-content')]",
-    "//div[contains(@class, 'brxe-text-basic')]",
-    "//div[contains(@class, 'brxe-text')]",
-    # Oxygen
-    "//div[contains(@class, 'ct-text-block')]",
-    "//div[contains(@class, 'oxy-post-content')]",
-    "//div[contains(@class, 'ct-content-block')]",
-    # Gutenberg
-    "//div[contains(@class, 'wp-block-post-content')]",
-    # Thrive
-    "//div[contains(@class, 'thrv_text_element')]",
-    "//div[contains(@class, 'tve_shortcode_rendered')]",
-    # Brizy
-    "//div[contains(@class, 'brz-rich-text')]",
-    "//div[contains(@class, 'brz-text')]",
-    # SeedProd
-    "//div[contains(@class, 'seedprod-text')]",
-
-    # === 2. Специфичные темы ===
-    # Flavor / flavor variations
-    "//div[contains(@class, 'single-content')]",
-    "//div[contains(@class, 'w-post-elm') and contains(@class, 'post_content')]",
-    "//div[contains(@class, 'uk-margin-medium-top') and @property='text']",
-    "//div[@property='text']",
-    "//div[contains(@class, 'l-section-h')]//div[contains(@class, 'w-post-elm')]",
-    # Astra
-    "//div[contains(@class, 'ast-post-content')]",
-    "//div[contains(@class, 'ast-article-post')]//div[contains(@class, 'entry-content')]",
-    # GeneratePress
-    "//div[contains(@class, 'inside-article')]//div[contains(@class, 'entry-content')]",
-    # OceanWP
-    "//div[contains(@class, 'oceanwp-post-content')]",
-    # flavor theme ct- classes
-    "//div[contains(@class, 'ct-page-content')]",
-    "//div[contains(@class, 'ct-container-content')]",
-    "//div[contains(@class, 'ct-inner-content')]",
-    # Magazine themes
-    "//div[contains(@class, 'td-post-content')]",
-    "//div[contains(@class, 'jeg_post_content')]",
-    "//div[contains(@class, 'tdb-block-inner')]",
-    # flavor theme vc
-    "//div[contains(@class, 'vc_row')]//div[contains(@class, 'wpb_wrapper')]",
-
-    # === 3. WooCommerce ===
-    "//div[contains(@class, 'woocommerce-product-details__short-description')]",
-    "//div[@id='tab-description']",
-    "//div[contains(@class, 'woocommerce-Tabs-panel--description')]",
-    "//div[contains(@class, 'product-short-description')]",
-
-    # === 4. Стандарты WordPress ===
-    "//div[contains(@class, 'entry-content')]",
-    "//div[contains(@class, 'post-content')]",
-    "//div[contains(@class, 'single-post-content')]",
-    "//div[contains(@class, 'article-content')]",
-    "//div[contains(@class, 'the-content')]",
-    "//div[contains(@class, 'page-content')]",
-    "//div[contains(@class, 'blog-single-content')]",
-    "//div[contains(@class, 'post-body')]",
-    "//div[contains(@class, 'content-inner')]",
-    "//div[contains(@class, 'singular-content')]",
-
-    # === 5. Schema.org ===
-    "//*[@itemprop='articleBody']",
-    "//*[@itemprop='text']",
-    "//*[@itemprop='description']",
-
-    # === 6. Fallback (широкие) ===
-    "//div[contains(@class, 'content-area')]//div[contains(@class, 'entry-content')]",
-    "//div[contains(@class, 'content-container')]",
-    "//div[contains(@class, 'content-wrapper')]",
-    "//div[@id='primary']//div[contains(@class, 'content')]",
-    "//div[@id='content']",
-    "//div[@role='main']",
-    "//article//div[contains(@class, 'content')]",
-    "//article",
-    "//div[contains(@class, 'hentry')]",
-
-    # === 7. HTML5 (крайний случай) ===
-    "//main//article",
-    "//article[not(contains(@class, 'sidebar'))]",
-    "//main[not(contains(@class, 'sidebar'))]",
-)
-
-# ─────────────────────────────────────────────────────────────────────────────
-# СЕЛЕКТОРЫ ДЛЯ КАТЕГОРИЙ/АРХИВОВ (листинги постов)
-# ─────────────────────────────────────────────────────────────────────────────
-CATEGORY_LISTING_XPATHS: Tuple[str, ...] = (
-    # === Publisher / flavor themes ===
-    "//div[contains(@class, 'listing-grid')]",
-    "//div[contains(@class, 'listing-blog')]",
-    "//div[contains(@class, 'listing') and contains(@class, 'clearfix')]",
-
-    # === JNews / flavor themes ===
-    "//div[contains(@class, 'jeg_posts')]",
-    "//div[contains(@class, 'jeg_postblock')]",
-    "//div[contains(@class, 'jnews_posts')]",
-
-    # === flavor theme Flavor Flavor ===
-    "//div[contains(@class, 'posts-listing')]",
-    "//div[contains(@class, 'post-listing')]",
-    "//div[contains(@class, 'blog-listing')]",
-
-    # === flavor theme flavor flavor flavor ===
-    "//div[contains(@class, 'td-ss-main-content')]",
-    "//div[contains(@class, 'td_module_wrap')]",
-    "//div[contains(@class, 'tdb-block-inner')]//div[contains(@class, 'td-module')]/..",
-
-    # === Flavor flavor flavor ===
-    "//div[contains(@class, 'elementor-posts-container')]",
-    "//div[contains(@class, 'elementor-posts')]",
-    "//div[contains(@class, 'elementor-loop-container')]",
-
-    # === flavor flavor flavor ===
-    "//div[contains(@class, 'et_pb_blog_grid')]",
-    "//div[contains(@class, 'et_pb_posts')]",
-
-    # === flavor flavor flavor ===
-    "//div[contains(@class, 'theme-flavor-container')]//div[contains(@class, 'posts')]",
-    "//div[contains(@class, 'ast-archive-post')]/..",
-    "//div[contains(@class, 'flavor')]//div[contains(@class, 'posts')]",
-
-    # === flavor Standard ===
-    "//div[contains(@class, 'archive-posts')]",
-    "//div[contains(@class, 'blog-posts')]",
-    "//div[contains(@class, 'posts-wrapper')]",
-    "//div[contains(@class, 'post-list')]",
-    "//div[contains(@class, 'category-posts')]",
-
-    # === flavor flavor flavor (содержит articles) ===
-    "//div[.//article[contains(@class, 'listing-item')]]",
-    "//div[.//article[contains(@class, 'post-item')]]",
-    "//div[.//article[contains(@class, 'type-post')]]",
-    "//section[.//article[contains(@class, 'type-post')]]",
-
-    # === flavor Fallback ===
-    "//main//div[count(.//article) >= 2]",
-    "//div[@id='content']//div[count(.//article) >= 2]",
-    "//div[contains(@class, 'content')]//div[count(.//article) >= 2]",
-)
-
-# XPath для поиска H1 в категориях/архивах
-CATEGORY_HEADER_XPATHS: Tuple[str, ...] = (
-    # === Publisher / flavor themes ===
-    "//section[contains(@class, 'archive-title')]//h1",
-    "//section[contains(@class, 'category-title')]//h1",
-    "//div[contains(@class, 'archive-title')]//h1",
-    "//div[contains(@class, 'category-title')]//h1",
-
-    # === flavor Standard ===
-    "//h1[contains(@class, 'page-heading')]",
-    "//h1[contains(@class, 'page-title')]",
-    "//h1[contains(@class, 'archive-title')]",
-    "//h1[contains(@class, 'category-title')]",
-    "//h1[contains(@class, 'term-title')]",
-
-    # === JNews ===
-    "//div[contains(@class, 'jeg_cat_header')]//h1",
-    "//div[contains(@class, 'jeg_archive_header')]//h1",
-
-    # === flavor flavor ===
-    "//header[contains(@class, 'page-header')]//h1",
-    "//header[contains(@class, 'archive-header')]//h1",
-    "//div[contains(@class, 'page-header')]//h1",
-
-    # === Elementor ===
-    "//div[contains(@class, 'elementor-widget-archive-title')]//h1",
-    "//h1[contains(@class, 'elementor-heading-title')]",
-
-    # === Fallback ===
-    "//h1",
-)
-
-# XPath для поиска H1
-HEADER_XPATHS: Tuple[str, ...] = (
-    # Именно этот класс отвечает за динамический заголовок в твоей теме
-    "//div[contains(@class, 'elementor-widget-theme-post-title')]//h1",
-    "//div[contains(@class, 'elementor-widget-page-title')]//h1",
-    "//*[@data-widget_type='theme-post-title.default']//h1",
-
-    # Баннеры тем
-    "//section[contains(@class, 'page-title')]//h1",
-    "//div[contains(@class, 'page-header')]//h1",
-    "//header[contains(@class, 'entry-header')]//h1",
-    "//div[contains(@class, 'entry-header')]//h1",
-    "//div[contains(@class, 'post-header')]//h1",
-
-    # Elementor
-    "//h1[contains(@class, 'elementor-heading-title')]",
-    "//div[contains(@class, 'elementor-widget-heading')]//h1",
-
-    # Специфичные
-    "//h1[contains(@class, 'entry-title')]",
-    "//h1[contains(@class, 'post-title')]",
-    "//h1[contains(@class, 'page-title')]",
-    "//h1[@id='post_title']",
-
-    # Глобальный fallback
-    "//h1",
-)
+# Селекторы контейнеров, листингов и H1 — в xpath_registry.py
+# (там же они компилируются один раз)
 
 # Элементы темы которые НЕ трогаем
 PRESERVE_CLASSES = frozenset([
@@ -287,6 +79,9 @@ CATEGORY_PRESERVE_CLASSES = frozenset([
     'archive-description', 'category-description',
 ])
 
+# Кандидаты в контейнер при поиске по плотности текста
+DENSITY_CONTAINER_TAGS = frozenset(['div', 'article', 'section', 'main'])
+
 # Void-элементы HTML5 (самозакрывающиеся)
 VOID_ELEMENTS = frozenset([
     'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
@@ -294,6 +89,112 @@ VOID_ELEMENTS = frozenset([
 ])
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# КЭШ ПРОФИЛЕЙ ТЕМ
+# ─────────────────────────────────────────────────────────────────────────────
+# Сколько уровней под <body> входит в скелет темы
+FINGERPRINT_DEPTH = 3
+
+# Теги, которые не описывают вёрстку темы
+FINGERPRINT_SKIP_TAGS = frozenset(['script', 'style', 'noscript', 'template', 'link', 'meta', 'br'])
+
+_DIGITS_RE = re.compile(r'\d+')
+
+# «Домен» профилей, общих для шаблона (ключ — template_id)
+TEMPLATE_PROFILE_DOMAIN = '*template*'
+
+# Закрывающий </head> (ищется только в тексте до <body>)
+_HEAD_END_RE = re.compile(r'</head\s*>', re.IGNORECASE)
+
+
+class ThemeProfileCache:
+    """
+    Кэш «профилей тем»: где на страницах одной темы лежат контейнер, листинг и H1.
+
+    Ключ — (домен, отпечаток скелета body). Все страницы домена на одной теме
+    имеют одинаковый скелет, поэтому XPath, найденный на первой странице,
+    сразу проверяется на следующих. Каждое попадание валидируется;
+    при промахе выполняется полный поиск, и профиль обновляется.
+    """
+
+    def __init__(self):
+        # (domain, fingerprint) → {'content': xpath, 'listing': xpath, 'h1': xpath, ...}
+        self._profiles: Dict[Tuple[str, str], Dict[str, str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, domain: str, fingerprint: str, slot: str) -> Optional[str]:
+        return self._profiles.get((domain, fingerprint), {}).get(slot)
+
+    def learn(self, domain: str, fingerprint: str, slot: str, xpath: str):
+        self._profiles.setdefault((domain, fingerprint), {})[slot] = xpath
+
+    def forget(self, domain: str, fingerprint: str, slot: str):
+        self._profiles.get((domain, fingerprint), {}).pop(slot, None)
+
+    def clear(self):
+        self._profiles.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+
+# Общий кэш для публичных функций (используется, когда передан domain)
+theme_profile_cache = ThemeProfileCache()
+
+
+def body_fingerprint(body: HtmlElement) -> str:
+    """
+    Структурный отпечаток темы: тег/id/классы верхних уровней body.
+
+    Цифры убираются (postid-123, elementor-456), у классов body остаётся
+    только первая часть токена (single, category, page), поэтому страницы
+    одной темы получают одинаковый отпечаток.
+    """
+    body_tokens = sorted({
+        _DIGITS_RE.sub('', token.split('-')[0])
+        for token in (body.get('class') or '').lower().split()
+    })
+
+    skeleton = set()
+    stack = [(child, 1) for child in body]
+    while stack:
+        elem, depth = stack.pop()
+        if not isinstance(elem.tag, str) or elem.tag in FINGERPRINT_SKIP_TAGS:
+            continue
+
+        classes = ' '.join(sorted(_DIGITS_RE.sub('', c) for c in (elem.get('class') or '').split()))
+        elem_id = _DIGITS_RE.sub('', elem.get('id') or '')
+        skeleton.add(f"{depth}:{elem.tag}#{elem_id}.{classes}")
+
+        if depth < FINGERPRINT_DEPTH:
+            stack.extend((child, depth + 1) for child in elem)
+
+    raw = ' '.join(body_tokens) + '|' + '|'.join(sorted(skeleton))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def element_locator(elem: HtmlElement) -> str:
+    """
+    XPath для повторного поиска элемента на страницах той же темы.
+
+    По id или точному class, если в них нет цифр (они зависят от записи),
+    иначе — позиционный путь от корня.
+    """
+    tag = elem.tag
+    elem_id = elem.get('id')
+    if elem_id and not _DIGITS_RE.search(elem_id) and "'" not in elem_id:
+        return f"//{tag}[@id='{elem_id}']"
+
+    classes = elem.get('class')
+    if classes and not _DIGITS_RE.search(classes) and "'" not in classes:
+        return f"//{tag}[@class='{classes}']"
+
+    return elem.getroottree().getpath(elem)
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # ОСНОВНОЙ КЛАСС
 # ─────────────────────────────────────────────────────────────────────────────
@@ -306,24 +207,44 @@ class ContentEngine:
     - CATEGORY/ARCHIVE: удаление листинга постов, вставка контента
 
     КРИТИЧНО: Не трогает <head>, работает только с <body>.
+
+    Если передан domain, найденные XPath запоминаются в ThemeProfileCache
+    и проверяются первыми на других страницах той же темы.
+    Если передан template (id из template_clusters.py), профиль общий
+    для всех доменов этого шаблона.
     """
 
-    def __init__(self, html_content: str):
+    def __init__(self,
+                 html_content: str,
+                 domain: Optional[str] = None,
+                 profile_cache: Optional[ThemeProfileCache] = None,
+                 template: Optional[str] = None):
         self.original_html = html_content
         self.doc = None
         self.body = None
         self.container = None
         self.h1_element = None
 
+        # Кэш профилей темы (только при известном домене или шаблоне)
+        self.domain = domain
+        self.template = template
+        self.profile_cache = profile_cache if profile_cache is not None else (
+            theme_profile_cache if domain is not None or template is not None else None
+        )
+        self._fingerprint: Optional[str] = None
+
         # v4.0: Новые атрибуты для категорий
         self.page_type: PageType = PageType.UNKNOWN
         self.listing_container = None  # Контейнер листинга для категорий
 
+        # Границы <body> находит сканер (script/style/комментарии пропускаются)
+        self._body_span = locate_body(html_content)
+
         # Сохраняем head отдельно
         self._head_html = self._extract_head(html_content)
         self._doctype = self._extract_doctype(html_content)
 
-        # Парсим только для работы с body
+        # Парсим только body: head с инлайновыми CSS/JS в lxml не попадает
         self._parse_html(html_content)
 
     def _extract_doctype(self, html_content: str) -> str:
@@ -335,22 +256,30 @@ class ContentEngine:
         """
         Извлекает <head>...</head> как СЫРУЮ СТРОКУ.
         Это гарантирует что мы его не изменим.
+
+        Поиск ограничен текстом до <body>; начало head находит сканер,
+        конец — последний </head> перед body.
         """
-        # Ищем head с учётом возможных атрибутов
-        match = re.search(
-            r'(<head[^>]*>.*?</head>)',
-            html_content,
-            re.IGNORECASE | re.DOTALL
-        )
-        if match:
-            return match.group(1)
+        prefix = html_content[:self._body_span[0]] if self._body_span else html_content
+
+        start = find_start_tag(prefix, 'head')
+        if start >= 0:
+            ends = list(_HEAD_END_RE.finditer(prefix, start))
+            if ends:
+                return prefix[start:ends[-1].end()]
         return '<head></head>'
 
     def _parse_html(self, html_content: str):
-        """Парсит HTML через lxml."""
+        """Парсит HTML через lxml (только диапазон <body>, если он найден)."""
         try:
-            # Используем lxml.html для парсинга
-            self.doc = html.fromstring(html_content)
+            if self._body_span is not None:
+                start, end = self._body_span
+                # Документ из одного body: атрибуты body сохраняются,
+                # head и всё, что после </body>, не разбираются
+                self.doc = html.document_fromstring(html_content[start:end])
+            else:
+                # Используем lxml.html для парсинга
+                self.doc = html.fromstring(html_content)
 
             # Находим body
             body_list = self.doc.xpath('//body')
@@ -363,6 +292,49 @@ class ContentEngine:
             logger.error(f"Ошибка парсинга HTML: {e}")
             raise ValueError(f"Не удалось распарсить HTML: {e}")
 
+    # ─────────────────────────────────────────────────────────────────────────
+    # ПРОФИЛЬ ТЕМЫ
+    # ─────────────────────────────────────────────────────────────────────────
+
+    def _profile_key(self) -> Optional[Tuple[str, str]]:
+        if self.profile_cache is None or self.body is None:
+            return None
+        if self.template is not None:
+            return TEMPLATE_PROFILE_DOMAIN, self.template
+        if self._fingerprint is None:
+            self._fingerprint = body_fingerprint(self.body)
+        return self.domain or '', self._fingerprint
+
+    def _from_profile(self, slot: str, is_valid) -> Optional[HtmlElement]:
+        """Элемент по XPath из профиля темы, если он проходит проверку."""
+        key = self._profile_key()
+        if key is None:
+            return None
+
+        xpath = self.profile_cache.get(*key, slot)
+        if xpath is None:
+            self.profile_cache.misses += 1
+            return None
+
+        try:
+            results = compile_xpath(xpath)(self.body)
+        except Exception:
+            results = []
+
+        if results and isinstance(results[0], HtmlElement) and is_valid(results[0]):
+            self.profile_cache.hits += 1
+            logger.debug(f"Профиль темы ({slot}): {xpath}")
+            return results[0]
+
+        self.profile_cache.misses += 1
+        self.profile_cache.forget(*key, slot)
+        return None
+
+    def _learn_profile(self, slot: str, xpath: str):
+        key = self._profile_key()
+        if key is not None:
+            self.profile_cache.learn(*key, slot, xpath)
+
     def detect_page_type(self) -> PageType:
         """
         Определяет тип WordPress страницы по body-классам и структуре.
@@ -412,18 +384,9 @@ class ContentEngine:
         # === 2. Проверка по структуре (fallback) ===
 
         # Ищем характерные элементы категорий
-        category_structure_xpaths = [
-            "//section[contains(@class, 'archive-title')]",
-            "//section[contains(@class, 'category-title')]",
-            "//div[contains(@class, 'archive-title')]",
-            "//h1[contains(@class, 'page-heading')]",
-            "//div[contains(@class, 'listing-grid')]",
-            "//div[contains(@class, 'jeg_posts')]",
-        ]
-
-        for xpath in category_structure_xpaths:
+        for xpath, compiled in COMPILED_CATEGORY_STRUCTURE:
             try:
-                if self.body.xpath(xpath):
+                if compiled(self.body):
                     self.page_type = PageType.CATEGORY
                     logger.debug(f"Тип страницы: CATEGORY (по структуре: {xpath})")
                     return self.page_type
@@ -431,14 +394,14 @@ class ContentEngine:
                 continue
 
         # Проверяем количество article элементов (признак листинга)
-        articles = self.body.xpath('//article[contains(@class, "listing-item") or contains(@class, "type-post")]')
+        articles = LISTING_ARTICLES(self.body)
         if len(articles) >= 2:
             self.page_type = PageType.CATEGORY
             logger.debug(f"Тип страницы: CATEGORY (найдено {len(articles)} article-элементов)")
             return self.page_type
 
         # Проверяем наличие одного article с контентом (признак поста)
-        single_article = self.body.xpath('//article[.//div[contains(@class, "entry-content") or contains(@class, "post-content")]]')
+        single_article = SINGLE_ARTICLE(self.body)
         if single_article:
             self.page_type = PageType.POST
             logger.debug(f"Тип страницы: POST (по структуре article)")
@@ -454,14 +417,20 @@ class ContentEngine:
         if self.body is None:
             return None
 
-        for xpath in CONTENT_XPATHS:
+        container = self._from_profile('content', self._is_valid_container)
+        if container is not None:
+            self.container = container
+            return container
+
+        for xpath, compiled in COMPILED_CONTENT:
             try:
-                results = self.body.xpath(xpath)
+                results = compiled(self.body)
                 if results:
                     container = results[0]
                     if self._is_valid_container(container):
                         logger.debug(f"Контейнер найден: {xpath}")
                         self.container = container
+                        self._learn_profile('content', xpath)
                         return container
             except Exception as e:
                 logger.debug(f"XPath error {xpath}: {e}")
@@ -471,6 +440,7 @@ class ContentEngine:
         container = self._find_by_text_density()
         if container is not None:
             self.container = container
+            self._learn_profile('content', element_locator(container))
             return container
 
         logger.warning("Контейнер контента не найден!")
@@ -482,7 +452,7 @@ class ContentEngine:
             return False
 
         # Должно быть минимум 2 параграфа
-        p_tags = elem.xpath('.//p')
+        p_tags = DESCENDANT_P(elem)
         if len(p_tags) < 2:
             return False
 
@@ -500,13 +470,58 @@ class ContentEngine:
         return True
 
     def _find_by_text_density(self) -> Optional[HtmlElement]:
-        """Находит контейнер по плотности текста."""
+        """
+        Находит контейнер по плотности текста.
+
+        Один проход снизу вверх: каждый узел получает сумму числа <p> и длины
+        их текста от детей, поэтому вложенные контейнеры не пересчитывают
+        одни и те же параграфы. Оценка прежняя — длина текста / (глубина + 1),
+        при равенстве побеждает первый по документу.
+        """
         if self.body is None:
             return None
 
-        candidates = []
+        # Прямой обход: индексы, родители, глубина
+        nodes: List[HtmlElement] = []
+        parents: List[int] = []
+        depths: List[int] = []
+        index: Dict[HtmlElement, int] = {}
+        base_depth = len(list(self.body.iterancestors()))
+
+        for elem in self.body.iter():
+            if not isinstance(elem.tag, str):
+                continue
+            i = len(nodes)
+            index[elem] = i
+            nodes.append(elem)
+            if i == 0:
+                parents.append(-1)
+                depths.append(base_depth)
+            else:
+                parent = index[elem.getparent()]
+                parents.append(parent)
+                depths.append(depths[parent] + 1)
+
+        # Обратный обход: потомки раньше предков
+        p_counts = [0] * len(nodes)
+        text_lens = [0] * len(nodes)
+        for i in range(len(nodes) - 1, 0, -1):
+            if nodes[i].tag == 'p':
+                p_counts[i] += 1
+                text_lens[i] += len(nodes[i].text_content() or '')
+            parent = parents[i]
+            p_counts[parent] += p_counts[i]
+            text_lens[parent] += text_lens[i]
+
+        best = None
+        best_score = 0.0
+        for i in range(1, len(nodes)):
+            elem = nodes[i]
+            if elem.tag not in DENSITY_CONTAINER_TAGS:
+                continue
+            if p_counts[i] < 2 or text_lens[i] <= 300:
+                continue
 
-        for elem in self.body.xpath('.//div | .//article | .//section | .//main'):
             classes = (elem.get('class') or '').lower()
             elem_id = (elem.get('id') or '').lower()
             combined = classes + ' ' + elem_id
@@ -515,20 +530,13 @@ class ContentEngine:
             if any(bad in combined for bad in PRESERVE_CLASSES):
                 continue
 
-            p_tags = elem.xpath('.//p')
-            if len(p_tags) >= 2:
-                text_len = sum(len(p.text_content() or '') for p in p_tags)
-                if text_len > 300:
-                    # Глубина вложенности как штраф
-                    depth = len(list(elem.iterancestors()))
-                    score = text_len / (depth + 1)
-                    candidates.append((elem, score))
-
-        if candidates:
-            candidates.sort(key=lambda x: x[1], reverse=True)
-            return candidates[0][0]
+            # Глубина вложенности как штраф
+            score = text_lens[i] / (depths[i] + 1)
+            if best is None or score > best_score:
+                best = elem
+                best_score = score
 
-        return None
+        return best
 
     # ─────────────────────────────────────────────────────────────────────────
     # МЕТОДЫ ДЛЯ КАТЕГОРИЙ/АРХИВОВ (v4.0)
@@ -544,17 +552,22 @@ class ContentEngine:
         if self.body is None:
             return None
 
+        container = self._from_profile('listing', self._is_listing_container)
+        if container is not None:
+            self.listing_container = container
+            return container
+
         # Пробуем XPath селекторы
-        for xpath in CATEGORY_LISTING_XPATHS:
+        for xpath, compiled in COMPILED_CATEGORY_LISTING:
             try:
-                results = self.body.xpath(xpath)
+                results = compiled(self.body)
                 if results:
                     container = results[0]
                     # Проверяем что это действительно листинг (есть articles)
-                    articles = container.xpath('.//article | ./article')
-                    if articles or 'listing' in (container.get('class') or '').lower():
+                    if self._is_listing_container(container):
                         logger.debug(f"Листинг категории найден: {xpath}")
                         self.listing_container = container
+                        self._learn_profile('listing', xpath)
                         return container
             except Exception as e:
                 logger.debug(f"XPath error {xpath}: {e}")
@@ -582,11 +595,21 @@ class ContentEngine:
         if best_container is not None and max_articles >= 2:
             logger.debug(f"Листинг найден по количеству articles: {max_articles}")
             self.listing_container = best_container
+            self._learn_profile('listing', element_locator(best_container))
             return best_container
 
         logger.warning("Контейнер листинга категории не найден!")
         return None
 
+    def _is_listing_container(self, container: HtmlElement) -> bool:
+        """Листинг: внутри есть article или класс содержит 'listing'."""
+        articles = DESCENDANT_ARTICLES(container)
+        return bool(articles) or 'listing' in (container.get('class') or '').lower()
+
+    @staticmethod
+    def _is_h1(elem: HtmlElement) -> bool:
+        return elem.tag == 'h1'
+
     def find_category_h1(self) -> Optional[HtmlElement]:
         """
         Находит H1 заголовок категории/архива.
@@ -597,13 +620,19 @@ class ContentEngine:
         if self.body is None:
             return None
 
+        h1 = self._from_profile('category_h1', self._is_h1)
+        if h1 is not None:
+            self.h1_element = h1
+            return h1
+
         # Сначала пробуем специфичные селекторы для категорий
-        for xpath in CATEGORY_HEADER_XPATHS:
+        for xpath, compiled in COMPILED_CATEGORY_HEADER:
             try:
-                results = self.body.xpath(xpath)
+                results = compiled(self.body)
                 if results:
                     self.h1_element = results[0]
                     logger.debug(f"H1 категории найден: {xpath}")
+                    self._learn_profile('category_h1', xpath)
                     return self.h1_element
             except Exception:
                 continue
@@ -745,12 +774,18 @@ class ContentEngine:
         if self.body is None:
             return None
 
-        for xpath in HEADER_XPATHS:
+        h1 = self._from_profile('h1', self._is_h1)
+        if h1 is not None:
+            self.h1_element = h1
+            return h1
+
+        for xpath, compiled in COMPILED_HEADER:
             try:
-                results = self.body.xpath(xpath)
+                results = compiled(self.body)
                 if results:
                     self.h1_element = results[0]
                     logger.debug(f"H1 найден: {xpath}")
+                    self._learn_profile('h1', xpath)
                     return self.h1_element
             except Exception:
                 continue
@@ -982,15 +1017,25 @@ class ContentEngine:
         """
         Собирает финальный HTML.
         КРИТИЧНО: Использует ОРИГИНАЛЬНЫЙ head!
+
+        Если <body> найден в исходнике, заменяется только его диапазон:
+        DOCTYPE, <html> с атрибутами, head и хвост документа остаются как были.
         """
         # Получаем body как строку
         body_html = tostring(
             self.body,
             encoding='unicode',
-            method='html'
+            method='html',
+            with_tail=False
         )
 
-        # Собираем полный HTML
+        span = self._body_span if self.body.tag == 'body' else None
+        if span is not None:
+            start, end = span
+            result = self.original_html[:start] + body_html + self.original_html[end:]
+            return result.replace("\r\n", "\n").replace("\r", "\n")
+
+        # Fallback: собираем полный HTML
         result = f"""{self._doctype}
         <html>
         {self._head_html}
@@ -1008,18 +1053,23 @@ class ContentEngine:
 # ПУБЛИЧНЫЕ ФУНКЦИИ
 # ─────────────────────────────────────────────────────────────────────────────
 
-def replace_content(old_html: str, new_html: str) -> str:
+def replace_content(old_html: str,
+                    new_html: str,
+                    domain: Optional[str] = None,
+                    template: Optional[str] = None) -> str:
     """
     Основная функция замены контента.
 
     Args:
         old_html: Исходный HTML страницы
         new_html: Новый контент (h1 + p + h2 + ul + etc.)
+        domain: Домен/сайт страницы — включает кэш профилей темы
+        template: id шаблона (template_clusters.py) — профиль на шаблон
 
     Returns:
         Полный HTML с заменённым контентом и НЕТРОНУТЫМ head
     """
-    engine = ContentEngine(old_html)
+    engine = ContentEngine(old_html, domain=domain, template=template)
     return engine.replace_content(new_html)
 
 
@@ -1037,23 +1087,58 @@ def detect_page_type_from_html(html_content: str) -> PageType:
     return engine.detect_page_type()
 
 
-def smart_replace_content(old_html: str, new_html: str) -> str:
+def smart_replace_content(old_html: str, new_html: str, domain: Optional[str] = None,
+                          template: Optional[str] = None) -> str:
     """Алиас для совместимости."""
-    return replace_content(old_html, new_html)
+    return replace_content(old_html, new_html, domain=domain, template=template)
 
 
-def universal_replace_content(old_html: str, new_html: str, force_full_replace: bool = False) -> str:
+def universal_replace_content(old_html: str,
+                              new_html: str,
+                              force_full_replace: bool = False,
+                              domain: Optional[str] = None,
+                              template: Optional[str] = None) -> str:
     """Алиас для совместимости с content_replacer.py"""
-    return replace_content(old_html, new_html)
+    return replace_content(old_html, new_html, domain=domain, template=template)
 
 
-def analyze_page_structure(html_content: str) -> Dict[str, Any]:
+def replace_content_file(html_path: str,
+                         content_path: str,
+                         domain: Optional[str] = None,
+                         template: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Замена контента для пары файлов (HTML страницы + txt с новым контентом).
+
+    Только чтение и вычисление — файл не записывается, поэтому функцию
+    можно выполнять в пуле процессов, а запись оставить одному потоку.
+
+    Returns:
+        (новый HTML с нормализованными переводами строк, кодировка исходника)
+
+    Raises:
+        ValueError: структура страницы не распознана
+    """
+    with open(html_path, "rb") as f:
+        raw = f.read()
+    encoding = chardet.detect(raw).get("encoding") or "utf-8"
+    old_html = raw.decode(encoding, errors="replace")
+
+    with open(content_path, "r", encoding="utf-8", errors="replace") as f:
+        new_content = f.read()
+
+    new_html = replace_content(old_html, new_content, domain=domain, template=template)
+    return new_html.replace("\r\n", "\n").replace("\r", "\n"), encoding
+
+
+def analyze_page_structure(html_content: str,
+                           domain: Optional[str] = None,
+                           template: Optional[str] = None) -> Dict[str, Any]:
     """
     Анализирует структуру страницы для отладки.
 
     v4.0: Добавлена информация о типе страницы и листинге категорий.
     """
-    engine = ContentEngine(html_content)
+    engine = ContentEngine(html_content, domain=domain, template=template)
 
     # Определяем тип страницы
     page_type = engine.detect_page_type()
@@ -11,6 +11,10 @@ import json
 import chardet
 import logging
 import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 from typing import Dict, List, Tuple
 
@@ -33,6 +37,12 @@ from content_engine import (
     replace_content, smart_replace_content, analyze_page_structure,
     detect_page_type_from_html, PageType
 )
+from generation_cache import (
+    GenerationCache, generation_key, CACHE_USE, CACHE_FORCE, CACHE_BYPASS
+)
+from generation_queue import GenerationQueue, new_batch_id
+from near_duplicates import NearDuplicateIndex, fragment_text, signature
+from template_clusters import TEMPLATE_INDEX_FILE, site_template_index
 
 logging.basicConfig(
     level=logging.INFO,
@@ -41,6 +51,9 @@ logging.basicConfig(
 )
 log = logging.getLogger(__name__)
 
+# Ответ завершён целиком: сервер закончил сам или дошёл до stop_marker
+CACHEABLE_FINISH = ("stop", "marker")
+
 
 class PromptManager:
     def __init__(self, json_path="assets/prompts.json"):
@@ -63,12 +76,42 @@ class BatchGenThread(QThread):
     """
     Поток для пакетной генерации.
     ВАЖНО: если random_mode=True, выбирает НОВЫЙ промпт для КАЖДОЙ статьи!
+
+    concurrency > 1: до concurrency запросов к LM Studio выполняются
+    одновременно (занимают параллельные слоты сервера), а замена и запись
+    HTML делаются в этом потоке по мере готовности ответов.
+
+    Генерация потоковая (stream_text): прогресс по строкам идёт сигналом
+    progress, cancel() обрывает текущие генерации и освобождает слоты.
+
+    cache (GenerationCache): ответы на тот же промпт с той же моделью
+    и параметрами берутся с диска; cache_mode — CACHE_USE / CACHE_FORCE /
+    CACHE_BYPASS.
+
+    queue (GenerationQueue): строки пакета — задачи в SQLite. Незавершённые
+    задачи файла продолжаются со своим промптом, ошибки LM Studio
+    повторяются с задержкой, после падения пакет можно продолжить.
+    Без queue используется очередь в памяти.
+
+    dedup (NearDuplicateIndex): каждый ответ сверяется по MinHash со всеми
+    статьями индекса; почти дубль перегенерируется (мимо кэша), а после
+    исчерпания попыток записывается с пометкой.
+
+    Замена идёт с template= из индекса шаблонов сайта (template_clusters.py):
+    страницы одного шаблона делят профиль темы.
     """
     finishedOne = pyqtSignal(int, str)
     finishedAll = pyqtSignal()
+    progress = pyqtSignal(int, int, float)  # row, символов, tok/s
+    queueStats = pyqtSignal(object)         # GenerationQueue.stats()
+
+    # Не чаще одного сигнала progress на строку за это время (сек)
+    PROGRESS_INTERVAL = 0.5
 
     def __init__(self, rows_info, prompts_list, chosen_prompt_idx, random_mode,
-                 global_keywords, density, lm_studio, content_dir, parent=None):
+                 global_keywords, density, lm_studio, content_dir, concurrency=1,
+                 max_chars=None, stop_marker=None, cache=None, cache_mode=CACHE_USE,
+                 queue=None, dedup=None, parent=None):
         super().__init__(parent)
         self.rows_info = rows_info
         self.prompts_list = prompts_list          # Весь список промптов
@@ -78,82 +121,280 @@ class BatchGenThread(QThread):
         self.density = density
         self.lm_studio = lm_studio
         self.content_dir = content_dir
-
-    def run(self):
+        self.concurrency = max(1, concurrency)    # Одновременных запросов к LM Studio
+        self.max_chars = max_chars                # Досрочная остановка генерации
+        self.stop_marker = stop_marker
+        self.cache = cache if cache_mode != CACHE_BYPASS else None
+        self.cache_mode = cache_mode
+        self.queue = queue if queue is not None else GenerationQueue(":memory:")
+        self.batch_id = new_batch_id()
+        self.dedup = dedup
+        self.templates = None
+        self._row_of = {file_: row for (row, file_, *_rest) in rows_info}
+        self._fields_of = {file_: rest for (row, file_, *rest) in rows_info}
+        self._cancel = threading.Event()
+        self._streams = set()                     # Открытые GenerationStream
+        self._streams_lock = threading.Lock()
+
+    def cancel(self):
+        """Останавливает пакет: новые запросы не уходят, текущие обрываются."""
+        self._cancel.set()
+        with self._streams_lock:
+            streams = list(self._streams)
+        for stream in streams:
+            stream.cancel()
+
+    def _build_prompt(self, file_, title_, desc_, local_kw) -> str:
+        # ---- ВЫБОР ПРОМПТА (для каждой статьи!) ----
+        if self.random_mode and len(self.prompts_list) > 1:
+            # РАНДОМ для каждой статьи!
+            prompt_template = random.choice(self.prompts_list)
+            log.info(f"[RANDOM] Выбран промпт #{self.prompts_list.index(prompt_template)+1} для {file_}")
+        else:
+            prompt_template = self.prompts_list[self.chosen_prompt_idx]
+
+        # ---- ПОДСТАНОВКА ПЕРЕМЕННЫХ ----
+        keys = [*self.global_keywords,
+                *[k.strip() for k in local_kw.split(",") if k.strip()]]
+
+        return (prompt_template
+                .replace("{title}", title_)
+                .replace("{description}", desc_)
+                .replace("{keywords}", ", ".join(keys) if keys else "extract from title")
+                .replace("{density}", f"{self.density}%"))
+
+    def _fresh_prompt(self, file_, previous):
+        """
+        Промпт для перегенерации дубля: в режиме рандома — другой шаблон
+        (если он есть), иначе тот же промпт собирается заново.
+        """
+        prompt = self._build_prompt(file_, *self._fields_of[file_])
+        if self.random_mode:
+            for _ in range(2 * len(self.prompts_list)):
+                if prompt != previous:
+                    break
+                prompt = self._build_prompt(file_, *self._fields_of[file_])
+        return prompt
+
+    def _enqueue(self):
+        """Ставит строки в очередь; незавершённые задачи сохраняют свой промпт."""
+        unfinished = set(self.queue.unfinished_files(str(self.content_dir)))
+        jobs = []
         for (row, file_, title_, desc_, local_kw) in self.rows_info:
             try:
-                path = Path(self.content_dir, file_)
-
-                # ---- ВЫБОР ПРОМПТА (для каждой статьи!) ----
-                if self.random_mode and len(self.prompts_list) > 1:
-                    # РАНДОМ для каждой статьи!
-                    prompt_template = random.choice(self.prompts_list)
-                    log.info(f"[RANDOM] Выбран промпт #{self.prompts_list.index(prompt_template)+1} для {file_}")
-                else:
-                    prompt_template = self.prompts_list[self.chosen_prompt_idx]
-
-                # ---- ПОДСТАНОВКА ПЕРЕМЕННЫХ ----
-                keys = [*self.global_keywords,
-                        *[k.strip() for k in local_kw.split(",") if k.strip()]]
-
-                prompt = (prompt_template
-                          .replace("{title}", title_)
-                          .replace("{description}", desc_)
-                          .replace("{keywords}", ", ".join(keys) if keys else "extract from title")
-                          .replace("{density}", f"{self.density}%"))
-
-                # ---- ГЕНЕРАЦИЯ ----
-                gen = self.lm_studio.generate_text(prompt)
-                if gen.startswith("<e>"):
-                    self.finishedOne.emit(row, f"[LM ERROR] {gen}")
-                    continue
-
-                # ---- ЧТЕНИЕ HTML ----
-                raw = path.read_bytes()
-                enc = chardet.detect(raw).get("encoding") or "utf-8"
-                old_html = raw.decode(enc, "replace")
+                prompt = "" if file_ in unfinished else self._build_prompt(file_, title_, desc_, local_kw)
+            except Exception as e:
+                self.finishedOne.emit(row, f"[FAIL] {file_}: {e}")
+                continue
+            jobs.append((file_, prompt))
+        self.queue.enqueue(self.batch_id, str(self.content_dir), jobs)
 
-                # ---- ЗАМЕНА (единый движок) ----
-                try:
-                    new_html = smart_replace_content(old_html, gen)
-                except ValueError as ve:
-                    self.finishedOne.emit(row, f"[STRUCTURE ERROR] {file_}: {ve}")
-                    continue
-                except Exception as e:
-                    self.finishedOne.emit(row, f"[REPLACE ERROR] {file_}: {e}")
+    def run(self):
+        self.templates = site_template_index([str(self.content_dir)],
+                                             os.path.join(str(self.content_dir), TEMPLATE_INDEX_FILE),
+                                             workers=os.cpu_count() or 1,
+                                             batch_size=len(self.rows_info))
+        if self.dedup is not None:
+            updated = self.dedup.refresh_dir(str(self.content_dir))
+            log.info(f"Индекс дублей: {len(self.dedup)} статей, пересчитано {updated}")
+        self._enqueue()
+        self.queueStats.emit(self.queue.stats(self.batch_id))
+
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while True:
+                # Окно = числу слотов: новые запросы уходят по мере освобождения
+                while len(in_flight) < self.concurrency and not self._cancel.is_set():
+                    job = self.queue.claim(self.batch_id)
+                    if job is None:
+                        break
+                    row = self._row_of[job.file]
+                    in_flight[pool.submit(self._generate, row, job.prompt)] = (row, job)
+
+                if not in_flight:
+                    # Остались только задачи, ждущие повтора
+                    delay = None if self._cancel.is_set() else self.queue.next_due_in(self.batch_id)
+                    if delay is None:
+                        break
+                    self._cancel.wait(min(delay, 1.0))
                     continue
 
-                # ---- НОРМАЛИЗАЦИЯ КОДИРОВКИ ----
-                # LM Studio генерирует UTF-8 с Unicode-символами (умные кавычки, тире)
-                # Всегда записываем в UTF-8 и обновляем meta charset
-                normalized_html = new_html.replace("\r\n", "\n").replace("\r", "\n")
-
-                # Обновляем meta charset на UTF-8 если он другой
-                import re
-                normalized_html = re.sub(
-                    r'<meta\s+charset=["\']?[^"\'>\s]+["\']?\s*/?>',
-                    '<meta charset="UTF-8">',
-                    normalized_html,
-                    flags=re.IGNORECASE
-                )
-                normalized_html = re.sub(
-                    r'<meta\s+http-equiv=["\']?Content-Type["\']?\s+content=["\']?[^"\']+["\']?\s*/?>',
-                    '<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">',
-                    normalized_html,
-                    flags=re.IGNORECASE
-                )
+                # Таймаут — чтобы подошедшие повторы занимали свободные слоты
+                done, _ = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    row, job = in_flight.pop(future)
+                    self._apply(row, job, future.result)
+                    self.queueStats.emit(self.queue.stats(self.batch_id))
 
-                # ---- ЗАПИСЬ (всегда UTF-8) ----
-                with open(path, "w", encoding="utf-8", newline="\n") as f:
-                    f.write(normalized_html)
-
-                self.finishedOne.emit(row, f"[OK] {file_}")
+        if self.dedup is not None:
+            self.dedup.save()
+        self.finishedAll.emit()
 
+    def _models(self) -> list:
+        """Модели, которые могут ответить (в пуле у серверов они бывают разные)."""
+        return getattr(self.lm_studio, "models", None) or [self.lm_studio.model_name]
+
+    def _cache_key(self, prompt, model):
+        params = dict(getattr(self.lm_studio, "params", {}) or {})
+        if self.max_chars is not None:
+            params["_max_chars"] = self.max_chars
+        if self.stop_marker is not None:
+            params["_stop_marker"] = self.stop_marker
+        return generation_key(model, prompt, params)
+
+    def _generate(self, row, prompt):
+        """
+        Генерация одной статьи (в пуле потоков), с учётом кэша.
+
+        Ключ кэша — по модели, которая реально ответила; при чтении
+        проверяются все модели пула.
+
+        Returns:
+            (текст, статистика) — текст None при отмене, "<ERROR>..." при ошибке
+        """
+        if self.cache is not None and self.cache_mode == CACHE_USE:
+            for model in self._models():
+                cached = self.cache.get(self._cache_key(prompt, model))
+                if cached is not None:
+                    return cached, "из кэша"
+
+        text, info, model, finish_reason = self._generate_uncached(row, prompt)
+        # Кэшируется только полный ответ: обрыв, ошибка или пустой текст — нет
+        if self.cache is not None and text and finish_reason in CACHEABLE_FINISH:
+            self.cache.put(self._cache_key(prompt, model), text, meta={"model": model})
+        return text, info
+
+    def _generate_uncached(self, row, prompt):
+        """(текст, статистика, модель, которая ответила, finish_reason)."""
+        if not hasattr(self.lm_studio, "stream_text"):
+            text = self.lm_studio.generate_text(prompt)
+            finish_reason = "error" if text.startswith("<ERROR>") else "stop"
+            return text, "", self.lm_studio.model_name, finish_reason
 
+        try:
+            stream = self.lm_studio.stream_text(
+                prompt, max_chars=self.max_chars, stop_marker=self.stop_marker,
+                cancel_event=self._cancel,
+            )
+        except Exception as e:
+            return f"<ERROR>LM Studio error: {e}", "", None, "error"
+
+        with self._streams_lock:
+            self._streams.add(stream)
+        if self._cancel.is_set():
+            stream.cancel()  # cancel() пришёл, пока поток открывался
+        last_emit = 0.0
+        try:
+            for _ in stream:
+                now = time.monotonic()
+                if now - last_emit >= self.PROGRESS_INTERVAL:
+                    self.progress.emit(row, len(stream.text), stream.tokens_per_sec)
+                    last_emit = now
+        finally:
+            with self._streams_lock:
+                self._streams.discard(stream)
+
+        model = stream.model or self.lm_studio.model_name
+        if stream.finish_reason == "cancelled":
+            return None, "", model, stream.finish_reason
+        if stream.finish_reason == "error":
+            return f"<ERROR>LM Studio error: {stream.error}", "", model, stream.finish_reason
+        return (stream.text, f"{stream.tokens} ток., {stream.tokens_per_sec:.1f} tok/s",
+                model, stream.finish_reason)
+
+    def _apply(self, row, job, get_result):
+        """Замена контента и запись одной страницы (только в этом потоке)."""
+        file_ = job.file
+        try:
+            path = Path(self.content_dir, file_)
+
+            gen, info = get_result()
+            if gen is None:
+                self.queue.release(job.id)
+                self.finishedOne.emit(row, f"[CANCELLED] {file_}")
+                return
+            if gen.startswith("<ERROR>"):
+                # Сбой сервера обычно временный — повтор через backoff
+                delay = self.queue.fail(job.id, gen, retry=True)
+                if delay is not None:
+                    self.finishedOne.emit(
+                        row, f"[RETRY] {file_}: {gen} — попытка {job.attempts + 1} "
+                             f"из {self.queue.max_attempts} через {delay:.0f} с")
+                else:
+                    self.finishedOne.emit(row, f"[LM ERROR] {gen}")
+                return
+
+            # ---- ПРОВЕРКА НА ДУБЛИ ----
+            fingerprint = None
+            if self.dedup is not None:
+                fingerprint = signature(fragment_text(gen))
+                match = self.dedup.find(fingerprint, exclude=str(path.resolve()))
+                if match is not None:
+                    other, score = match
+                    note = f"{score:.0%} совпадения с {other}"
+                    if job.attempts < self.queue.max_attempts:
+                        if self.cache is not None:
+                            for model in self._models():
+                                self.cache.discard(self._cache_key(job.prompt, model))
+                        self.queue.fail(job.id, f"near-duplicate: {note}", retry=True, delay=0,
+                                        prompt=self._fresh_prompt(file_, job.prompt))
+                        self.finishedOne.emit(
+                            row, f"[DUPLICATE] {file_}: {note} — перегенерация "
+                                 f"(попытка {job.attempts + 1} из {self.queue.max_attempts})")
+                        return
+                    info = f"{info}, " if info else ""
+                    info += f"⚠ дубль: {note}"
+
+            # ---- ЧТЕНИЕ HTML ----
+            raw = path.read_bytes()
+            enc = chardet.detect(raw).get("encoding") or "utf-8"
+            old_html = raw.decode(enc, "replace")
+
+            # ---- ЗАМЕНА (единый движок) ----
+            try:
+                template = self.templates.template_of(str(path)) if self.templates is not None else None
+                new_html = smart_replace_content(old_html, gen, domain=str(self.content_dir),
+                                                 template=template)
+            except ValueError as ve:
+                self.queue.fail(job.id, str(ve), retry=False)
+                self.finishedOne.emit(row, f"[STRUCTURE ERROR] {file_}: {ve}")
+                return
             except Exception as e:
-                self.finishedOne.emit(row, f"[FAIL] {file_}: {e}")
-
-        self.finishedAll.emit()
+                self.queue.fail(job.id, str(e), retry=False)
+                self.finishedOne.emit(row, f"[REPLACE ERROR] {file_}: {e}")
+                return
+
+            # ---- НОРМАЛИЗАЦИЯ КОДИРОВКИ ----
+            # LM Studio генерирует UTF-8 с Unicode-символами (умные кавычки, тире)
+            # Всегда записываем в UTF-8 и обновляем meta charset
+            normalized_html = new_html.replace("\r\n", "\n").replace("\r", "\n")
+
+            # Обновляем meta charset на UTF-8 если он другой
+            normalized_html = re.sub(
+                r'<meta\s+charset=["\']?[^"\'>\s]+["\']?\s*/?>',
+                '<meta charset="UTF-8">',
+                normalized_html,
+                flags=re.IGNORECASE
+            )
+            normalized_html = re.sub(
+                r'<meta\s+http-equiv=["\']?Content-Type["\']?\s+content=["\']?[^"\']+["\']?\s*/?>',
+                '<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">',
+                normalized_html,
+                flags=re.IGNORECASE
+            )
+
+            # ---- ЗАПИСЬ (всегда UTF-8) ----
+            with open(path, "w", encoding="utf-8", newline="\n") as f:
+                f.write(normalized_html)
+
+            if fingerprint is not None:
+                self.dedup.add(str(path.resolve()), fingerprint)
+            self.queue.complete(job.id, info)
+            self.finishedOne.emit(row, f"[OK] {file_}" + (f" ({info})" if info else ""))
+
+        except Exception as e:
+            self.queue.fail(job.id, str(e), retry=False)
+            self.finishedOne.emit(row, f"[FAIL] {file_}: {e}")
 
 
 class ContentRewriteDialog(QDialog):
@@ -170,9 +411,16 @@ class ContentRewriteDialog(QDialog):
         self.prompt_mgr = prompt_mgr
         self.content_dir = content_dir
         self.batch_thread = None
+        self.generation_cache = GenerationCache()
+        self._cache_snapshot = (0, 0)
+        self.job_queue = GenerationQueue()
+        self.job_queue.recover()
+        self.dedup_index = None
 
         self._init_ui()
         self._populate_file_table()
+        self._update_cache_label()
+        self._restore_unfinished_jobs()
 
     def _init_ui(self):
         layout = QVBoxLayout(self)
@@ -217,9 +465,64 @@ class ContentRewriteDialog(QDialog):
         self.density_spin.setRange(1, 10)
         self.density_spin.setValue(3)
         density_row.addWidget(self.density_spin)
+
+        density_row.addWidget(QLabel("Параллельных запросов:"))
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, 16)
+        self.concurrency_spin.setValue(4)
+        self.concurrency_spin.setToolTip(
+            "Сколько статей генерируется одновременно.\n"
+            "Ставьте не больше числа параллельных слотов сервера LM Studio —\n"
+            "лишние запросы просто ждут в очереди сервера."
+        )
+        density_row.addWidget(self.concurrency_spin)
         density_row.addStretch()
         layout.addLayout(density_row)
 
+        # ─── Кэш генераций ───
+        cache_row = QHBoxLayout()
+        cache_row.addWidget(QLabel("Кэш генераций:"))
+        self.cache_combo = QComboBox()
+        self.cache_combo.addItem("Использовать", CACHE_USE)
+        self.cache_combo.addItem("Перегенерировать (обновить кэш)", CACHE_FORCE)
+        self.cache_combo.addItem("Без кэша", CACHE_BYPASS)
+        self.cache_combo.setToolTip(
+            "Тот же промпт + модель + параметры → готовый текст с диска.\n"
+            "Полезно при повторном запуске после ошибок структуры или сбоя."
+        )
+        cache_row.addWidget(self.cache_combo)
+        self.cache_label = QLabel("")
+        self.cache_label.setStyleSheet("color: #888; font-size: 11px;")
+        cache_row.addWidget(self.cache_label)
+        self.cache_clear_btn = QPushButton("Очистить кэш")
+        self.cache_clear_btn.clicked.connect(self._clear_generation_cache)
+        cache_row.addWidget(self.cache_clear_btn)
+        cache_row.addStretch()
+        layout.addLayout(cache_row)
+
+        # ─── Очередь задач ───
+        queue_row = QHBoxLayout()
+        self.queue_label = QLabel("Очередь: —")
+        self.queue_label.setStyleSheet("color: #888; font-size: 11px;")
+        queue_row.addWidget(self.queue_label)
+        self.queue_discard_btn = QPushButton("Сбросить незавершённые")
+        self.queue_discard_btn.setToolTip(
+            "Незавершённые задачи продолжаются со своим промптом.\n"
+            "Сброс — следующий запуск соберёт промпты заново."
+        )
+        self.queue_discard_btn.clicked.connect(self._discard_unfinished_jobs)
+        queue_row.addWidget(self.queue_discard_btn)
+        self.dedup_cb = QCheckBox("Проверять на дубли (MinHash)")
+        self.dedup_cb.setChecked(True)
+        self.dedup_cb.setToolTip(
+            "Каждая статья сверяется со всеми статьями всех сайтов.\n"
+            "Почти дубль генерируется заново; если попытки кончились —\n"
+            "статья записывается с пометкой ⚠ в логе."
+        )
+        queue_row.addWidget(self.dedup_cb)
+        queue_row.addStretch()
+        layout.addLayout(queue_row)
+
         # ─── Таблица файлов ───
         layout.addWidget(QLabel("Файлы для обработки:"))
         self.file_table = QTableWidget()
@@ -267,6 +570,11 @@ class ContentRewriteDialog(QDialog):
         self.generate_btn.clicked.connect(self.start_batch_generation)
         btn_row.addWidget(self.generate_btn)
 
+        self.stop_btn = QPushButton("⏹ Остановить")
+        self.stop_btn.setEnabled(False)
+        self.stop_btn.clicked.connect(self._stop_batch_generation)
+        btn_row.addWidget(self.stop_btn)
+
         layout.addLayout(btn_row)
 
         # ─── Лог ───
@@ -388,7 +696,7 @@ class ContentRewriteDialog(QDialog):
                 enc = chardet.detect(raw).get('encoding') or 'utf-8'
                 html_content = raw.decode(enc, errors='replace')
 
-                analysis = analyze_page_structure(html_content)
+                analysis = analyze_page_structure(html_content, domain=str(self.content_dir))
 
                 # Иконка типа страницы
                 type_icons = {
@@ -458,6 +766,7 @@ class ContentRewriteDialog(QDialog):
         self.log_edit.append(f"Запуск генерации для {len(selected)} файлов...\n")
 
         self.generate_btn.setEnabled(False)
+        self.stop_btn.setEnabled(True)
 
         # ПЕРЕДАЁМ ВЕСЬ СПИСОК ПРОМПТОВ + режим рандома
         self.batch_thread = BatchGenThread(
@@ -469,17 +778,81 @@ class ContentRewriteDialog(QDialog):
             density=self.density_spin.value(),
             lm_studio=self.lm_studio,
             content_dir=self.content_dir,
+            concurrency=self.concurrency_spin.value(),
+            cache=self.generation_cache,
+            cache_mode=self.cache_combo.currentData(),
+            queue=self.job_queue,
+            dedup=self._get_dedup_index() if self.dedup_cb.isChecked() else None,
         )
+        self._cache_snapshot = (self.generation_cache.hits, self.generation_cache.misses)
         self.batch_thread.finishedOne.connect(self._on_one_finished)
         self.batch_thread.finishedAll.connect(self._on_all_finished)
+        self.batch_thread.progress.connect(self._on_progress)
+        self.batch_thread.queueStats.connect(self._on_queue_stats)
         self.batch_thread.start()
 
+    def _stop_batch_generation(self):
+        if self.batch_thread is not None and self.batch_thread.isRunning():
+            self.stop_btn.setEnabled(False)
+            self.log_edit.append("⏹ Остановка — обрываю текущие генерации...")
+            self.batch_thread.cancel()
+
+    def _on_progress(self, row: int, chars: int, tokens_per_sec: float):
+        status_item = self.file_table.item(row, 5)
+        if status_item:
+            status_item.setText(f"⏳ {chars} симв. · {tokens_per_sec:.0f} tok/s")
+
+    def _on_queue_stats(self, stats: dict):
+        self.queue_label.setText(
+            f"Очередь: ожидают {stats['pending']} · в работе {stats['running']} · "
+            f"готово {stats['done']} · ошибок {stats['failed']} · "
+            f"{stats['per_minute']:.1f} статей/мин"
+        )
+
+    def _get_dedup_index(self):
+        if self.dedup_index is None:
+            self.dedup_index = NearDuplicateIndex()
+        return self.dedup_index
+
+    def _restore_unfinished_jobs(self):
+        """Отмечает файлы с незавершёнными задачами прошлого запуска."""
+        unfinished = set(self.job_queue.unfinished_files(str(self.content_dir)))
+        if not unfinished:
+            return
+        for i in range(self.file_table.rowCount()):
+            if self.file_table.item(i, 1).text() in unfinished:
+                self.file_table.item(i, 0).setCheckState(Qt.CheckState.Checked)
+                self.file_table.item(i, 5).setText("⏸ В очереди")
+        self.log_edit.append(
+            f"⏸ Незавершённых задач с прошлого запуска: {len(unfinished)} — "
+            f"файлы отмечены, нажмите «Генерировать», чтобы продолжить."
+        )
+
+    def _discard_unfinished_jobs(self):
+        if self.batch_thread is not None and self.batch_thread.isRunning():
+            return
+        removed = self.job_queue.discard(str(self.content_dir))
+        self.log_edit.append(f"Сброшено незавершённых задач: {removed}")
+        for i in range(self.file_table.rowCount()):
+            if self.file_table.item(i, 5).text() == "⏸ В очереди":
+                self.file_table.item(i, 5).setText("—")
+
     def _on_one_finished(self, row: int, msg: str):
         self.log_edit.append(msg)
 
         status_item = self.file_table.item(row, 5)
+        if msg.startswith("[CANCELLED]"):
+            # Строка не обработана — остаётся отмеченной для следующего запуска
+            status_item.setText("⏹ Отменено")
+            return
+        if msg.startswith("[RETRY]"):
+            status_item.setText("🔁 Повтор")
+            return
+        if msg.startswith("[DUPLICATE]"):
+            status_item.setText("♻ Дубль — заново")
+            return
         if "[OK]" in msg:
-            status_item.setText("✅ OK")
+            status_item.setText("⚠ OK, дубль" if "⚠ дубль" in msg else "✅ OK")
             for col in range(self.file_table.columnCount()):
                 item = self.file_table.item(row, col)
                 if item:
@@ -493,9 +866,35 @@ class ContentRewriteDialog(QDialog):
 
         self.file_table.item(row, 0).setCheckState(Qt.CheckState.Unchecked)
 
+    def _update_cache_label(self):
+        stats = self.generation_cache.stats()
+        self.cache_label.setText(
+            f"{stats['entries']} записей, {stats['bytes'] / (1024 * 1024):.1f} МБ · "
+            f"попаданий: {stats['hits']}, промахов: {stats['misses']}"
+        )
+
+    def _clear_generation_cache(self):
+        if self.batch_thread is not None and self.batch_thread.isRunning():
+            return
+        self.generation_cache.clear()
+        self._update_cache_label()
+
     def _on_all_finished(self):
         self.log_edit.append("\n✅ Пакетная генерация завершена!")
+        hits = self.generation_cache.hits - self._cache_snapshot[0]
+        misses = self.generation_cache.misses - self._cache_snapshot[1]
+        if hits or misses:
+            self.log_edit.append(f"💾 Кэш генераций: попаданий {hits}, промахов {misses}")
+        if hasattr(self.lm_studio, "stats"):
+            # Пул серверов: сколько статей и с какой скоростью сделал каждый
+            for st in self.lm_studio.stats():
+                self.log_edit.append(
+                    f"🖥 {st['host']}: готово {st['completed']}, ошибок {st['failed']}, "
+                    f"{st['chars_per_sec']:.0f} симв/с"
+                )
+        self._update_cache_label()
         self.generate_btn.setEnabled(True)
+        self.stop_btn.setEnabled(False)
         QMessageBox.information(self, "Готово", "Генерация контента завершена!")
 
 
@@ -9,23 +9,179 @@ import os
 import chardet
 import re
 import json  # Добавлено для работы с JSON-LD
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QLabel, QPushButton, QTextEdit, QFileDialog,
     QTableWidget, QTableWidgetItem, QAbstractItemView, QHBoxLayout, QMessageBox,
-    QProgressDialog, QComboBox
+    QProgressDialog, QComboBox, QProgressBar
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
 from bs4 import BeautifulSoup
 
 # Единый движок замены контента
 # Предполагается, что файл content_engine.py находится рядом
-from content_engine import universal_replace_content, analyze_page_structure
+from content_engine import analyze_page_structure, replace_content_file
+from structure_report import StructureReport, STATUSES, STATUS_LABELS
+from template_clusters import TEMPLATE_INDEX_FILE, site_template_index
 
 # Список таблеток/синонимов
 # Предполагается, что файл url_from_folder.py находится рядом
 from url_from_folder import KEYWORDS as URL_KEYWORDS
 
 
+class ReplaceWorker(QThread):
+    """
+    Фоновая замена контента.
+
+    Разбор и замена (ContentEngine) выполняются в пуле процессов,
+    а этот поток — единственный писатель: записывает HTML и переименовывает
+    txt в used_*. Результаты по строкам отправляются сигналом rowDone
+    по мере готовности. cancel() останавливает выдачу новых задач;
+    уже вычисленные, но не записанные результаты отбрасываются.
+
+    Страницы одного шаблона (template_clusters.py) делят профиль темы:
+    индекс шаблонов сайта загружается или строится в начале run().
+    """
+    rowDone = pyqtSignal(int, str, str, str)   # row, html_rel, status, message
+    finishedAll = pyqtSignal(int, int, bool)   # success, errors, cancelled
+
+    STATUS_OK = "ok"
+    STATUS_STRUCTURE = "structure"
+    STATUS_ERROR = "error"
+
+    def __init__(self, rows, content_dir, workers=None, parent=None):
+        """
+        Args:
+            rows: [(row, html_rel, txt_path), ...]
+            content_dir: Директория сайта (ключ кэша профилей тем)
+            workers: Размер пула процессов (по умолчанию — число CPU)
+        """
+        super().__init__(parent)
+        self.rows = rows
+        self.content_dir = content_dir
+        self.workers = workers or os.cpu_count() or 1
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        success_count = 0
+        error_count = 0
+
+        templates = site_template_index([self.content_dir],
+                                        os.path.join(self.content_dir, TEMPLATE_INDEX_FILE),
+                                        workers=self.workers, batch_size=len(self.rows))
+
+        def template_of(html_rel):
+            if templates is None:
+                return None
+            return templates.template_of(os.path.join(self.content_dir, html_rel))
+
+        def handle(row, html_rel, txt_path, compute):
+            nonlocal success_count, error_count
+            try:
+                new_html, enc = compute()
+                self._write(os.path.join(self.content_dir, html_rel), txt_path, new_html, enc)
+                success_count += 1
+                self.rowDone.emit(row, html_rel, self.STATUS_OK, "")
+            except ValueError as ve:
+                error_count += 1
+                self.rowDone.emit(row, html_rel, self.STATUS_STRUCTURE, str(ve))
+            except Exception as e:
+                error_count += 1
+                self.rowDone.emit(row, html_rel, self.STATUS_ERROR, str(e))
+
+        if self.workers <= 1 or len(self.rows) <= 1:
+            for row, html_rel, txt_path in self.rows:
+                if self._cancelled:
+                    break
+                html_full = os.path.join(self.content_dir, html_rel)
+                handle(row, html_rel, txt_path,
+                       lambda: replace_content_file(html_full, txt_path, self.content_dir,
+                                                    template=template_of(html_rel)))
+            self.finishedAll.emit(success_count, error_count, self._cancelled)
+            return
+
+        pending_rows = iter(self.rows)
+        in_flight = {}
+        # Ограниченное окно задач: быстрая отмена и умеренная память
+        window = self.workers * 2
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                while not self._cancelled and len(in_flight) < window:
+                    item = next(pending_rows, None)
+                    if item is None:
+                        break
+                    row, html_rel, txt_path = item
+                    future = pool.submit(replace_content_file,
+                                         os.path.join(self.content_dir, html_rel),
+                                         txt_path, self.content_dir, template_of(html_rel))
+                    in_flight[future] = item
+
+                if not in_flight or self._cancelled:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    row, html_rel, txt_path = in_flight.pop(future)
+                    if self._cancelled:
+                        continue
+                    handle(row, html_rel, txt_path, future.result)
+
+            for future in in_flight:
+                future.cancel()
+
+        self.finishedAll.emit(success_count, error_count, self._cancelled)
+
+    @staticmethod
+    def _write(html_full, txt_path, new_html, enc):
+        """Запись результата и переименование txt в used_* (только в этом потоке)."""
+        # Сохраняем без лишних пустых строк: фиксируем newline="\n"
+        with open(html_full, "w", encoding=enc, errors="replace", newline="\n") as f:
+            f.write(new_html)
+
+        dir_, base = os.path.split(txt_path)
+        used_name = os.path.join(dir_, "used_" + base)
+        os.rename(txt_path, used_name)
+
+
+class StructureReportWorker(QThread):
+    """
+    Фоновый отчёт по структуре всех страниц сайта (см. structure_report.py).
+
+    Разбор идёт в пуле процессов, результаты кэшируются по хешу файла,
+    поэтому повторный отчёт строится за секунды.
+    """
+    progress = pyqtSignal(int, int)            # done, total
+    finishedReport = pyqtSignal(object, bool)  # StructureReport, cancelled
+
+    def __init__(self, content_dir, workers=None, parent=None):
+        super().__init__(parent)
+        self.content_dir = content_dir
+        self.workers = workers or os.cpu_count() or 1
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        # Индекс шаблонов сохраняется рядом с сайтом — им пользуется и замена
+        templates = site_template_index([self.content_dir],
+                                        os.path.join(self.content_dir, TEMPLATE_INDEX_FILE),
+                                        workers=self.workers,
+                                        progress_callback=self.progress.emit)
+        if self._cancelled:
+            self.finishedReport.emit(StructureReport([self.content_dir]), True)
+            return
+        report = StructureReport([self.content_dir], templates=templates)
+        report.run(workers=self.workers,
+                   progress_callback=self.progress.emit,
+                   is_cancelled=lambda: self._cancelled)
+        self.finishedReport.emit(report, self._cancelled)
+
+
 class ReplaceFromTxtDialog(QDialog):
     """
     Диалог для пакетной замены контента на HTML-страницах
@@ -37,6 +193,8 @@ class ReplaceFromTxtDialog(QDialog):
         self.setWindowTitle("Замена контента из txt файлов")
         self.setMinimumSize(1400, 900)
         self.content_dir = content_dir
+        self.replace_worker = None
+        self.report_worker = None
 
         # Папка для текстов замены (рядом со скриптом)
         self.texts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "text_for_replace")
@@ -89,6 +247,11 @@ class ReplaceFromTxtDialog(QDialog):
         self.analyze_btn.clicked.connect(self.on_analyze_structure)
         btn_layout.addWidget(self.analyze_btn)
 
+        self.report_btn = QPushButton("📋 Отчёт по всем страницам")
+        self.report_btn.setToolTip("Проверка структуры всего сайта перед массовой заменой (CSV)")
+        self.report_btn.clicked.connect(self.on_structure_report)
+        btn_layout.addWidget(self.report_btn)
+
         btn_layout.addStretch()
 
         self.replace_btn = QPushButton("🔄 Заменить контент")
@@ -105,12 +268,21 @@ class ReplaceFromTxtDialog(QDialog):
         self.replace_btn.clicked.connect(self.on_replace_content)
         btn_layout.addWidget(self.replace_btn)
 
+        self.cancel_btn = QPushButton("⏹ Остановить")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.on_cancel_replace)
+        btn_layout.addWidget(self.cancel_btn)
+
         self.batch_meta_btn = QPushButton("📝 Пакетно заменить Title/Desc")
         self.batch_meta_btn.clicked.connect(self.on_batch_meta_update)
         btn_layout.addWidget(self.batch_meta_btn)
 
         main_layout.addLayout(btn_layout)
 
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        main_layout.addWidget(self.progress_bar)
+
         # ─── Лог ───
         self.log_edit = QTextEdit()
         self.log_edit.setReadOnly(True)
@@ -301,20 +473,23 @@ class ReplaceFromTxtDialog(QDialog):
                 enc = chardet.detect(raw).get('encoding') or 'utf-8'
                 html_content = raw.decode(enc, errors='replace')
 
-                analysis = analyze_page_structure(html_content)
+                analysis = analyze_page_structure(html_content, domain=self.content_dir)
 
                 self.log_edit.append(f"📄 {rel_path}")
                 self.log_edit.append(
                     f"   Контейнер: {'✅ ' + str(analysis['container_selector']) if analysis['container_found'] else '❌ Не найден'}")
                 self.log_edit.append(f"   H1: {'✅' if analysis['h1_found'] else '❌ Не найден'}")
-                self.log_edit.append(f"   Сохраняемых элементов: {analysis['preserved_count']}")
+                self.log_edit.append(f"   Тип страницы: {analysis['page_type']}")
                 self.log_edit.append("")
 
             except Exception as e:
                 self.log_edit.append(f"❌ {rel_path}: {e}\n")
 
     def on_replace_content(self):
-        """Заменяет контент на выбранных страницах."""
+        """Заменяет контент на выбранных страницах (в фоне, см. ReplaceWorker)."""
+        if self.replace_worker is not None and self.replace_worker.isRunning():
+            return
+
         selected = []
         for i in range(self.file_table.rowCount()):
             chk = self.file_table.item(i, 0)
@@ -331,71 +506,134 @@ class ReplaceFromTxtDialog(QDialog):
         self.log_edit.clear()
         self.log_edit.append(f"Начинаю замену контента для {len(selected)} страниц...\n")
 
-        success_count = 0
-        error_count = 0
-
-        for i, html_rel, txt_path in selected:
-            html_full = os.path.join(self.content_dir, html_rel)
+        self.replace_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.progress_bar.setRange(0, len(selected))
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+
+        self.replace_worker = ReplaceWorker(selected, self.content_dir, parent=self)
+        self.replace_worker.rowDone.connect(self._on_replace_row_done)
+        self.replace_worker.finishedAll.connect(self._on_replace_finished)
+        self.replace_worker.start()
+
+    def closeEvent(self, event):
+        # Не даём уничтожить окно с работающим потоком записи
+        for worker in (self.replace_worker, self.report_worker):
+            if worker is not None and worker.isRunning():
+                worker.cancel()
+                worker.wait()
+        super().closeEvent(event)
+
+    def on_cancel_replace(self):
+        """Останавливает фоновую замену или отчёт: уже записанные файлы остаются."""
+        for worker in (self.replace_worker, self.report_worker):
+            if worker is not None and worker.isRunning():
+                self.cancel_btn.setEnabled(False)
+                self.log_edit.append("⏹ Отмена — дожидаюсь текущих файлов...")
+                worker.cancel()
+
+    def on_structure_report(self):
+        """Отчёт по структуре всех страниц сайта (в фоне, см. StructureReportWorker)."""
+        if self.report_worker is not None and self.report_worker.isRunning():
+            return
+        if not self.content_dir or not os.path.isdir(self.content_dir):
+            return
 
+        self.log_edit.clear()
+        self.log_edit.append("=== ОТЧЁТ ПО СТРУКТУРЕ САЙТА ===\n")
+
+        self.report_btn.setEnabled(False)
+        self.replace_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setVisible(True)
+
+        self.report_worker = StructureReportWorker(self.content_dir, parent=self)
+        self.report_worker.progress.connect(self._on_report_progress)
+        self.report_worker.finishedReport.connect(self._on_report_finished)
+        self.report_worker.start()
+
+    def _on_report_progress(self, done: int, total: int):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    def _on_report_finished(self, report, cancelled: bool):
+        self.report_btn.setEnabled(True)
+        self.replace_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+        self.progress_bar.setVisible(False)
+
+        stats = report.stats
+        self.log_edit.append(
+            f"Страниц: {stats['files']} (из кэша: {stats['cached']}, разобрано: {stats['analyzed']})"
+        )
+        if cancelled:
+            self.log_edit.append("⏹ Остановлено пользователем — отчёт неполный")
+
+        for group in report.summary():
+            counts = ", ".join(f"{STATUS_LABELS[s]}: {group[s]}" for s in STATUSES if group[s])
+            self.log_edit.append(f"   {group['page_type']}: {group['total']} — {counts}")
+
+        problems = report.problems()
+        if problems:
+            self.log_edit.append(f"\n⚠️ Проблемных страниц: {len(problems)}")
+            for row in problems[:50]:
+                suffix = f" ({row['error']})" if row.get('error') else ""
+                self.log_edit.append(f"   {STATUS_LABELS[row['status']]}: {row['path']}{suffix}")
+            if len(problems) > 50:
+                self.log_edit.append(f"   ... и ещё {len(problems) - 50}")
+        else:
+            self.log_edit.append("\n✅ Все страницы распознаются")
+
+        if not report.rows:
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить отчёт", "structure_report.csv", "CSV (*.csv)"
+        )
+        if path:
             try:
-                # Читаем HTML
-                with open(html_full, "rb") as f:
-                    raw = f.read()
-                enc = chardet.detect(raw).get("encoding") or "utf-8"
-                old_html = raw.decode(enc, errors="replace")
-
-                # Читаем новый контент
-                with open(txt_path, "r", encoding="utf-8", errors="replace") as t:
-                    new_content = t.read()
+                report.export_csv(path)
+                self.log_edit.append(f"💾 Отчёт сохранён: {path}")
+            except OSError as e:
+                QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить отчёт:\n{e}")
+
+    def _on_replace_row_done(self, i: int, html_rel: str, status: str, message: str):
+        """Результат по одной строке таблицы."""
+        self.progress_bar.setValue(self.progress_bar.value() + 1)
+
+        if status == ReplaceWorker.STATUS_OK:
+            self.log_edit.append(f"✅ {html_rel}")
+            # Визуальная отметка
+            self.file_table.item(i, 5).setText("")
+            self.file_table.item(i, 0).setCheckState(Qt.CheckState.Unchecked)
+            color = Qt.GlobalColor.darkGreen
+        elif status == ReplaceWorker.STATUS_STRUCTURE:
+            self.log_edit.append(f"⚠️ {html_rel}: {message}")
+            color = Qt.GlobalColor.darkYellow
+        else:
+            self.log_edit.append(f"❌ {html_rel}: {message}")
+            color = Qt.GlobalColor.red
 
-                # Меняем через единый движок
-                new_html = universal_replace_content(old_html, new_content)
-
-                # Сохраняем без лишних пустых строк:
-                # нормализуем \r\n / \r -> \n и фиксируем newline="\n"
-                normalized_html = new_html.replace("\r\n", "\n").replace("\r", "\n")
-                with open(html_full, "w", encoding=enc, errors="replace", newline="\n") as f:
-                    f.write(normalized_html)
-
-                # Переименовываем txt в used_
-                dir_, base = os.path.split(txt_path)
-                used_name = os.path.join(dir_, "used_" + base)
-                os.rename(txt_path, used_name)
-
-                self.log_edit.append(f"✅ {html_rel}")
-
-                # Визуальная отметка
-                self.file_table.item(i, 5).setText("")
-                self.file_table.item(i, 0).setCheckState(Qt.CheckState.Unchecked)
-                for c in range(self.file_table.columnCount()):
-                    item = self.file_table.item(i, c)
-                    if item:
-                        item.setForeground(Qt.GlobalColor.darkGreen)
-
-                success_count += 1
-
-            except ValueError as ve:
-                self.log_edit.append(f"⚠️ {html_rel}: {ve}")
-                for c in range(self.file_table.columnCount()):
-                    item = self.file_table.item(i, c)
-                    if item:
-                        item.setForeground(Qt.GlobalColor.darkYellow)
-                error_count += 1
+        for c in range(self.file_table.columnCount()):
+            item = self.file_table.item(i, c)
+            if item:
+                item.setForeground(color)
 
-            except Exception as e:
-                self.log_edit.append(f"❌ {html_rel}: {e}")
-                for c in range(self.file_table.columnCount()):
-                    item = self.file_table.item(i, c)
-                    if item:
-                        item.setForeground(Qt.GlobalColor.red)
-                error_count += 1
+    def _on_replace_finished(self, success_count: int, error_count: int, cancelled: bool):
+        self.replace_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+        self.progress_bar.setVisible(False)
 
         self.log_edit.append(f"\n{'=' * 50}")
         self.log_edit.append(f"✅ Успешно: {success_count}")
         self.log_edit.append(f"❌ Ошибок: {error_count}")
+        if cancelled:
+            self.log_edit.append("⏹ Остановлено пользователем")
 
         self.update_all_combos()
-        QMessageBox.information(self, "Готово", f"Замена завершена!\nУспешно: {success_count}\nОшибок: {error_count}")
+        title = "Остановлено" if cancelled else "Готово"
+        QMessageBox.information(self, title, f"Замена завершена!\nУспешно: {success_count}\nОшибок: {error_count}")
 
     def on_auto_select_files(self):
         """Автоматический подбор txt-файлов по ключевым словам."""
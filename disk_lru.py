@@ -0,0 +1,154 @@
+"""
+disk_lru.py — Общее дисковое хранилище с LRU-вытеснением по размеру
+
+Основа для GenerationCache и HttpResponseCache: оба кэша хранят
+байты по hex-ключу и отличаются только форматом записи и своей
+статистикой. Здесь — всё, что касается диска.
+
+Принципы:
+1. Одна запись — один файл <key><suffix> в подкаталоге по первым двум
+   символам ключа; запись атомарная (tmp + os.replace).
+2. Индекс key → [размер, mtime] строится один раз при открытии,
+   чтобы не сканировать каталог при каждой записи.
+3. LRU по mtime: чтение обновляет mtime, при превышении max_bytes
+   удаляются самые давно использованные записи.
+4. Потокобезопасно: кэшами пользуются пулы потоков.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LOGGING
+# ─────────────────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+
+class DiskLRUStore:
+    """
+    Байтовое хранилище key → файл с учётом размера и LRU-вытеснением.
+
+    Пример:
+    ```python
+    store = DiskLRUStore(cache_dir, suffix=".json", max_bytes=64 * 1024 * 1024)
+    if store.write(key, data):
+        ...
+    data = store.read(key)  # None — записи нет
+    ```
+    """
+
+    def __init__(self, cache_dir: str, suffix: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self._index: Dict[str, list] = {}  # key → [размер файла, mtime]
+        self._total = 0
+        self._scan()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + self.suffix)
+
+    def _scan(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for root, dirs, files in os.walk(self.cache_dir):
+            for fname in files:
+                if not fname.endswith(self.suffix):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, fname))
+                except OSError:
+                    continue
+                self._index[fname[:-len(self.suffix)]] = [st.st_size, st.st_mtime]
+                self._total += st.st_size
+
+    def read(self, key: str) -> Optional[bytes]:
+        """Байты записи или None; чтение продлевает жизнь записи."""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self.touch(key)
+        return data
+
+    def touch(self, key: str):
+        """Отмечает запись как использованную (mtime на диске и в индексе)."""
+        now = time.time()
+        try:
+            os.utime(self.path(key), (now, now))
+        except OSError:
+            pass
+        with self.lock:
+            if key in self._index:
+                self._index[key][1] = now
+
+    def write(self, key: str, data: bytes) -> bool:
+        """Атомарно записывает байты (перезаписывает запись); False — ошибка диска."""
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Не удалось записать {path}: {e}")
+            return False
+
+        with self.lock:
+            old = self._index.get(key)
+            if old is not None:
+                self._total -= old[0]
+            self._index[key] = [len(data), time.time()]
+            self._total += len(data)
+            self._evict()
+        return True
+
+    def _evict(self):
+        """Удаляет самые давно использованные записи сверх max_bytes (под локом)."""
+        if self._total <= self.max_bytes:
+            return
+        for key, (size, _) in sorted(self._index.items(), key=lambda kv: kv[1][1]):
+            if self._total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+            del self._index[key]
+            self._total -= size
+            self.evictions += 1
+
+    def discard(self, key: str):
+        with self.lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                self._total -= old[0]
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self.lock:
+            for key in list(self._index):
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    pass
+            self._index.clear()
+            self._total = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._total
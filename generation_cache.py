@@ -0,0 +1,143 @@
+"""
+generation_cache.py — Дисковый кэш сгенерированных текстов
+
+Повторный запуск пакета (после ошибки структуры, падения, отмены) не должен
+заново тратить минуты GPU на статьи с тем же промптом. Ключ кэша — хеш
+(модель, промпт после подстановки, параметры генерации), значение — текст.
+
+Принципы:
+1. Одна запись — один JSON-файл <sha256>.json в DiskLRUStore
+   (атомарная запись, индекс размеров, LRU по mtime — см. disk_lru.py).
+2. Попадание продлевает жизнь записи; при превышении max_bytes
+   удаляются самые давно использованные записи.
+3. Потокобезопасно: генерации идут из пула потоков BatchGenThread.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from disk_lru import DiskLRUStore
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LOGGING
+# ─────────────────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КОНСТАНТЫ
+# ─────────────────────────────────────────────────────────────────────────────
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generation_cache")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Режимы использования кэша
+CACHE_USE = "use"        # Брать из кэша, новые ответы сохранять
+CACHE_FORCE = "force"    # Генерировать заново и перезаписывать кэш
+CACHE_BYPASS = "bypass"  # Кэш не читать и не писать
+
+
+def generation_key(model: str, prompt: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Ключ записи: sha256 от модели, промпта и параметров генерации."""
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "params": params or {}},
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """
+    Content-addressed кэш генераций с LRU-вытеснением по размеру.
+
+    Пример:
+    ```python
+    cache = GenerationCache()
+    key = generation_key(lm.model_name, prompt, lm.params)
+    text = cache.get(key)
+    if text is None:
+        text = lm.generate_text(prompt)
+        cache.put(key, text)
+    ```
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._store = DiskLRUStore(cache_dir, ".json", max_bytes)
+
+    def get(self, key: str) -> Optional[str]:
+        """Текст по ключу или None; попадание продлевает жизнь записи."""
+        data = self._store.read(key)
+        try:
+            text = json.loads(data.decode("utf-8"))["text"] if data is not None else None
+        except (ValueError, KeyError):
+            text = None
+        with self._store.lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def put(self, key: str, text: str, meta: Optional[Dict[str, Any]] = None):
+        """Сохраняет текст (перезаписывает существующую запись)."""
+        data = json.dumps({"text": text, "meta": meta or {}, "created": time.time()},
+                          ensure_ascii=False).encode("utf-8")
+        self._store.write(key, data)
+
+    def discard(self, key: str):
+        """Удаляет одну запись (например, отбракованный текст)."""
+        self._store.discard(key)
+
+    def clear(self):
+        self._store.clear()
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._store.size_bytes
+
+    @property
+    def evictions(self) -> int:
+        return self._store.evictions
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._store),
+            "bytes": self._store.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self._store.evictions,
+        }
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ТЕСТ
+# ─────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = GenerationCache(tmp, max_bytes=20_000)
+        keys = [generation_key("model", f"prompt {i}", {"temperature": 0.7}) for i in range(50)]
+        for i, key in enumerate(keys):
+            cache.put(key, f"<p>article {i}</p>" * 50)
+            cache.get(keys[0])  # первая запись «горячая» и не вытесняется
+
+        print(f"Записей: {len(cache)}, размер: {cache.size_bytes} (лимит 20000)")
+        print(f"Горячая запись жива: {cache.get(keys[0]) is not None}, "
+              f"старая вытеснена: {cache.get(keys[1]) is None}")
+        print(f"Другие параметры — другой ключ: "
+              f"{generation_key('model', 'prompt 0', {'temperature': 0.2}) != keys[0]}")
+
+        reopened = GenerationCache(tmp, max_bytes=20_000)
+        print(f"После перезапуска: {len(reopened)} записей, "
+              f"попадание: {reopened.get(keys[-1]) is not None}")
+        print(cache.stats())
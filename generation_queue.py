@@ -0,0 +1,318 @@
+"""
+generation_queue.py — Персистентная очередь задач генерации (SQLite)
+
+Пакет генерации может идти часами; при закрытии программы или падении
+список «что уже переписано, что нет» не должен теряться. Каждая строка
+пакета — задача в SQLite: файл, готовый промпт, состояние, попытки.
+
+Принципы:
+1. Состояния: pending → running → done | failed. Задачи, оставшиеся
+   в running после падения, recover() возвращает в pending.
+2. Ошибки LM Studio повторяются с экспоненциальной задержкой
+   (next_at), пока не исчерпан max_attempts; ошибки структуры — сразу failed.
+3. Одна задача на (каталог, файл): повторная постановка незавершённой
+   задачи сохраняет её промпт и попытки, завершённой — начинает заново.
+4. Потокобезопасно: одно соединение под локом, WAL, запись в транзакции.
+"""
+
+import os
+import time
+import uuid
+import random
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LOGGING
+# ─────────────────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КОНСТАНТЫ
+# ─────────────────────────────────────────────────────────────────────────────
+DEFAULT_QUEUE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generation_queue.sqlite3")
+
+STATE_PENDING = "pending"
+STATE_RUNNING = "running"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+DEFAULT_MAX_ATTEMPTS = 3
+BACKOFF_BASE = 10.0    # Задержка перед 2-й попыткой, сек
+BACKOFF_MAX = 600.0    # Потолок задержки
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch       TEXT NOT NULL,
+    content_dir TEXT NOT NULL,
+    file        TEXT NOT NULL,
+    prompt      TEXT NOT NULL,
+    state       TEXT NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    next_at     REAL NOT NULL DEFAULT 0,
+    error       TEXT,
+    info        TEXT,
+    created     REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL,
+    UNIQUE (content_dir, file)
+);
+CREATE INDEX IF NOT EXISTS jobs_batch_state ON jobs (batch, state, next_at);
+"""
+
+
+def new_batch_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def backoff_delay(attempts: int) -> float:
+    """Задержка перед следующей попыткой: BASE·2^(n-1) ± 20%, не больше BACKOFF_MAX."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+@dataclass
+class Job:
+    id: int
+    file: str
+    prompt: str
+    attempts: int
+
+
+class GenerationQueue:
+    """
+    Очередь задач генерации поверх SQLite.
+
+    Пример:
+    ```python
+    queue = GenerationQueue()
+    queue.recover()
+    batch = new_batch_id()
+    queue.enqueue(batch, content_dir, [(file_, prompt), ...])
+    while (job := queue.claim(batch)) is not None:
+        ...
+        queue.complete(job.id)                     # или
+        queue.fail(job.id, "timeout", retry=True)  # повтор через backoff
+    ```
+
+    path=":memory:" — очередь без файла (на время одного пакета).
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _write(self, sql: str, args=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, args)
+
+    def _read(self, sql: str, args=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    # ─── Постановка и восстановление ───
+    def recover(self) -> int:
+        """Задачи, брошенные в running (падение/закрытие), снова в pending."""
+        cur = self._write("UPDATE jobs SET state=? WHERE state=?", (STATE_PENDING, STATE_RUNNING))
+        if cur.rowcount:
+            logger.info(f"Очередь генерации: восстановлено {cur.rowcount} прерванных задач")
+        return cur.rowcount
+
+    def enqueue(self, batch: str, content_dir: str, jobs: Iterable[Tuple[str, str]]) -> int:
+        """
+        Ставит задачи (file, prompt) в пакет batch.
+
+        Незавершённая задача того же файла переходит в пакет со своим
+        промптом и счётчиком попыток; done/failed начинаются заново.
+        """
+        now = time.time()
+        rows = [(batch, content_dir, file_, prompt, STATE_PENDING, now) for file_, prompt in jobs]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    """
+                    INSERT INTO jobs (batch, content_dir, file, prompt, state, created)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (content_dir, file) DO UPDATE SET
+                        batch = excluded.batch,
+                        prompt = CASE WHEN jobs.state IN ('pending', 'running')
+                                      THEN jobs.prompt ELSE excluded.prompt END,
+                        attempts = CASE WHEN jobs.state IN ('pending', 'running')
+                                        THEN jobs.attempts ELSE 0 END,
+                        next_at = CASE WHEN jobs.state IN ('pending', 'running')
+                                       THEN jobs.next_at ELSE 0 END,
+                        state = 'pending',
+                        error = NULL,
+                        created = excluded.created,
+                        started_at = NULL,
+                        finished_at = NULL
+                    """,
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def unfinished_files(self, content_dir: str) -> List[str]:
+        """Файлы каталога с незавершёнными задачами (для продолжения после перезапуска)."""
+        rows = self._read(
+            "SELECT file FROM jobs WHERE content_dir=? AND state IN (?, ?) ORDER BY id",
+            (content_dir, STATE_PENDING, STATE_RUNNING),
+        )
+        return [r[0] for r in rows]
+
+    def discard(self, content_dir: str) -> int:
+        """Удаляет незавершённые задачи каталога."""
+        cur = self._write(
+            "DELETE FROM jobs WHERE content_dir=? AND state IN (?, ?)",
+            (content_dir, STATE_PENDING, STATE_RUNNING),
+        )
+        return cur.rowcount
+
+    # ─── Выполнение ───
+    def claim(self, batch: str) -> Optional[Job]:
+        """Берёт следующую готовую к запуску задачу пакета (running, attempts+1)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, file, prompt, attempts FROM jobs "
+                    "WHERE batch=? AND state=? AND next_at<=? ORDER BY next_at, id LIMIT 1",
+                    (batch, STATE_PENDING, now),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET state=?, attempts=attempts+1, started_at=? WHERE id=?",
+                        (STATE_RUNNING, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return Job(id=row[0], file=row[1], prompt=row[2], attempts=row[3] + 1)
+
+    def complete(self, job_id: int, info: str = ""):
+        self._write(
+            "UPDATE jobs SET state=?, info=?, error=NULL, finished_at=? WHERE id=?",
+            (STATE_DONE, info, time.time(), job_id),
+        )
+
+    def fail(self, job_id: int, error: str, retry: bool = True,
+             delay: Optional[float] = None, prompt: Optional[str] = None) -> Optional[float]:
+        """
+        Отмечает неудачную попытку.
+
+        delay: задержка до повтора; None — экспоненциальный backoff.
+        prompt: новый промпт для повтора; None — прежний.
+
+        Returns:
+            Задержку до повтора (сек) или None, если задача окончательно failed
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE id=?", (job_id,)).fetchone()
+            attempts = row[0] if row else self.max_attempts
+            now = time.time()
+            if retry and attempts < self.max_attempts:
+                if delay is None:
+                    delay = backoff_delay(attempts)
+                self._conn.execute(
+                    "UPDATE jobs SET state=?, error=?, next_at=?, prompt=COALESCE(?, prompt) WHERE id=?",
+                    (STATE_PENDING, error, now + delay, prompt, job_id),
+                )
+                return delay
+            self._conn.execute(
+                "UPDATE jobs SET state=?, error=?, finished_at=? WHERE id=?",
+                (STATE_FAILED, error, now, job_id),
+            )
+            return None
+
+    def release(self, job_id: int):
+        """Возвращает задачу в pending без траты попытки (отмена пакета)."""
+        self._write(
+            "UPDATE jobs SET state=?, attempts=MAX(attempts-1, 0) WHERE id=? AND state=?",
+            (STATE_PENDING, job_id, STATE_RUNNING),
+        )
+
+    def next_due_in(self, batch: str) -> Optional[float]:
+        """Секунд до ближайшего повтора в пакете; None — ждать нечего."""
+        row = self._read(
+            "SELECT MIN(next_at) FROM jobs WHERE batch=? AND state=?", (batch, STATE_PENDING)
+        )[0]
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def stats(self, batch: str) -> Dict[str, float]:
+        """Глубина очереди по состояниям и пропускная способность пакета (статей/мин)."""
+        counts = {STATE_PENDING: 0, STATE_RUNNING: 0, STATE_DONE: 0, STATE_FAILED: 0}
+        for state, n in self._read("SELECT state, COUNT(*) FROM jobs WHERE batch=? GROUP BY state", (batch,)):
+            counts[state] = n
+        first_start = self._read(
+            "SELECT MIN(started_at) FROM jobs WHERE batch=? AND started_at IS NOT NULL", (batch,)
+        )[0][0]
+        elapsed = time.time() - first_start if first_start else 0.0
+        counts["per_minute"] = counts[STATE_DONE] * 60 / elapsed if elapsed > 0 else 0.0
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ТЕСТ
+# ─────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "queue.sqlite3")
+        queue = GenerationQueue(path)
+        batch = new_batch_id()
+        queue.enqueue(batch, "/site", [(f"post-{i}.html", f"prompt {i}") for i in range(1000)])
+
+        t0 = time.perf_counter()
+        done = 0
+        while done < 600:
+            job = queue.claim(batch)
+            queue.complete(job.id, "ok")
+            done += 1
+        elapsed = time.perf_counter() - t0
+        print(f"claim+complete: {elapsed / done * 1000:.2f} ms на задачу")
+
+        # «Падение»: две задачи в работе, процесс умер
+        queue.claim(batch)
+        queue.claim(batch)
+        queue.close()
+
+        queue = GenerationQueue(path)
+        print(f"После перезапуска: восстановлено {queue.recover()}, "
+              f"незавершённых файлов: {len(queue.unfinished_files('/site'))}")
+
+        # Продолжение в новом пакете: промпт и попытки сохранены
+        batch2 = new_batch_id()
+        queue.enqueue(batch2, "/site", [(f, "NEW PROMPT") for f in queue.unfinished_files("/site")])
+        job = queue.claim(batch2)
+        print(f"Продолжение: {job.file}, промпт: {job.prompt!r}, попытка {job.attempts}")
+
+        delay = queue.fail(job.id, "LM Studio error: timeout", retry=True)
+        print(f"Ошибка LM → повтор через {delay:.1f}s")
+        queue.fail(queue.claim(batch2).id, "Не найден контейнер", retry=False)
+        print(queue.stats(batch2))
+        queue.close()
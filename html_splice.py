@@ -0,0 +1,289 @@
+"""
+html_splice.py — Точечная запись изменений в исходный HTML
+
+Вместо полной пересериализации документа через lxml находим в исходных
+байтах позиции изменённых узлов и вставляем только новые фрагменты.
+Всё остальное (DOCTYPE, атрибуты <html>, <head>, форматирование, кодировка)
+остаётся байт-в-байт, запись стоит O(изменений), а диффы и бэкапы — крошечные.
+
+Принципы:
+1. Открывающие теги ищутся лёгким сканером, который пропускает комментарии
+   и «сырые» элементы (script, style, textarea, title), перепрыгивая их
+   поиском закрывающего тега.
+2. Элемент lxml сопоставляется с тегом в исходнике по порядковому номеру
+   среди элементов с тем же именем.
+3. Каждое сопоставление ПРОВЕРЯЕТСЯ: исходный текст узла должен совпасть
+   с elem.text. При несовпадении splice отказывается, и вызывающий код
+   откатывается на полную сериализацию.
+"""
+
+import re
+import codecs
+from html import unescape
+from typing import Dict, List, Optional, Tuple, Union
+
+# ─────────────────────────────────────────────────────────────────────────────
+# СКАНЕР ТЕГОВ
+# ─────────────────────────────────────────────────────────────────────────────
+# Начало комментария | начало открывающего тега
+_MARKUP_PATTERN = r'<!--|<([a-zA-Z][a-zA-Z0-9:-]*)'
+_MARKUP_RE_STR = re.compile(_MARKUP_PATTERN)
+_MARKUP_RE_BYTES = re.compile(_MARKUP_PATTERN.encode('ascii'))
+
+# «Сырые» элементы: их содержимое пропускается до закрывающего тега
+_RAW_TAGS = ('script', 'style', 'textarea', 'title', 'xmp')
+_RAW_END_RE_STR = {t: re.compile(r'</%s\s*>' % t, re.I) for t in _RAW_TAGS}
+_RAW_END_RE_BYTES = {t: re.compile((r'</%s\s*>' % t).encode('ascii'), re.I) for t in _RAW_TAGS}
+
+# Открывающий тег целиком (кавычки в атрибутах могут содержать '>')
+_START_TAG_PATTERN = r'<[^\s/>]+(?:"[^"]*"|\'[^\']*\'|[^\'">])*>'
+_START_TAG_RE_STR = re.compile(_START_TAG_PATTERN)
+_START_TAG_RE_BYTES = re.compile(_START_TAG_PATTERN.encode('ascii'))
+
+# Токены исходного текста, которые lxml превращает в другие символы
+_TEXT_TOKEN_RE = re.compile(
+    r'\r\n?|&(?:#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[A-Za-z][A-Za-z0-9]*;?)'
+)
+
+
+def _iter_start_tags(data: Union[str, bytes], start: int = 0):
+    """
+    Открывающие теги документа: (имя в нижнем регистре, позиция '<').
+
+    Комментарии и содержимое «сырых» элементов перепрыгиваются поиском
+    конца (find / короткий regex), без посимвольного разбора.
+    """
+    if isinstance(data, bytes):
+        regex, raw_end, comment_end = _MARKUP_RE_BYTES, _RAW_END_RE_BYTES, b'-->'
+    else:
+        regex, raw_end, comment_end = _MARKUP_RE_STR, _RAW_END_RE_STR, '-->'
+
+    pos = start
+    while True:
+        m = regex.search(data, pos)
+        if m is None:
+            return
+        name = m.group(1)
+        if not name:
+            end = data.find(comment_end, m.end())
+            if end < 0:
+                return
+            pos = end + 3
+            continue
+
+        if isinstance(name, bytes):
+            name = name.decode('ascii')
+        name = name.lower()
+        yield name, m.start()
+
+        pos = m.end()
+        if name in raw_end:
+            tag_end = start_tag_end(data, m.start())
+            if tag_end is None:
+                continue
+            close = raw_end[name].search(data, tag_end)
+            if close is None:
+                return
+            pos = close.end()
+
+
+def scan_start_tags(data: Union[str, bytes], tags) -> Dict[str, List[int]]:
+    """
+    Один проход по документу: позиции '<' открывающих тегов из набора tags.
+
+    Args:
+        data: HTML (str или bytes в ASCII-совместимой кодировке)
+        tags: Имена тегов в нижнем регистре
+
+    Returns:
+        {tag: [offset, ...]} в порядке документа
+    """
+    wanted = {t.lower() for t in tags}
+    positions: Dict[str, List[int]] = {t: [] for t in wanted}
+
+    for name, pos in _iter_start_tags(data):
+        if name in wanted:
+            positions[name].append(pos)
+
+    return positions
+
+
+def find_start_tag(data: Union[str, bytes], tag: str, start: int = 0) -> int:
+    """
+    Позиция '<' первого открывающего тега tag (или -1).
+
+    Сканирование останавливается на первом совпадении, поэтому поиск
+    <head>/<body> не проходит документ до конца.
+    """
+    tag = tag.lower()
+    for name, pos in _iter_start_tags(data, start):
+        if name == tag:
+            return pos
+    return -1
+
+
+def start_tag_end(data: Union[str, bytes], pos: int) -> Optional[int]:
+    """Возвращает позицию сразу после '>' открывающего тега, начинающегося в pos."""
+    regex = _START_TAG_RE_BYTES if isinstance(data, bytes) else _START_TAG_RE_STR
+    m = regex.match(data, pos)
+    return m.end() if m else None
+
+
+def locate_body(text: str) -> Optional[Tuple[int, int]]:
+    """
+    Находит <body>…</body> в исходной строке.
+
+    Returns:
+        (start, end): start — позиция '<body', end — позиция после '</body>'.
+        None, если body не найден.
+    """
+    start = find_start_tag(text, 'body')
+    if start < 0:
+        return None
+
+    end_tag = max(text.rfind('</body'), text.rfind('</BODY'), text.rfind('</Body'))
+    if end_tag < start:
+        return None
+    close = text.find('>', end_tag)
+    if close < 0:
+        return None
+    return start, close + 1
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# SPLICER
+# ─────────────────────────────────────────────────────────────────────────────
+class HtmlSplicer:
+    """
+    Накопитель точечных правок исходных байт HTML.
+
+    Пример:
+    ```python
+    splicer = HtmlSplicer(raw, 'utf-8')
+    if splicer.insert_into_text('p', 3, original_text, [(42, '<a href="…">…</a> ')]):
+        new_raw = splicer.result()
+    ```
+    """
+
+    def __init__(self, raw: bytes, encoding: str):
+        self.raw = raw
+        self.encoding = encoding
+        self._positions: Dict[str, List[int]] = {}
+        self._patches: List[Tuple[int, int, bytes]] = []
+
+    @property
+    def supported(self) -> bool:
+        """Работаем только с ASCII-совместимыми кодировками (не UTF-16/32)."""
+        try:
+            codecs.lookup(self.encoding)
+            return '<p a="&">'.encode(self.encoding) == b'<p a="&">'
+        except (LookupError, UnicodeError):
+            return False
+
+    def index_tags(self, tags):
+        """Индексирует позиции нужных тегов одним проходом."""
+        missing = [t for t in tags if t not in self._positions]
+        if missing:
+            self._positions.update(scan_start_tags(self.raw, missing))
+
+    def insert_into_text(self,
+                         tag: str,
+                         ordinal: int,
+                         original_text: str,
+                         insertions: List[Tuple[int, str]]) -> bool:
+        """
+        Вставляет фрагменты в прямой текст элемента (elem.text).
+
+        Args:
+            tag: Имя тега элемента
+            ordinal: Порядковый номер элемента среди тегов tag в документе
+            original_text: elem.text ДО изменений (для проверки сопоставления)
+            insertions: [(позиция в original_text, HTML-фрагмент), ...]
+
+        Returns:
+            True, если позиции найдены и проверены
+        """
+        self.index_tags((tag,))
+        positions = self._positions.get(tag, [])
+        if ordinal >= len(positions):
+            return False
+
+        text_start = start_tag_end(self.raw, positions[ordinal])
+        if text_start is None:
+            return False
+        text_end = self.raw.find(b'<', text_start)
+        if text_end < 0:
+            text_end = len(self.raw)
+
+        chunk = self.raw[text_start:text_end]
+        try:
+            source = chunk.decode(self.encoding)
+            if source.encode(self.encoding) != chunk:
+                return False
+        except UnicodeError:
+            return False
+
+        # Карта «позиция в тексте lxml → позиция в исходной строке»
+        boundaries, decoded = self._map_text(source)
+        if decoded != original_text:
+            return False
+
+        patches = []
+        for text_pos, fragment in insertions:
+            src_pos = boundaries.get(text_pos)
+            if src_pos is None:
+                return False
+            byte_pos = text_start + len(source[:src_pos].encode(self.encoding))
+            data = fragment.encode(self.encoding, errors='xmlcharrefreplace')
+            patches.append((byte_pos, byte_pos, data))
+
+        self._patches.extend(patches)
+        return True
+
+    @staticmethod
+    def _map_text(source: str) -> Tuple[Dict[int, int], str]:
+        """Раскрывает сущности и \\r\\n так же, как lxml, запоминая границы токенов."""
+        boundaries: Dict[int, int] = {}
+        parts: List[str] = []
+        text_pos = 0
+        src_pos = 0
+
+        for m in _TEXT_TOKEN_RE.finditer(source):
+            # Обычные символы переходят 1:1
+            for i in range(src_pos, m.start()):
+                boundaries[text_pos] = i
+                text_pos += 1
+            parts.append(source[src_pos:m.start()])
+
+            token = m.group(0)
+            value = '\n' if token[0] == '\r' else unescape(token)
+            boundaries[text_pos] = m.start()
+            text_pos += len(value)
+            parts.append(value)
+            src_pos = m.end()
+
+        for i in range(src_pos, len(source)):
+            boundaries[text_pos] = i
+            text_pos += 1
+        parts.append(source[src_pos:])
+        boundaries[text_pos] = len(source)
+
+        return boundaries, ''.join(parts)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self._patches)
+
+    def result(self) -> bytes:
+        """Собирает итоговые байты: исходник + правки."""
+        if not self._patches:
+            return self.raw
+
+        out = []
+        last = 0
+        for start, end, data in sorted(self._patches, key=lambda p: (p[0], p[1])):
+            out.append(self.raw[last:start])
+            out.append(data)
+            last = end
+        out.append(self.raw[last:])
+        return b''.join(out)
@@ -0,0 +1,183 @@
+"""
+http_cache.py — Дисковый кэш ответов WP REST API (условные запросы)
+
+Повторный анализ тех же доменов заново качает полный rendered-контент
+всех постов, хотя почти ничего не менялось. Кэш хранит тело ответа
+и валидаторы (ETag / Last-Modified); повторный запрос уходит с
+If-None-Match / If-Modified-Since и на 304 тело берётся с диска.
+
+Принципы:
+1. Ключ — sha256(URL + параметры); запись — один zlib-сжатый JSON-файл
+   в DiskLRUStore (атомарная запись, индекс размеров — см. disk_lru.py).
+2. Свежая запись (моложе fresh_seconds) отдаётся без запроса вовсе —
+   WordPress часто не присылает валидаторов, и иначе кэш бы не работал.
+3. Записи старше max_age удаляются; при превышении max_bytes
+   вытесняются самые давно использованные (LRU по mtime).
+"""
+
+import os
+import json
+import time
+import zlib
+import hashlib
+import logging
+from typing import Any, Dict, Optional
+
+from requests.structures import CaseInsensitiveDict
+
+from disk_lru import DiskLRUStore
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LOGGING
+# ─────────────────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КОНСТАНТЫ
+# ─────────────────────────────────────────────────────────────────────────────
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "http_cache")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_FRESH_SECONDS = 10 * 60          # Без запроса к серверу
+DEFAULT_MAX_AGE = 30 * 24 * 3600         # Дальше запись не ревалидируется, а удаляется
+
+# Заголовки, которые нужны вызывающему коду после ответа из кэша
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified", "X-WP-Total", "X-WP-TotalPages")
+
+
+def cache_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+    payload = json.dumps({"url": url, "params": params or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CachedResponse:
+    """
+    Ответ, совместимый с requests.Response в объёме, нужном клиенту:
+    status_code, headers, text, json().
+
+    from_cache: None — ответ из сети, "fresh" — с диска без запроса,
+    "revalidated" — сервер ответил 304.
+    """
+
+    def __init__(self, status_code: int, headers, text: str, elapsed: float = 0.0,
+                 from_cache: Optional[str] = None):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.text = text
+        self.elapsed_seconds = elapsed
+        self.from_cache = from_cache
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class HttpResponseCache:
+    """
+    Хранилище ответов с валидаторами, TTL и LRU-вытеснением.
+
+    Сетевую часть (условный запрос, обработку 304) делает
+    WpRestClient.get_cached(); здесь только диск.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 fresh_seconds: float = DEFAULT_FRESH_SECONDS,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.max_age = max_age
+        self.hits = 0            # Свежие, без запроса
+        self.revalidated = 0     # 304
+        self.misses = 0
+        self.bytes_saved = 0     # Несжатых байт тела, которые не пришлось качать
+        self._store = DiskLRUStore(cache_dir, ".z", max_bytes)
+
+    # ─── Чтение ───
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Запись {status, headers, text, stored, elapsed} или None (нет/устарела/битая)."""
+        # Чтение продлевает жизнь записи при LRU-вытеснении
+        data = self._store.read(key)
+        if data is None:
+            return None
+        try:
+            entry = json.loads(zlib.decompress(data).decode("utf-8"))
+        except (ValueError, zlib.error):
+            return None
+        if time.time() - entry.get("stored", 0) > self.max_age:
+            self.discard(key)
+            return None
+        return entry
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry.get("stored", 0) <= self.fresh_seconds
+
+    @staticmethod
+    def conditional_headers(entry: Dict[str, Any]) -> Dict[str, str]:
+        headers = CaseInsensitiveDict(entry.get("headers", {}))
+        conditional = {}
+        if headers.get("ETag"):
+            conditional["If-None-Match"] = headers["ETag"]
+        if headers.get("Last-Modified"):
+            conditional["If-Modified-Since"] = headers["Last-Modified"]
+        return conditional
+
+    def response(self, entry: Dict[str, Any], from_cache: str) -> CachedResponse:
+        """Ответ из записи; учитывает попадание в статистике."""
+        with self._store.lock:
+            if from_cache == "fresh":
+                self.hits += 1
+            else:
+                self.revalidated += 1
+            self.bytes_saved += len(entry["text"].encode("utf-8"))
+        return CachedResponse(entry["status"], entry["headers"], entry["text"],
+                              entry.get("elapsed", 0.0), from_cache)
+
+    # ─── Запись ───
+    def store(self, key: str, url: str, response, elapsed: float = 0.0, headers=None):
+        """
+        Сохраняет ответ 200 (response: requests.Response или CachedResponse).
+
+        headers: заголовки 304-ответа — обновлённые валидаторы при ревалидации.
+        """
+        kept = {h: response.headers[h] for h in KEPT_HEADERS if h in response.headers}
+        for h in KEPT_HEADERS:
+            if headers is not None and h in headers:
+                kept[h] = headers[h]
+        entry = {
+            "url": url,
+            "status": response.status_code,
+            "headers": kept,
+            "text": response.text,
+            "elapsed": elapsed,
+            "stored": time.time(),
+        }
+        data = zlib.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8"), 6)
+        self._store.write(key, data)
+
+    def count_miss(self):
+        with self._store.lock:
+            self.misses += 1
+
+    def discard(self, key: str):
+        self._store.discard(key)
+
+    def clear(self):
+        self._store.clear()
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    @property
+    def evictions(self) -> int:
+        return self._store.evictions
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._store),
+            "bytes": self._store.size_bytes,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "bytes_saved": self.bytes_saved,
+            "evictions": self._store.evictions,
+        }
@@ -1,26 +1,249 @@
+import json
+import time
+import socket
+import threading
 import requests
 import logging
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_HOST = "http://127.0.0.1:1234"
+
+# Сколько секунд список моделей считается актуальным
+MODEL_LIST_TTL = 60
+
+# Keep-alive соединений в пуле сессии (не меньше параллельных генераций)
+SESSION_POOL_SIZE = 16
+
+# host → (время загрузки, [model_id, ...])
+_model_list_cache = {}
+_model_list_lock = threading.Lock()
+
+
+def make_session(pool_size: int = SESSION_POOL_SIZE) -> requests.Session:
+    """Session с пулом keep-alive соединений на pool_size параллельных запросов."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def list_models(host: str = DEFAULT_HOST, session=None, refresh: bool = False,
+                timeout: float = 10) -> list:
+    """
+    Список model_id сервера; кэшируется на MODEL_LIST_TTL секунд.
+
+    Raises:
+        requests.RequestException: сервер недоступен
+    """
+    now = time.monotonic()
+    with _model_list_lock:
+        cached = _model_list_cache.get(host)
+    if cached and not refresh and now - cached[0] < MODEL_LIST_TTL:
+        return list(cached[1])
+
+    resp = (session or requests).get(f"{host}/v1/models", timeout=timeout)
+    resp.raise_for_status()
+    models = [m.get("id", "") for m in resp.json().get("data", []) if m.get("id")]
+    with _model_list_lock:
+        _model_list_cache[host] = (time.monotonic(), models)
+    return list(models)
+
+
+def parse_host(entry: str, model_name: str):
+    """
+    "http://b:8080 qwen2.5-7b" → ("http://b:8080", "qwen2.5-7b").
+
+    Модель после пробела — если сервер называет её иначе (llama.cpp);
+    без неё — model_name.
+    """
+    host, _, model = entry.strip().partition(" ")
+    return host.rstrip("/"), model.strip() or model_name
+
+
+class GenerationStream:
+    """
+    Потоковая генерация (SSE chat/completions с "stream": true).
+
+    Итерация отдаёт фрагменты текста по мере прихода. Генерация
+    останавливается досрочно при отмене (cancel_event / cancel()),
+    по max_chars или после stop_marker; соединение при этом закрывается,
+    и сервер освобождает слот.
+
+    После завершения: text, tokens, tokens_per_sec, finish_reason
+    ('stop', 'length', 'marker', 'cancelled', 'error'), error.
+    model — модель сервера, который генерирует (в пуле серверы могут
+    называть её по-разному).
+    """
+
+    def __init__(self, response, max_chars=None, stop_marker=None, cancel_event=None,
+                 on_close=None, model=None):
+        self._response = response
+        self.model = model
+        self.max_chars = max_chars
+        self.stop_marker = stop_marker
+        self.cancel_event = cancel_event
+        self.on_close = on_close
+        self._cancelled = False
+
+        self.text = ""
+        self.tokens = 0
+        self.finish_reason = None
+        self.error = None
+        self.started = time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+
+    def cancel(self):
+        """Отмена из любого потока: соединение рвётся сразу, не дожидаясь фрагмента."""
+        self._cancelled = True
+        self._abort()
+
+    def _abort(self):
+        # close() не будит поток, ждущий recv, — сначала shutdown сокета
+        try:
+            self._response.raw._fp.fp.raw._sock.shutdown(socket.SHUT_RDWR)
+        except Exception:
+            pass  # Соединение уже закрыто или его не достать (другой urllib3)
+        self._response.close()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled or (self.cancel_event is not None and self.cancel_event.is_set())
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started
+
+    @property
+    def tokens_per_sec(self) -> float:
+        """Скорость генерации (без времени до первого токена)."""
+        if self.first_token_at is None or self.tokens < 2:
+            return 0.0
+        duration = (self.finished_at or time.perf_counter()) - self.first_token_at
+        return self.tokens / duration if duration > 0 else 0.0
+
+    def __iter__(self):
+        try:
+            for line in self._response.iter_lines():
+                if self.cancelled:
+                    self.finish_reason = "cancelled"
+                    break
+                if not line or not line.startswith(b"data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == b"[DONE]":
+                    break
+
+                chunk = json.loads(payload)
+                usage = chunk.get("usage")
+                if usage and usage.get("completion_tokens"):
+                    self.tokens = usage["completion_tokens"]
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+
+                delta = (choices[0].get("delta") or {}).get("content") or ""
+                if choices[0].get("finish_reason"):
+                    self.finish_reason = choices[0]["finish_reason"]
+                if not delta:
+                    continue
+
+                if self.first_token_at is None:
+                    self.first_token_at = time.perf_counter()
+                self.tokens += 1
+                delta = self._clip(delta)
+                self.text += delta
+                if delta:
+                    yield delta
+                if self.finish_reason in ("length", "marker"):
+                    break
+        except Exception as e:
+            # Оборванное cancel() соединение — не ошибка сервера
+            if self.cancelled:
+                self.finish_reason = "cancelled"
+            else:
+                self.finish_reason = "error"
+                self.error = str(e)
+        finally:
+            self.finished_at = time.perf_counter()
+            if self.finish_reason is None:
+                self.finish_reason = "cancelled" if self.cancelled else "stop"
+            # Закрытие соединения останавливает генерацию на сервере
+            self._response.close()
+            if self.on_close is not None:
+                self.on_close(self)
+
+    def _clip(self, delta: str) -> str:
+        """Обрезает фрагмент по stop_marker / max_chars и помечает остановку."""
+        if self.stop_marker:
+            # Маркер может прийти разрезанным между фрагментами
+            tail = len(self.stop_marker) - 1
+            window = self.text[-tail:] + delta if tail > 0 else delta
+            pos = window.find(self.stop_marker)
+            if pos >= 0:
+                self.finish_reason = "marker"
+                delta = delta[:max(0, pos + len(self.stop_marker) - (len(window) - len(delta)))]
+        if self.max_chars is not None and len(self.text) + len(delta) >= self.max_chars:
+            self.finish_reason = "length"
+            delta = delta[:max(0, self.max_chars - len(self.text))]
+        return delta
+
+    def read(self) -> str:
+        """Дочитывает поток до конца и возвращает весь текст."""
+        for _ in self:
+            pass
+        return self.text
+
 class LMStudioConnector:
-    def __init__(self, model_name="openai/gpt-oss-20b", host="http://127.0.0.1:1234"):
+    """
+    Клиент OpenAI-совместимого API LM Studio.
+
+    Конструктор не ходит в сеть: модель проверяется лениво (при первой
+    генерации) по кэшированному списку моделей, либо явно через load_model().
+    Все запросы идут через одну Session с пулом keep-alive соединений.
+    """
+
+    def __init__(self, model_name="openai/gpt-oss-20b", host=DEFAULT_HOST, validate=False):
         self.model_name = model_name
         self.host = host
-        # Попытка загрузить модель при инициализации
-        self.load_model()
+        # Параметры сэмплирования (temperature, top_p, max_tokens...) — уходят
+        # в каждый запрос и входят в ключ кэша генераций
+        self.params = {}
+        self.session = make_session()
+        self._validated = False
+        self._validate_lock = threading.Lock()
+        if validate:
+            self.load_model()
 
-    def load_model(self):
-        url = f"{self.host}/v1/models"
+    def load_model(self, refresh=False):
+        """Проверяет, что модель есть на сервере (список моделей из кэша, если свежий)."""
         try:
-            resp = requests.get(url, timeout=60)
-            resp.raise_for_status()
-            models = resp.json().get("data", [])
-            available = any(m["id"] == self.model_name for m in models)
-            if not available:
-                raise Exception(f"Model '{self.model_name}' not found on LM Studio server.")
+            models = list_models(self.host, session=self.session, refresh=refresh)
         except Exception as e:
             raise Exception(f"Ошибка загрузки модели: {e}")
+        if self.model_name not in models:
+            raise Exception(f"Ошибка загрузки модели: Model '{self.model_name}' "
+                            f"not found on LM Studio server.")
+        self._validated = True
+
+    def _ensure_model(self):
+        """Ленивая проверка модели — один раз, даже при параллельных генерациях."""
+        if self._validated:
+            return
+        with self._validate_lock:
+            if not self._validated:
+                self.load_model()
+
+    @property
+    def models(self) -> list:
+        """Модели, которые могут ответить на запрос (ключи кэша генераций)."""
+        return [self.model_name]
+
+    def close(self):
+        self.session.close()
 
     def generate_text(self, prompt: str) -> str:
         data = {
@@ -28,11 +251,13 @@ class LMStudioConnector:
             "messages": [
                 {"role": "user", "content": prompt}
             ],
-            "stream": False
+            "stream": False,
+            **self.params
         }
         url = f"{self.host}/v1/chat/completions"
         try:
-            resp = requests.post(url, json=data, timeout=30000)
+            self._ensure_model()
+            resp = self.session.post(url, json=data, timeout=30000)
             resp.raise_for_status()
             rj = resp.json()
             choices = rj.get("choices", [])
@@ -41,3 +266,429 @@ class LMStudioConnector:
             return choices[0]["message"]["content"]
         except Exception as e:
             return f"<ERROR>LM Studio error: {str(e)}"
+
+    def stream_text(self, prompt: str, max_chars=None, stop_marker=None,
+                    cancel_event=None) -> GenerationStream:
+        """
+        Потоковая генерация: возвращает GenerationStream (итерируемый по фрагментам).
+
+        Args:
+            max_chars: Остановить после стольких символов
+            stop_marker: Остановить после этой строки (она остаётся в тексте)
+            cancel_event: threading.Event — отмена из другого потока
+
+        Raises:
+            requests.RequestException: сервер недоступен или вернул ошибку
+            Exception: модели нет на сервере (ленивая проверка)
+        """
+        data = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "stream": True,
+            **self.params
+        }
+        url = f"{self.host}/v1/chat/completions"
+        self._ensure_model()
+        # Таймаут чтения — пауза между фрагментами, а не вся генерация
+        resp = self.session.post(url, json=data, stream=True, timeout=(10, 600))
+        try:
+            resp.raise_for_status()
+        except Exception:
+            resp.close()
+            raise
+        return GenerationStream(resp, max_chars=max_chars, stop_marker=stop_marker,
+                                cancel_event=cancel_event, model=self.model_name)
+
+
+class LLMBackend:
+    """Один сервер пула: коннектор + состояние здоровья + статистика."""
+
+    def __init__(self, connector: LMStudioConnector):
+        self.connector = connector
+        self.outstanding = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.chars = 0
+        self.tokens = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.last_error = None
+
+    @property
+    def host(self) -> str:
+        return self.connector.host
+
+    def available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def stats(self) -> dict:
+        return {
+            "host": self.host,
+            "model": self.connector.model_name,
+            "healthy": self.ejected_until <= time.monotonic(),
+            "outstanding": self.outstanding,
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_seconds": self.busy_seconds / self.completed if self.completed else 0.0,
+            "chars_per_sec": self.chars / self.busy_seconds if self.busy_seconds else 0.0,
+            "tokens": self.tokens,
+            "last_error": self.last_error,
+        }
+
+
+class LLMBackendPool:
+    """
+    Пул OpenAI-совместимых серверов (LM Studio, llama.cpp server...).
+
+    Интерфейс как у LMStudioConnector (generate_text, stream_text, params,
+    model_name), поэтому пул передаётся в BatchGenThread вместо коннектора.
+
+    - Маршрутизация: сервер с наименьшим числом запросов в работе.
+    - Ошибка соединения/HTTP — сервер исключается на EJECT_SECONDS,
+      запрос повторяется на другом (до max_attempts раз). После паузы
+      сервер получает пробный запрос; check_health() возвращает его сразу.
+    - stats(): запросы, ошибки, среднее время и символы/сек по серверам.
+    """
+
+    EJECT_SECONDS = 30
+
+    def __init__(self, connectors, model_name=None, max_attempts=3):
+        if not connectors:
+            raise ValueError("Пул LLM: нет ни одного сервера")
+        self.backends = [LLMBackend(c) for c in connectors]
+        self.model_name = model_name or connectors[0].model_name
+        self.max_attempts = max_attempts
+        self._params = {}
+        self._lock = threading.Lock()
+        self._rr = 0
+
+    @classmethod
+    def from_hosts(cls, hosts, model_name, **kwargs):
+        """
+        hosts: ["http://a:1234", "http://b:8080 qwen2.5-7b", ...] — после пробела
+        можно указать model_id, если сервер называет модель иначе (llama.cpp).
+        """
+        connectors = []
+        for entry in hosts:
+            host, model = parse_host(entry, model_name)
+            connectors.append(LMStudioConnector(model_name=model, host=host))
+        return cls(connectors, model_name=model_name, **kwargs)
+
+    @property
+    def host(self) -> str:
+        return ", ".join(b.host for b in self.backends)
+
+    @property
+    def models(self) -> list:
+        """Модели серверов пула без повторов (model_name — лишь номинальная)."""
+        return list(dict.fromkeys(b.connector.model_name for b in self.backends))
+
+    @property
+    def params(self) -> dict:
+        return self._params
+
+    @params.setter
+    def params(self, value: dict):
+        # Одинаковые параметры сэмплирования на всех серверах
+        self._params = value
+        for backend in self.backends:
+            backend.connector.params = value
+
+    # ─── Выбор сервера ───
+    def _acquire(self, exclude) -> LLMBackend:
+        with self._lock:
+            now = time.monotonic()
+            candidates = [b for b in self.backends if b not in exclude and b.available(now)]
+            if not candidates:
+                # Все исключены — пробуем тот, чья пауза кончится раньше
+                rest = [b for b in self.backends if b not in exclude] or self.backends
+                candidates = [min(rest, key=lambda b: b.ejected_until)]
+            # Наименьшее число запросов в работе; при равенстве — по кругу
+            self._rr += 1
+            n = len(self.backends)
+            backend = min(candidates, key=lambda b: (
+                b.outstanding, (self.backends.index(b) - self._rr) % n))
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend, started, ok, chars=0, tokens=0, error=None):
+        with self._lock:
+            backend.outstanding -= 1
+            if ok:
+                backend.completed += 1
+                backend.busy_seconds += time.monotonic() - started
+                backend.chars += chars
+                backend.tokens += tokens
+                backend.consecutive_failures = 0
+                backend.ejected_until = 0.0
+            else:
+                backend.failed += 1
+                backend.consecutive_failures += 1
+                backend.last_error = error
+                # Повторные ошибки — пауза дольше (до 8×)
+                factor = min(2 ** (backend.consecutive_failures - 1), 8)
+                backend.ejected_until = time.monotonic() + self.EJECT_SECONDS * factor
+                logger.warning(f"LLM-сервер {backend.host} исключён: {error}")
+
+    # ─── Генерация ───
+    def generate_text(self, prompt: str) -> str:
+        tried = []
+        result = "<ERROR>LM Studio error: нет доступных серверов"
+        for _ in range(min(self.max_attempts, len(self.backends))):
+            backend = self._acquire(tried)
+            tried.append(backend)
+            started = time.monotonic()
+            result = backend.connector.generate_text(prompt)
+            if not result.startswith("<ERROR>"):
+                self._release(backend, started, True, chars=len(result))
+                return result
+            self._release(backend, started, False, error=result)
+        return result
+
+    def stream_text(self, prompt: str, max_chars=None, stop_marker=None,
+                    cancel_event=None) -> GenerationStream:
+        """Повтор на другом сервере — только если поток не удалось открыть."""
+        tried = []
+        last_error = None
+        for _ in range(min(self.max_attempts, len(self.backends))):
+            backend = self._acquire(tried)
+            tried.append(backend)
+            started = time.monotonic()
+            try:
+                stream = backend.connector.stream_text(
+                    prompt, max_chars=max_chars, stop_marker=stop_marker,
+                    cancel_event=cancel_event,
+                )
+            except Exception as e:
+                last_error = e
+                self._release(backend, started, False, error=str(e))
+                continue
+
+            def on_close(s, backend=backend, started=started):
+                if s.finish_reason == "error":
+                    self._release(backend, started, False, error=s.error)
+                else:
+                    self._release(backend, started, True, chars=len(s.text), tokens=s.tokens)
+
+            stream.on_close = on_close
+            return stream
+        raise last_error or Exception("Нет доступных LLM-серверов")
+
+    # ─── Здоровье ───
+    def check_health(self) -> int:
+        """
+        Опрашивает /v1/models всех серверов параллельно.
+
+        Returns:
+            Число здоровых серверов
+        """
+        def probe(backend):
+            try:
+                backend.connector.load_model(refresh=True)
+                return backend, None
+            except Exception as e:
+                return backend, str(e)
+
+        threads_results = []
+        threads = [threading.Thread(target=lambda b=b: threads_results.append(probe(b)))
+                   for b in self.backends]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        healthy = 0
+        with self._lock:
+            for backend, error in threads_results:
+                if error is None:
+                    backend.ejected_until = 0.0
+                    backend.consecutive_failures = 0
+                    healthy += 1
+                else:
+                    backend.last_error = error
+                    backend.ejected_until = time.monotonic() + self.EJECT_SECONDS
+        return healthy
+
+    def load_model(self, refresh=False):
+        """Совместимость с LMStudioConnector: нужен хотя бы один здоровый сервер."""
+        if not self.check_health():
+            errors = "; ".join(f"{b.host}: {b.last_error}" for b in self.backends)
+            raise Exception(f"Ни один LLM-сервер недоступен ({errors})")
+
+    def stats(self) -> list:
+        with self._lock:
+            return [b.stats() for b in self.backends]
+
+    def close(self):
+        for backend in self.backends:
+            backend.connector.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ТЕСТ: mock OpenAI-совместимого сервера + замер пропускной способности
+# ─────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    MOCK_MODEL = "mock/model"
+    MOCK_LATENCY = 0.5     # секунд на ответ
+    MOCK_TOKENS = 50       # токенов в потоковом ответе
+    MOCK_SLOTS = 4         # параллельных слотов, как --parallel у LM Studio
+    REQUESTS = 16
+
+    aborted = []
+
+    def start_mock_server(latency=MOCK_LATENCY, parallel=MOCK_SLOTS, broken=False):
+        """Mock-сервер в фоне; broken=True — генерация всегда отвечает 500."""
+        slots = threading.Semaphore(parallel)
+
+        class MockHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive, как у LM Studio
+            disable_nagle_algorithm = True  # иначе keep-alive упирается в delayed ACK
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, payload, status=200):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._send({"data": [{"id": MOCK_MODEL}]})
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if broken:
+                    self._send({"error": "model crashed"}, status=500)
+                    return
+                # Свободных слотов нет — запрос ждёт, как на настоящем сервере
+                with slots:
+                    if not request.get("stream"):
+                        time.sleep(latency)
+                        self._send({"choices": [{"message": {"content": "<h1>T</h1><p>text</p>"}}]})
+                        return
+
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    self.close_connection = True
+                    tokens = ["<h1>T</h1>"] + [f"<p>w{i}</p>" for i in range(MOCK_TOKENS - 2)] + ["[END]"]
+                    try:
+                        for token in tokens:
+                            time.sleep(latency / MOCK_TOKENS)
+                            chunk = {"choices": [{"delta": {"content": token}, "finish_reason": None}]}
+                            self.wfile.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+                            self.wfile.flush()
+                        self.wfile.write(b"data: [DONE]\n\n")
+                    except (BrokenPipeError, ConnectionResetError):
+                        # Клиент закрыл соединение — слот освобождается сразу
+                        aborted.append(1)
+
+        srv = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        return srv, f"http://127.0.0.1:{srv.server_address[1]}"
+
+    server, host = start_mock_server()
+
+    t0 = time.perf_counter()
+    lm = LMStudioConnector(model_name=MOCK_MODEL, host=host)
+    print(f"Конструктор: {(time.perf_counter() - t0) * 1000:.2f} ms (без запросов к серверу)")
+
+    # Новое соединение на каждый запрос против keep-alive Session
+    for name, client in (("requests.get", requests), ("Session", lm.session)):
+        t0 = time.perf_counter()
+        for _ in range(200):
+            client.get(f"{host}/v1/models", timeout=10).json()
+        print(f"{name}: {(time.perf_counter() - t0) / 200 * 1000:.2f} ms на запрос")
+
+    list_models(host, session=lm.session)
+    t0 = time.perf_counter()
+    for _ in range(100):
+        list_models(host, session=lm.session)
+    print(f"list_models из кэша: {(time.perf_counter() - t0) / 100 * 1e6:.1f} µs")
+
+    prompts = [f"prompt {i}" for i in range(REQUESTS)]
+
+    for concurrency in (1, 2, MOCK_SLOTS, MOCK_SLOTS * 2):
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lm.generate_text, prompts))
+        elapsed = time.perf_counter() - t0
+        errors = sum(1 for r in results if r.startswith("<ERROR>"))
+        print(f"concurrency={concurrency}: {REQUESTS} ответов за {elapsed:.2f}s "
+              f"({REQUESTS / elapsed:.1f} req/s), ошибок: {errors}")
+
+    # Потоковая генерация: прогресс, маркер, лимит, отмена
+    stream = lm.stream_text("prompt")
+    for i, piece in enumerate(stream):
+        if i == 0:
+            print(f"stream: первый токен через {stream.first_token_at - stream.started:.3f}s")
+    print(f"stream: {stream.tokens} ток., {stream.tokens_per_sec:.0f} tok/s, "
+          f"finish={stream.finish_reason}, {len(stream.text)} симв.")
+
+    stream = lm.stream_text("prompt", stop_marker="w9</p>")
+    text = stream.read()
+    print(f"stop_marker: finish={stream.finish_reason}, конец текста: {text[-12:]!r}")
+
+    stream = lm.stream_text("prompt", max_chars=100)
+    text = stream.read()
+    print(f"max_chars: finish={stream.finish_reason}, {len(text)} симв.")
+
+    cancel = threading.Event()
+    stream = lm.stream_text("prompt", cancel_event=cancel)
+    for i, piece in enumerate(stream):
+        if i == 5:
+            cancel.set()
+    time.sleep(0.1)
+    print(f"cancel: finish={stream.finish_reason}, {stream.tokens} ток., "
+          f"сервер прервал генерацию: {bool(aborted)}")
+
+    # cancel() из другого потока, пока поток ждёт фрагмент (5 с между токенами)
+    stalled, stalled_host = start_mock_server(latency=MOCK_TOKENS * 5)
+    stream = LMStudioConnector(model_name=MOCK_MODEL, host=stalled_host).stream_text("prompt")
+    threading.Timer(0.2, stream.cancel).start()
+    t0 = time.perf_counter()
+    stream.read()
+    print(f"cancel() из другого потока: finish={stream.finish_reason}, "
+          f"поток закрыт через {time.perf_counter() - t0:.2f}s")
+
+    # Пул: быстрый + медленный + сломанный сервер против одного быстрого
+    fast, fast_host = start_mock_server(latency=0.25)
+    slow, slow_host = start_mock_server(latency=0.5)
+    broken, broken_host = start_mock_server(broken=True)
+    batch = [f"article {i}" for i in range(48)]
+
+    for name, client in (
+        ("один сервер", LMStudioConnector(model_name=MOCK_MODEL, host=fast_host)),
+        ("пул из 3", LLMBackendPool.from_hosts([fast_host, slow_host, broken_host], MOCK_MODEL)),
+    ):
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=12) as pool:
+            results = list(pool.map(client.generate_text, batch))
+        elapsed = time.perf_counter() - t0
+        errors = sum(1 for r in results if r.startswith("<ERROR>"))
+        print(f"{name}: {len(batch)} статей за {elapsed:.2f}s, ошибок: {errors}")
+
+    for st in client.stats():
+        print(f"   {st['host']}: ok={st['completed']} fail={st['failed']} "
+              f"avg={st['avg_seconds']:.2f}s healthy={st['healthy']}")
+    # /v1/models у «сломанного» отвечает — check_health вернёт его в ротацию
+    print(f"   здоровых после check_health: {client.check_health()} из 3")
+
+    stream = client.stream_text("prompt")
+    stream.read()
+    print(f"   поток через пул: finish={stream.finish_reason}, в работе: "
+          f"{sum(st['outstanding'] for st in client.stats())}")
+
+    for srv in (server, fast, slow, broken):
+        srv.shutdown()
@@ -191,6 +191,22 @@ class GiveMeUrlsWorker(QThread):
 
 
 
+class LMStudioWorker(QThread):
+    """Сетевые операции с LM Studio (список моделей, подключение) вне GUI-потока."""
+    done = pyqtSignal(object)
+    error = pyqtSignal(str)
+
+    def __init__(self, fn, parent=None):
+        super().__init__(parent)
+        self.fn = fn
+
+    def run(self):
+        try:
+            self.done.emit(self.fn())
+        except Exception as e:
+            self.error.emit(str(e))
+
+
 class ReplaceTxtWorker(QThread):
     error = pyqtSignal(str)
     finished = pyqtSignal()
@@ -557,6 +573,7 @@ class LinkGeneratorGUI(QWidget):
 
         self.generator = None
         self.lm_studio = None
+        self.lm_worker = None
 
         main_layout = QVBoxLayout(self)
 
@@ -591,6 +608,16 @@ class LinkGeneratorGUI(QWidget):
         model_layout.addWidget(self.load_model_btn)
         main_layout.addLayout(model_layout)
 
+        hosts_layout = QHBoxLayout()
+        hosts_layout.addWidget(QLabel("Серверы LM Studio (через запятую):"))
+        self.hosts_edit = QLineEdit("http://127.0.0.1:1234")
+        self.hosts_edit.setToolTip(
+            "Несколько серверов — запросы распределяются между ними.\n"
+            "После адреса через пробел можно указать model_id этого сервера."
+        )
+        hosts_layout.addWidget(self.hosts_edit)
+        main_layout.addLayout(hosts_layout)
+
         # --- Верхний ряд кнопок ---
         top_h = QHBoxLayout()
 
@@ -865,38 +892,83 @@ class LinkGeneratorGUI(QWidget):
         diag.exec()
 
     def on_connect_lm_studio(self):
-        """Подключение к LM Studio."""
-        from lm_studio_connector import LMStudioConnector
+        """Подключение к LM Studio (проверка модели — в фоне)."""
+        from lm_studio_connector import LMStudioConnector, LLMBackendPool, parse_host
         chosen_model = self.model_combo.currentText()
 
         if not chosen_model or chosen_model.startswith("--"):
             QMessageBox.warning(self, "Ошибка",
                                 "Сначала нажмите 'Обновить модели' и выберите модель из списка!")
             return
+        if self.lm_worker is not None and self.lm_worker.isRunning():
+            return
 
-        try:
-            self.lm_studio = LMStudioConnector(model_name=chosen_model, host="http://127.0.0.1:1234")
-            QMessageBox.information(self, "OK", f"Подключились к LM Studio\nМодель: {chosen_model}")
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка подключения", f"Не удалось подключиться:\n{e}")
-            self.lm_studio = None
+        hosts = self._lm_hosts()
+        if len(hosts) > 1:
+            connector = LLMBackendPool.from_hosts(hosts, chosen_model)
+        else:
+            host, model = parse_host(hosts[0], chosen_model)
+            connector = LMStudioConnector(model_name=model, host=host)
+
+        def validate():
+            # Список моделей обычно уже в кэше после 'Обновить модели'
+            connector.load_model()
+            return connector
+
+        def on_done(lm):
+            self.lm_studio = lm
+            QMessageBox.information(self, "OK", f"Подключились к LM Studio\nМодель: {chosen_model}\n"
+                                                f"Серверы: {lm.host}")
 
-    def fetch_lm_studio_models(self) -> list:
-        """Получает список доступных моделей из LM Studio API."""
-        import requests
+        def on_error(msg):
+            connector.close()
+            self.lm_studio = None
+            QMessageBox.critical(self, "Ошибка подключения", f"Не удалось подключиться:\n{msg}")
+
+        self._run_lm_worker(validate, on_done, on_error)
+
+    def _run_lm_worker(self, fn, on_done, on_error):
+        """Запускает fn в LMStudioWorker; кнопки LM Studio заблокированы до ответа."""
+        self.refresh_models_btn.setEnabled(False)
+        self.load_model_btn.setEnabled(False)
+
+        def finish():
+            self.refresh_models_btn.setEnabled(True)
+            self.load_model_btn.setEnabled(True)
+
+        self.lm_worker = LMStudioWorker(fn, parent=self)
+        self.lm_worker.done.connect(on_done)
+        self.lm_worker.error.connect(on_error)
+        self.lm_worker.finished.connect(finish)
+        self.lm_worker.start()
+
+    def _lm_hosts(self) -> list:
+        """Адреса серверов из поля ввода (пустое поле — сервер по умолчанию)."""
+        from lm_studio_connector import DEFAULT_HOST
+        hosts = [h.strip() for h in self.hosts_edit.text().split(",") if h.strip()]
+        return hosts or [DEFAULT_HOST]
+
+    def fetch_lm_studio_models(self, refresh: bool = True) -> list:
+        """Получает список доступных моделей из LM Studio API (блокирующий вызов)."""
+        from lm_studio_connector import list_models, parse_host
+        # Модели берём с первого сервера — на остальных должна быть та же
+        host, _ = parse_host(self._lm_hosts()[0], "")
         try:
-            resp = requests.get("http://127.0.0.1:1234/v1/models", timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-            models = data.get("data", [])
-            return [m.get("id", "") for m in models if m.get("id")]
+            return list_models(host=host, refresh=refresh)
         except Exception as e:
             logger.warning(f"Не удалось получить модели из LM Studio: {e}")
             return []
 
     def on_refresh_models(self):
-        """Обновляет список моделей в ComboBox."""
-        models = self.fetch_lm_studio_models()
+        """Обновляет список моделей в ComboBox (запрос — в фоне)."""
+        if self.lm_worker is not None and self.lm_worker.isRunning():
+            return
+        self.model_combo.clear()
+        self.model_combo.addItem("-- Загрузка списка моделей... --")
+        self._run_lm_worker(self.fetch_lm_studio_models, self._on_models_loaded,
+                            lambda msg: self._on_models_loaded([]))
+
+    def _on_models_loaded(self, models: list):
         self.model_combo.clear()
         if models:
             for m in models:
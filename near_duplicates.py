@@ -0,0 +1,335 @@
+"""
+near_duplicates.py — Поиск почти одинаковых статей (MinHash + LSH)
+
+Случайный промпт не гарантирует разнообразия: локальная модель пишет
+похожие тексты на разных доменах, а это общий след сетки. Каждый текст
+сжимается в MinHash-подпись множества словных шинглов; доля совпавших
+значений подписей — оценка сходства Жаккара двух текстов.
+
+Принципы:
+1. Поиск за O(1) в среднем: подпись режется на LSH_BANDS полос, ключ
+   таблицы — полоса. Тексты со сходством от ~0.5 почти наверняка
+   совпадают хотя бы в одной полосе; сравниваются только кандидаты
+   из тех же корзин, решение — по оценке Жаккара (≥ min_similarity).
+2. Порог откалиброван по шинглам, а не по битам SimHash: замена 10% слов
+   даёт сходство ≈ 0.57, 20% — ≈ 0.35, у чужих статей ≈ 0. У 64-битного
+   SimHash правка 3% слов уже давала расстояние 9–12, а перефразы — 15+,
+   где индекс по блокам отпечатка перестаёт отсекать кандидатов.
+3. Для существующих страниц берётся текст контейнера статьи (без меню,
+   сайдбаров, футера) — иначе все страницы одной темы «похожи».
+4. Индекс общий для всех сайтов и хранится в JSON; refresh_dir()
+   пересчитывает только изменившиеся файлы (по размеру и mtime).
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import chardet
+from lxml import html as lxml_html
+
+from template_clusters import NUM_PERM, minhash, signature_similarity
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LOGGING
+# ─────────────────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КОНСТАНТЫ
+# ─────────────────────────────────────────────────────────────────────────────
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "near_duplicates.json")
+INDEX_VERSION = 2
+
+SHINGLE_WORDS = 3
+MIN_WORDS = 40              # Короче — подпись ненадёжна, не проверяем
+
+# Полосы LSH (LSH_BANDS * LSH_ROWS == NUM_PERM): вероятность стать
+# кандидатом 1 - (1 - J^4)^16 — 0.64 при J=0.5, 0.89 при 0.6, 0.99 при 0.75
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+DEFAULT_MIN_SIMILARITY = 0.5    # ≈ 10% слов заменено
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Контейнер статьи: первый найденный
+_CONTENT_XPATHS = (
+    "//*[contains(concat(' ', normalize-space(@class), ' '), ' entry-content ')]",
+    "//*[contains(concat(' ', normalize-space(@class), ' '), ' post-content ')]",
+    "//article",
+    "//main",
+    "//body",
+)
+_NOISE_TAGS = ("script", "style", "noscript", "nav", "header", "footer", "aside", "form")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ТЕКСТ И ПОДПИСИ
+# ─────────────────────────────────────────────────────────────────────────────
+def _clean_text(root) -> str:
+    for bad in root.xpath(".//" + " | .//".join(_NOISE_TAGS)):
+        bad.drop_tree()
+    return root.text_content()
+
+
+def fragment_text(fragment: str) -> str:
+    """Текст сгенерированного HTML-фрагмента."""
+    if not fragment or not fragment.strip():
+        return ""
+    try:
+        root = lxml_html.fragment_fromstring(fragment, create_parent="div")
+    except Exception:
+        return fragment
+    return _clean_text(root)
+
+
+def page_text(html_content: str) -> str:
+    """Текст контейнера статьи существующей страницы."""
+    try:
+        doc = lxml_html.document_fromstring(html_content)
+    except Exception:
+        return ""
+    for xpath in _CONTENT_XPATHS:
+        found = doc.xpath(xpath)
+        if found:
+            return _clean_text(found[0])
+    return ""
+
+
+def signature(text: str) -> Optional[Tuple[int, ...]]:
+    """
+    MinHash-подпись множества шинглов из SHINGLE_WORDS слов.
+
+    Returns:
+        Подпись или None, если слов меньше MIN_WORDS
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return None
+
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    return minhash(
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+        for s in shingles
+    )
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ИНДЕКС
+# ─────────────────────────────────────────────────────────────────────────────
+class NearDuplicateIndex:
+    """
+    Индекс подписей всех статей (существующих и сгенерированных).
+
+    Пример:
+    ```python
+    index = NearDuplicateIndex()
+    index.refresh_dir(content_dir)
+    sig = signature(fragment_text(generated))
+    match = index.find(sig, exclude=page_path)
+    if match:
+        other, score = match         # перегенерировать или пометить
+    else:
+        index.add(page_path, sig)
+    index.save()
+    ```
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_INDEX_PATH,
+                 min_similarity: float = DEFAULT_MIN_SIMILARITY):
+        self.path = path
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._docs: Dict[str, Tuple[Tuple[int, ...], Optional[list]]] = {}  # doc_id → (sig, [size, mtime])
+        self._tables: List[Dict[Tuple[int, ...], set]] = [{} for _ in range(LSH_BANDS)]
+        self._dirty = False
+        if path:
+            self._load()
+
+    @staticmethod
+    def _keys(sig: Tuple[int, ...]):
+        for band in range(LSH_BANDS):
+            yield band, sig[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+
+    # ─── Изменение ───
+    def add(self, doc_id: str, sig: Tuple[int, ...], stamp: Optional[list] = None):
+        with self._lock:
+            self._remove(doc_id)
+            self._docs[doc_id] = (sig, stamp)
+            for band, key in self._keys(sig):
+                self._tables[band].setdefault(key, set()).add(doc_id)
+            self._dirty = True
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        entry = self._docs.pop(doc_id, None)
+        if entry is None:
+            return
+        for band, key in self._keys(entry[0]):
+            bucket = self._tables[band].get(key)
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._tables[band][key]
+        self._dirty = True
+
+    # ─── Поиск ───
+    def find(self, sig: Optional[Tuple[int, ...]],
+             exclude: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """Самый похожий документ со сходством ≥ min_similarity: (doc_id, сходство) или None."""
+        if sig is None:
+            return None
+        best = None
+        with self._lock:
+            seen = set()
+            for band, key in self._keys(sig):
+                for doc_id in self._tables[band].get(key, ()):
+                    if doc_id == exclude or doc_id in seen:
+                        continue
+                    seen.add(doc_id)
+                    score = signature_similarity(sig, self._docs[doc_id][0])
+                    if score >= self.min_similarity and (best is None or score > best[1]):
+                        best = (doc_id, score)
+        return best
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # ─── Страницы на диске ───
+    def refresh_dir(self, root_dir: str) -> int:
+        """
+        Пересчитывает подписи HTML-страниц каталога (только изменённые),
+        удалённые страницы убирает из индекса.
+
+        Returns:
+            Сколько страниц пересчитано
+        """
+        root_dir = os.path.abspath(root_dir)
+        present = set()
+        updated = 0
+        for dirpath, dirs, files in os.walk(root_dir):
+            for fname in files:
+                if not fname.lower().endswith((".html", ".htm")):
+                    continue
+                path = os.path.join(dirpath, fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                present.add(path)
+                stamp = [st.st_size, st.st_mtime]
+                entry = self._docs.get(path)
+                if entry is not None and entry[1] == stamp:
+                    continue
+                try:
+                    with open(path, "rb") as f:
+                        raw = f.read()
+                except OSError:
+                    continue
+                enc = chardet.detect(raw).get("encoding") or "utf-8"
+                sig = signature(page_text(raw.decode(enc, errors="replace")))
+                if sig is None:
+                    self.remove(path)
+                else:
+                    self.add(path, sig, stamp)
+                updated += 1
+
+        prefix = root_dir + os.sep
+        for doc_id in [d for d in self._docs if d.startswith(prefix) and d not in present]:
+            self.remove(doc_id)
+        return updated
+
+    # ─── Хранение ───
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != INDEX_VERSION:
+            return
+        for doc_id, (sig_hex, stamp) in data.get("docs", {}).items():
+            raw = bytes.fromhex(sig_hex)
+            sig = tuple(int.from_bytes(raw[i:i + 4], "big") for i in range(0, len(raw), 4))
+            if len(sig) == NUM_PERM:
+                self.add(doc_id, sig, stamp)
+        self._dirty = False
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            payload = {
+                "version": INDEX_VERSION,
+                "docs": {d: [b"".join(v.to_bytes(4, "big") for v in sig).hex(), stamp]
+                         for d, (sig, stamp) in self._docs.items()},
+            }
+            self._dirty = False
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить индекс дублей: {e}")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ТЕСТ
+# ─────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    import time
+    import random
+
+    rnd = random.Random(1)
+    vocab = [f"w{i}" for i in range(5000)]
+
+    def article(n=400):
+        return [rnd.choice(vocab) for _ in range(n)]
+
+    def edit(words, share):
+        words = list(words)
+        for i in rnd.sample(range(len(words)), int(len(words) * share)):
+            words[i] = rnd.choice(vocab)
+        return " ".join(words)
+
+    def jaccard(a, b):
+        sa = {" ".join(a[i:i + SHINGLE_WORDS]) for i in range(len(a) - SHINGLE_WORDS + 1)}
+        sb = {" ".join(b[i:i + SHINGLE_WORDS]) for i in range(len(b) - SHINGLE_WORDS + 1)}
+        return len(sa & sb) / len(sa | sb)
+
+    # Калибровка: правки 3–30% слов, доля найденных при пороге по умолчанию
+    originals = [article() for _ in range(200)]
+    index = NearDuplicateIndex(path=None)
+    for i, words in enumerate(originals):
+        index.add(f"doc{i}", signature(" ".join(words)))
+    for share in (0.03, 0.05, 0.10, 0.15, 0.20, 0.30):
+        edits = [edit(words, share) for words in originals]
+        exact = sum(jaccard(w, e.split()) for w, e in zip(originals, edits)) / len(edits)
+        found = sum(1 for i, e in enumerate(edits) if (index.find(signature(e)) or ("",))[0] == f"doc{i}")
+        print(f"Правка {share:.0%} слов: Жаккар {exact:.2f}, найдено {found / len(edits):.0%}")
+    unrelated = sum(1 for _ in range(200) if index.find(signature(" ".join(article()))))
+    print(f"Чужие статьи приняты за дубль: {unrelated} из 200")
+
+    t0 = time.perf_counter()
+    corpus = [" ".join(article()) for _ in range(2000)]
+    t1 = time.perf_counter()
+    sigs = [signature(text) for text in corpus]
+    t2 = time.perf_counter()
+    print(f"Подпись: {(t2 - t1) / len(corpus) * 1000:.2f} ms на статью из 400 слов")
+
+    # Добиваем до 50k подписей: поиск не должен замедлиться
+    for i in range(48_000):
+        index.add(f"rnd{i}", tuple(rnd.getrandbits(32) for _ in range(NUM_PERM)))
+    t0 = time.perf_counter()
+    for sig in sigs[:1000]:
+        index.find(sig)
+    t1 = time.perf_counter()
+    print(f"Индекс {len(index)} подписей: поиск {(t1 - t0) / 1000 * 1e6:.0f} µs")
@@ -10,7 +10,7 @@ import csv
 import re
 import time
 from datetime import datetime
-from urllib.parse import urlparse, urljoin
+from urllib.parse import urlparse
 from styles import Styles
 import requests
 import urllib3
@@ -20,10 +20,14 @@ from PyQt6.QtWidgets import (
     QDialog, QVBoxLayout, QTableView, QPushButton, QHBoxLayout,
     QLabel, QHeaderView, QFileDialog, QMessageBox, QTextEdit,
     QSplitter, QTabWidget, QWidget, QCheckBox, QProgressBar,
-    QLineEdit, QGroupBox, QGridLayout, QApplication
+    QLineEdit, QGroupBox, QGridLayout, QApplication, QSpinBox
 )
 from bs4 import BeautifulSoup
 from grabber import UrlGrabberDialog
+from wp_rest_client import WpRestClient, DEFAULT_CONCURRENCY, DEFAULT_MAX_PAGES
+from http_cache import HttpResponseCache
+from pbn_snapshots import SnapshotStore
+from post_metrics import PostMetricsPool
 
 # Отключаем предупреждения SSL
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -237,62 +241,98 @@ class PbnTableModel(QAbstractTableModel):
 # API WORKER — Загрузка данных с WP REST API
 # =============================================================================
 class PbnApiWorker(QThread):
-    """Загружает данные с WordPress REST API"""
+    """
+    Загружает данные с WordPress REST API.
+
+    Домены обрабатываются параллельно через WpRestClient (общий пул
+    соединений, лимит на хост, таймауты и повторы); каждый готовый домен
+    сразу уходит сигналом domain_finished. Разбор контента (слова, OBL,
+    ссылки) — lxml в пуле процессов (PostMetricsPool).
+
+    incremental=True: при наличии снимка прошлого анализа (SnapshotStore)
+    запрашивается только список id + modified, полный контент — для
+    новых и изменившихся записей; inlinks и score пересчитываются.
+    """
     finished = pyqtSignal(dict, dict)
     progress = pyqtSignal(str)
+    domain_finished = pyqtSignal(str, list)  # домен, [PbnPageData] (может быть пустым)
 
-    def __init__(self, domains, fetch_posts=True, fetch_pages=True, fetch_categories=False):
+    def __init__(self, domains, fetch_posts=True, fetch_pages=True, fetch_categories=False,
+                 concurrency=DEFAULT_CONCURRENCY, use_cache=True, incremental=True,
+                 max_pages=DEFAULT_MAX_PAGES):
         super().__init__()
         self.domains = domains
         self.fetch_posts = fetch_posts
         self.fetch_pages = fetch_pages
         self.fetch_categories = fetch_categories
-        self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+        self.concurrency = concurrency
+        self.use_cache = use_cache
+        self.incremental = incremental
+        self.max_pages = max_pages
+        self.snapshots = SnapshotStore()
+        self.client = None
+        self.metrics_pool = None
         self._stop_flag = False
 
     def stop(self):
         self._stop_flag = True
 
-    def _fetch_json(self, domain, endpoint, max_pages=3):
-        """Универсальный метод получения JSON из WP API"""
-        results = []
-        page = 1
-        base_url = f"https://{domain}/wp-json/wp/v2/{endpoint}"
+    def _is_stopped(self):
+        return self._stop_flag
 
-        while page <= max_pages:
-            if self._stop_flag:
-                break
-            try:
-                url = f"{base_url}?per_page=100&page={page}"
-                start_time = time.time()
-                r = requests.get(
-                    url,
-                    headers={"User-Agent": self.user_agent},
-                    timeout=15,
-                    verify=False
-                )
-                response_time = time.time() - start_time
-
-                if r.status_code != 200:
-                    break
-
-                data = r.json()
-                if not data or not isinstance(data, list):
-                    break
-
-                # Добавляем время ответа к каждому элементу
-                for item in data:
-                    item['_response_time'] = response_time
-                    item['_has_ssl'] = base_url.startswith('https')
-
-                results.extend(data)
-                if len(data) < 100:
-                    break
-                page += 1
-            except Exception as e:
-                print(f"API Error [{domain}/{endpoint}]: {e}")
-                break
-        return results
+    def _fetch_json(self, domain, endpoint, params=None):
+        """Универсальный метод получения JSON из WP API (до max_pages страниц по 100)"""
+        return self.client.fetch_collection(domain, endpoint, max_pages=self.max_pages,
+                                            is_cancelled=self._is_stopped, params=params)
+
+    def _collect_items(self, domain, endpoint, known, stats):
+        """
+        Метрики записей эндпоинта: {id: метрики} в порядке API.
+
+        known — записи из снимка; если он есть, сначала запрашивается лёгкий
+        список (_fields=id,modified), полный контент — только для изменившихся.
+        """
+        if not known:
+            items = self._fetch_json(domain, endpoint)
+            return self._metrics_by_id(items)
+
+        listing = self._fetch_json(domain, endpoint, params={"_fields": "id,modified"})
+        result = {}
+        changed = []
+        for item in listing:
+            id_ = self._item_key(item)
+            if 'content' in item:
+                # Сервер не поддерживает _fields — полный ответ уже получен
+                result.update(self._metrics_by_id([item]))
+                continue
+            old = known.get(id_)
+            if old is not None and old.get('modified') == item.get('modified'):
+                result[id_] = old
+                stats['reused'] += 1
+            else:
+                changed.append(id_)
+
+        for start in range(0, len(changed), 100):
+            chunk = changed[start:start + 100]
+            items = self.client.fetch_collection(domain, endpoint, max_pages=1,
+                                                 params={"include": ",".join(chunk)},
+                                                 is_cancelled=self._is_stopped)
+            result.update(self._metrics_by_id(items))
+            stats['refetched'] += len(items)
+
+        order = [self._item_key(item) for item in listing]
+        return {id_: result[id_] for id_ in order if id_ in result}
+
+    @staticmethod
+    def _item_key(item):
+        return str(item.get('id', item.get('link', '')))
+
+    def _metrics_by_id(self, items):
+        result = {}
+        for item, metrics in zip(items, self.metrics_pool.map(items)):
+            if metrics is not None:
+                result[self._item_key(item)] = metrics
+        return result
 
     def _clean_url(self, url):
         return url.strip().rstrip('/')
@@ -300,12 +340,7 @@ class PbnApiWorker(QThread):
     def _check_robots_txt(self, domain):
         """Проверяем robots.txt на наличие Disallow: /"""
         try:
-            r = requests.get(
-                f"https://{domain}/robots.txt",
-                headers={"User-Agent": self.user_agent},
-                timeout=5,
-                verify=False
-            )
+            r = self.client.get(f"https://{domain}/robots.txt", timeout=5)
             if r.status_code == 200:
                 content = r.text.lower()
                 # Грубая проверка на полную блокировку
@@ -322,137 +357,132 @@ class PbnApiWorker(QThread):
 
     def run(self):
         final_results_by_domain = {}
-        stats = {'posts': 0, 'pages': 0, 'categories': 0}
-
-        total_domains = len(self.domains)
-
-        for i, domain in enumerate(self.domains):
-            if self._stop_flag:
-                break
+        stats = {'posts': 0, 'pages': 0, 'categories': 0, 'reused': 0, 'refetched': 0}
 
+        domains = []
+        for domain in self.domains:
             domain = domain.strip().replace("http://", "").replace("https://", "").strip("/")
-            if not domain:
-                continue
+            if domain and domain not in domains:
+                domains.append(domain)
+        total_domains = len(domains)
 
-            self.progress.emit(f"[{i + 1}/{total_domains}] Анализ: {domain}...")
+        cache = HttpResponseCache() if self.use_cache else None
+        self.client = WpRestClient(concurrency=self.concurrency, cache=cache)
+        self.metrics_pool = PostMetricsPool()
+        try:
+            results = self.client.map_domains(self._analyze_domain, domains, is_cancelled=self._is_stopped)
+            for i, (domain, result, error) in enumerate(results, 1):
+                if error is not None:
+                    print(f"Error processing {domain}: {error}")
+                    result = ([], {})
+                domain_pages_data, domain_stats = result
+                for key, value in domain_stats.items():
+                    stats[key] += value
+
+                if domain_pages_data and not self._stop_flag:
+                    final_results_by_domain[domain] = domain_pages_data
+                self.progress.emit(f"[{i}/{total_domains}] Готово: {domain} ({len(domain_pages_data)} стр.)")
+                self.domain_finished.emit(domain, domain_pages_data)
+        finally:
+            self.client.close()
+            self.metrics_pool.close()
+
+        if cache is not None:
+            cache_stats = cache.stats()
+            stats['cached'] = cache_stats['hits'] + cache_stats['revalidated']
+            stats['saved_mb'] = cache_stats['bytes_saved'] / (1024 * 1024)
+        stats['downloaded_mb'] = self.client.bytes_downloaded / (1024 * 1024)
+        stats['posts_per_sec'] = self.metrics_pool.posts_per_sec()
+        self.finished.emit(final_results_by_domain, stats)
 
-            domain_pages_data = []
-            internal_links_graph = []
-            url_to_page_map = {}
+    def _analyze_domain(self, domain):
+        """Один домен целиком (в пуле потоков): (страницы, статистика домена)."""
+        stats = {'posts': 0, 'pages': 0, 'categories': 0, 'reused': 0, 'refetched': 0}
+        domain_pages_data = []
+        internal_links_graph = []
+        url_to_page_map = {}
 
-            try:
-                # Проверяем robots.txt
-                robots_blocked = self._check_robots_txt(domain)
-
-                # 1. Posts
-                if self.fetch_posts:
-                    posts = self._fetch_json(domain, "posts")
-                    self._process_items(
-                        domain, "post", posts, domain_pages_data,
-                        internal_links_graph, url_to_page_map, stats, robots_blocked
-                    )
-
-                # 2. Pages
-                if self.fetch_pages:
-                    pages = self._fetch_json(domain, "pages")
-                    self._process_items(
-                        domain, "page", pages, domain_pages_data,
-                        internal_links_graph, url_to_page_map, stats, robots_blocked
-                    )
-
-                # 3. Categories
-                if self.fetch_categories:
-                    categories = self._fetch_json(domain, "categories")
-                    self._process_categories(
-                        domain, categories, domain_pages_data, stats, robots_blocked
-                    )
-
-                # 4. Расчёт Inlinks
-                for src, target in internal_links_graph:
-                    if target in url_to_page_map and src != target:
-                        url_to_page_map[target].inlinks += 1
-
-                # 5. Расчёт Score
-                for p in domain_pages_data:
-                    score = (p.word_count / 1000.0) + (p.inlinks * 3.0) - (p.obl * 5.0)
-                    # Бонус за SSL
-                    if p.has_ssl:
-                        score += 1.0
-                    # Штраф за robots блокировку
-                    if p.robots_blocked:
-                        score -= 10.0
-                    # Штраф за медленный ответ
-                    if p.response_time > 3.0:
-                        score -= 2.0
-                    p.score = round(score, 2)
-
-                # Сортировка
-                domain_pages_data.sort(key=lambda x: x.score, reverse=True)
-
-                if domain_pages_data:
-                    final_results_by_domain[domain] = domain_pages_data
+        if self._stop_flag:
+            return domain_pages_data, stats
 
-            except Exception as e:
-                print(f"Error processing {domain}: {e}")
-                continue
+        # Проверяем robots.txt
+        robots_blocked = self._check_robots_txt(domain)
 
-        self.finished.emit(final_results_by_domain, stats)
+        snapshot = (self.snapshots.load(domain) or {}) if self.incremental else {}
+        collected = {}
 
-    def _process_items(self, domain, p_type, items, data_list, graph, mapper, stats, robots_blocked):
-        """Обработка постов/страниц"""
-        for item in items:
-            try:
-                url = item.get('link', '')
-                title_data = item.get('title', {})
-                title = title_data.get('rendered', 'No Title') if isinstance(title_data, dict) else str(title_data)
-                content = item.get('content', {}).get('rendered', '')
+        # 1. Posts, 2. Pages
+        for enabled, endpoint, p_type in ((self.fetch_posts, "posts", "post"),
+                                          (self.fetch_pages, "pages", "page")):
+            if not enabled:
+                continue
+            items = self._collect_items(domain, endpoint, snapshot.get(endpoint), stats)
+            if items:
+                collected[endpoint] = items
+            self._process_items(
+                domain, p_type, items.values(), domain_pages_data,
+                internal_links_graph, url_to_page_map, stats, robots_blocked
+            )
 
-                if not url:
-                    continue
+        # Пустой ответ (сайт недоступен) не затирает прошлый снимок
+        if collected and not self._stop_flag:
+            self.snapshots.save(domain, collected)
 
-                stats[p_type + 's'] += 1
-
-                # Парсим контент
-                soup = BeautifulSoup(content, 'html.parser')
-                text = soup.get_text(separator=' ', strip=True)
-                word_count = len(text.split())
-
-                # Считаем внешние ссылки
-                obl = 0
-                links = soup.find_all('a', href=True)
-                for link in links:
-                    href = link['href'].strip()
-                    if not href or href.startswith('#'):
-                        continue
-                    abs_href = urljoin(url, href)
-
-                    ph = urlparse(abs_href)
-                    pb = urlparse(url)
-
-                    if ph.netloc and ph.netloc.replace('www.', '') != pb.netloc.replace('www.', ''):
-                        obl += 1
-                    else:
-                        graph.append((self._clean_url(url), self._clean_url(abs_href)))
-
-                # Создаём объект
-                obj = PbnPageData(domain, p_type, url, title, word_count, obl)
-                obj.response_time = item.get('_response_time', 0)
-                obj.has_ssl = item.get('_has_ssl', True)
-                obj.robots_blocked = robots_blocked
+        # 3. Categories
+        if self.fetch_categories:
+            categories = self._fetch_json(domain, "categories")
+            self._process_categories(
+                domain, categories, domain_pages_data, stats, robots_blocked
+            )
 
-                # Last Modified
-                modified = item.get('modified', item.get('date', ''))
-                if modified:
-                    try:
-                        obj.last_modified = datetime.fromisoformat(modified.replace('Z', '+00:00'))
-                    except:
-                        pass
+        # 4. Расчёт Inlinks
+        for src, target in internal_links_graph:
+            if target in url_to_page_map and src != target:
+                url_to_page_map[target].inlinks += 1
+
+        # 5. Расчёт Score
+        for p in domain_pages_data:
+            score = (p.word_count / 1000.0) + (p.inlinks * 3.0) - (p.obl * 5.0)
+            # Бонус за SSL
+            if p.has_ssl:
+                score += 1.0
+            # Штраф за robots блокировку
+            if p.robots_blocked:
+                score -= 10.0
+            # Штраф за медленный ответ
+            if p.response_time > 3.0:
+                score -= 2.0
+            p.score = round(score, 2)
+
+        # Сортировка
+        domain_pages_data.sort(key=lambda x: x.score, reverse=True)
+        return domain_pages_data, stats
 
-                data_list.append(obj)
-                mapper[self._clean_url(url)] = obj
-            except Exception as e:
-                print(f"Item processing error: {e}")
-                pass
+    def _process_items(self, domain, p_type, items, data_list, graph, mapper, stats, robots_blocked):
+        """Обработка постов/страниц (items — метрики из post_metrics.item_metrics)"""
+        for m in items:
+            url = m['link']
+            stats[p_type + 's'] += 1
+
+            for target in m['links']:
+                graph.append((self._clean_url(url), target))
+
+            # Создаём объект
+            obj = PbnPageData(domain, p_type, url, m['title'], m['word_count'], m['obl'])
+            obj.response_time = m['response_time']
+            obj.has_ssl = m['has_ssl']
+            obj.robots_blocked = robots_blocked
+
+            # Last Modified
+            modified = m['modified']
+            if modified:
+                try:
+                    obj.last_modified = datetime.fromisoformat(modified.replace('Z', '+00:00'))
+                except:
+                    pass
+
+            data_list.append(obj)
+            mapper[self._clean_url(url)] = obj
 
     def _process_categories(self, domain, categories, data_list, stats, robots_blocked):
         """Обработка категорий"""
@@ -746,6 +776,42 @@ class PbnAnalyzerDialog(QDialog):
         settings_layout.addWidget(self.cb_pages, 0, 1)
         settings_layout.addWidget(self.cb_categories, 0, 2)
 
+        settings_layout.addWidget(QLabel("Потоков:"), 2, 0)
+        self.spin_concurrency = QSpinBox()
+        self.spin_concurrency.setRange(1, 64)
+        self.spin_concurrency.setValue(DEFAULT_CONCURRENCY)
+        self.spin_concurrency.setToolTip(
+            "Сколько запросов к WP API идёт одновременно (всего).\n"
+            "К одному сайту — не больше 2 одновременно."
+        )
+        settings_layout.addWidget(self.spin_concurrency, 2, 1)
+
+        self.cb_cache = QCheckBox("💾 HTTP-кэш")
+        self.cb_cache.setChecked(True)
+        self.cb_cache.setToolTip(
+            "Ответы WP API хранятся на диске: повторный анализ берёт их\n"
+            "без загрузки (10 минут) или условным запросом (ETag / Last-Modified)."
+        )
+        settings_layout.addWidget(self.cb_cache, 2, 2)
+
+        self.cb_incremental = QCheckBox("♻ Инкрементально")
+        self.cb_incremental.setChecked(True)
+        self.cb_incremental.setToolTip(
+            "Если домен уже анализировался — запрашивается только список id и дат\n"
+            "изменения, полный контент — для новых и изменённых записей."
+        )
+        settings_layout.addWidget(self.cb_incremental, 3, 0)
+
+        settings_layout.addWidget(QLabel("Макс. страниц API:"), 3, 1)
+        self.spin_max_pages = QSpinBox()
+        self.spin_max_pages.setRange(1, 1000)
+        self.spin_max_pages.setValue(DEFAULT_MAX_PAGES)
+        self.spin_max_pages.setToolTip(
+            "Сколько страниц по 100 записей брать из каждой коллекции.\n"
+            "Страницы после первой загружаются параллельно."
+        )
+        settings_layout.addWidget(self.spin_max_pages, 3, 2)
+
         # Кнопка запуска
         self.btn_run = QPushButton("🚀 АНАЛИЗ")
         self.btn_run.setStyleSheet(
@@ -856,14 +922,22 @@ class PbnAnalyzerDialog(QDialog):
         self.results_cache = {}
         self.table_models = {}
         self.stats_lbl.setText("Запуск воркера...")
+        self.progress_bar.setRange(0, len(domains))
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
 
         self.worker = PbnApiWorker(
             domains,
             fetch_posts=self.cb_posts.isChecked(),
             fetch_pages=self.cb_pages.isChecked(),
-            fetch_categories=self.cb_categories.isChecked()
+            fetch_categories=self.cb_categories.isChecked(),
+            concurrency=self.spin_concurrency.value(),
+            use_cache=self.cb_cache.isChecked(),
+            incremental=self.cb_incremental.isChecked(),
+            max_pages=self.spin_max_pages.value()
         )
         self.worker.progress.connect(self.stats_lbl.setText)
+        self.worker.domain_finished.connect(self._on_domain_finished)
         self.worker.finished.connect(self._on_analysis_finished)
         self.worker.start()
 
@@ -877,13 +951,33 @@ class PbnAnalyzerDialog(QDialog):
         self.progress_bar.setVisible(False)
         self.stats_lbl.setText("Остановлено.")
 
+    def _on_domain_finished(self, domain, data_list):
+        """Вкладка домена появляется сразу, не дожидаясь остальных."""
+        self.progress_bar.setValue(self.progress_bar.value() + 1)
+        if not data_list or domain in self.table_models:
+            return
+        self.results_cache[domain] = data_list
+        self._create_tab(domain, data_list)
+        self.btn_export.setEnabled(True)
+        self.btn_grab.setEnabled(True)
+        self.btn_check_index.setEnabled(True)
+        self.btn_check_all_index.setEnabled(True)
+
     def _on_analysis_finished(self, results, stats):
         self.results_cache = results
+        self.progress_bar.setVisible(False)
 
         info_text = (
             f"ГОТОВО. | Posts: {stats['posts']} | "
             f"Pages: {stats['pages']} | Categories: {stats['categories']}"
+            f" | Загружено: {stats.get('downloaded_mb', 0):.1f} МБ"
         )
+        if stats.get('cached'):
+            info_text += f" | Из кэша: {stats['cached']} ({stats['saved_mb']:.1f} МБ)"
+        if stats.get('posts_per_sec'):
+            info_text += f" | Разбор: {stats['posts_per_sec']:.0f} постов/с"
+        if stats.get('reused'):
+            info_text += f" | Из снимка: {stats['reused']}, обновлено: {stats['refetched']}"
         self.stats_lbl.setText(info_text)
 
         if not results:
@@ -895,9 +989,10 @@ class PbnAnalyzerDialog(QDialog):
             self.btn_stop.setEnabled(False)
             return
 
-        # Создаём вкладки
+        # Вкладки уже созданы по domain_finished; добираем пропущенные
         for domain, data_list in results.items():
-            self._create_tab(domain, data_list)
+            if domain not in self.table_models:
+                self._create_tab(domain, data_list)
 
         self.btn_run.setEnabled(True)
         self.btn_stop.setEnabled(False)
@@ -0,0 +1,101 @@
+"""
+pbn_snapshots.py — Снимки прошлого анализа PBN-доменов
+
+Ежедневный повторный анализ 200 доменов не должен заново качать и
+разбирать весь rendered-контент. После анализа по каждому домену
+сохраняются метрики постов/страниц (без HTML); при следующем запуске
+API спрашивается только о списке id + modified, а полный контент
+загружается для новых и изменившихся записей.
+
+Принципы:
+1. Один JSON-файл на домен, запись атомарная (tmp + os.replace).
+2. В снимке — то, из чего пересчитываются inlinks и score: ссылка,
+   заголовок, число слов, OBL, внутренние ссылки, modified, время ответа.
+3. Эндпоинты, которые в этом запуске не запрашивались, сохраняются
+   из прошлого снимка без изменений.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+from typing import Dict, Optional
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LOGGING
+# ─────────────────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КОНСТАНТЫ
+# ─────────────────────────────────────────────────────────────────────────────
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pbn_snapshots")
+SNAPSHOT_VERSION = 1
+
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class SnapshotStore:
+    """
+    Хранилище снимков: {endpoint: {id: метрики}} на домен.
+
+    Пример:
+    ```python
+    store = SnapshotStore()
+    snapshot = store.load(domain) or {}
+    known = snapshot.get("posts", {})
+    ...
+    store.save(domain, {"posts": {id_: metrics, ...}})
+    ```
+    """
+
+    def __init__(self, root: str = DEFAULT_SNAPSHOT_DIR):
+        self.root = root
+
+    def _path(self, domain: str) -> str:
+        return os.path.join(self.root, _UNSAFE_RE.sub("_", domain.lower()) + ".json")
+
+    def load(self, domain: str) -> Optional[Dict[str, Dict[str, dict]]]:
+        """Эндпоинты снимка или None, если снимка нет (или он другой версии)."""
+        try:
+            with open(self._path(domain), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != SNAPSHOT_VERSION or data.get("domain") != domain:
+            return None
+        return data.get("endpoints", {})
+
+    def updated_at(self, domain: str) -> Optional[float]:
+        try:
+            with open(self._path(domain), "r", encoding="utf-8") as f:
+                return json.load(f).get("updated")
+        except (OSError, ValueError):
+            return None
+
+    def save(self, domain: str, endpoints: Dict[str, Dict[str, dict]]):
+        """Сохраняет эндпоинты, остальные берёт из прошлого снимка."""
+        merged = self.load(domain) or {}
+        merged.update(endpoints)
+        payload = {
+            "version": SNAPSHOT_VERSION,
+            "domain": domain,
+            "updated": time.time(),
+            "endpoints": merged,
+        }
+        path = self._path(domain)
+        tmp_path = path + ".tmp"
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить снимок {domain}: {e}")
+
+    def remove(self, domain: str):
+        try:
+            os.remove(self._path(domain))
+        except OSError:
+            pass
@@ -0,0 +1,278 @@
+"""
+post_metrics.py — Метрики постов WP REST API (слова, OBL, внутренние ссылки)
+
+На 30k постов разбор rendered-контента через BeautifulSoup(html.parser)
+и два urlparse на каждую ссылку становится узким местом, как только
+загрузка идёт параллельно. Здесь тот же результат считает lxml,
+а пачки постов разбираются в пуле процессов.
+
+Принципы:
+1. item_metrics() — чистая функция уровня модуля: её можно отдать
+   в ProcessPoolExecutor, модуль не тянет PyQt.
+2. URL поста разбирается один раз, хост нормализуется один раз;
+   urljoin нужен только для внутренних ссылок (ребро графа).
+3. В процесс уходит только нужная часть ответа API (без excerpt, _links
+   и прочего) — меньше pickle-трафика.
+4. Маленькие пачки считаются на месте: запуск задачи дороже разбора.
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, List, Optional
+from urllib.parse import urljoin, urlsplit
+
+from lxml import etree, html as lxml_html
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LOGGING
+# ─────────────────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КОНСТАНТЫ
+# ─────────────────────────────────────────────────────────────────────────────
+MIN_POOL_BATCH = 16          # Меньше — разбираем в вызывающем потоке
+CHUNK_SIZE = 32              # Постов на одну задачу пула
+
+# Поля ответа API, нужные для метрик
+_ITEM_FIELDS = ("id", "link", "title", "content", "modified", "date", "_response_time", "_has_ssl")
+
+_PARSER = lxml_html.HTMLParser(remove_comments=True, remove_pis=True)
+_TEXT_XPATH = etree.XPath("//text()[not(ancestor::script) and not(ancestor::style)]")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# РАЗБОР
+# ─────────────────────────────────────────────────────────────────────────────
+def _host(netloc: str) -> str:
+    return netloc.lower().replace("www.", "")
+
+
+def _clean_url(url: str) -> str:
+    return url.strip().rstrip("/")
+
+
+def content_metrics(content: str, url: str):
+    """
+    (число слов, внешние ссылки, [внутренние ссылки]) rendered-контента.
+
+    Внутренние — абсолютные URL без завершающего слэша (ребра графа inlinks).
+    """
+    if not content or not content.strip():
+        return 0, 0, []
+    try:
+        root = lxml_html.fragment_fromstring(content, create_parent="div", parser=_PARSER)
+    except (etree.ParserError, ValueError):
+        return 0, 0, []
+
+    word_count = len(" ".join(_TEXT_XPATH(root)).split())
+
+    base_host = _host(urlsplit(url).netloc)
+    obl = 0
+    internal = []
+    for a in root.iter("a"):
+        href = a.get("href")
+        if href is None:
+            continue
+        href = href.strip()
+        if not href or href.startswith("#"):
+            continue
+        # Относительные ссылки и mailto: и т. п. хоста не имеют — внутренние
+        netloc = urlsplit(href).netloc
+        if netloc and _host(netloc) != base_host:
+            obl += 1
+        else:
+            internal.append(_clean_url(urljoin(url, href)))
+    return word_count, obl, internal
+
+
+def item_metrics(item: dict) -> Optional[dict]:
+    """Метрики поста/страницы из ответа API или None (нет ссылки / битый элемент)."""
+    try:
+        url = item.get("link", "")
+        if not url:
+            return None
+        title_data = item.get("title", {})
+        title = title_data.get("rendered", "No Title") if isinstance(title_data, dict) else str(title_data)
+        content = (item.get("content") or {}).get("rendered", "")
+
+        word_count, obl, internal = content_metrics(content, url)
+        return {
+            "link": url,
+            "title": title,
+            "modified": item.get("modified", item.get("date", "")),
+            "word_count": word_count,
+            "obl": obl,
+            "links": internal,
+            "response_time": item.get("_response_time", 0),
+            "has_ssl": item.get("_has_ssl", True),
+        }
+    except Exception as e:
+        logger.warning(f"Item processing error: {e}")
+        return None
+
+
+def slim_item(item: dict) -> dict:
+    return {k: item[k] for k in _ITEM_FIELDS if k in item}
+
+
+def _metrics_chunk(items: List[dict]) -> List[Optional[dict]]:
+    return [item_metrics(item) for item in items]
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ПУЛ
+# ─────────────────────────────────────────────────────────────────────────────
+class PostMetricsPool:
+    """
+    Разбор постов в пуле процессов; map() можно звать из многих потоков.
+
+    Пример:
+    ```python
+    with PostMetricsPool() as pool:
+        metrics = pool.map(posts)       # в порядке posts, None для битых
+    print(f"{pool.posts_per_sec():.0f} постов/с")
+    ```
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.posts = 0
+        self.busy_seconds = 0.0      # Время, когда шёл хотя бы один map()
+        self._lock = threading.Lock()
+        self._active = 0
+        self._busy_since = 0.0
+        self._pool = None
+        if self.workers > 1:
+            try:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Пул процессов недоступен, разбор в потоке: {e}")
+
+    def map(self, items: Iterable[dict]) -> List[Optional[dict]]:
+        items = list(items)
+        self._enter()
+        try:
+            if self._pool is None or len(items) < MIN_POOL_BATCH:
+                result = _metrics_chunk(items)
+            else:
+                result = self._map_pool(items)
+        finally:
+            self._leave(len(items))
+        return result
+
+    def _map_pool(self, items: List[dict]) -> List[Optional[dict]]:
+        chunks = [[slim_item(item) for item in items[i:i + CHUNK_SIZE]]
+                  for i in range(0, len(items), CHUNK_SIZE)]
+        try:
+            futures = [self._pool.submit(_metrics_chunk, chunk) for chunk in chunks]
+            result = []
+            for future in futures:
+                result.extend(future.result())
+            return result
+        except (BrokenProcessPool, RuntimeError) as e:
+            # Процесс упал или пул закрыт — досчитываем на месте
+            logger.warning(f"Пул разбора постов недоступен: {e}")
+            self._pool = None
+            return _metrics_chunk(items)
+
+    def _enter(self):
+        with self._lock:
+            if self._active == 0:
+                self._busy_since = time.perf_counter()
+            self._active += 1
+
+    def _leave(self, count: int):
+        with self._lock:
+            self._active -= 1
+            self.posts += count
+            if self._active == 0:
+                self.busy_seconds += time.perf_counter() - self._busy_since
+
+    def posts_per_sec(self) -> float:
+        return self.posts / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ТЕСТ
+# ─────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    import random
+    from urllib.parse import urlparse
+
+    rnd = random.Random(1)
+    words = [f"слово{i}" for i in range(3000)]
+
+    def make_post(i):
+        parts = []
+        for p in range(12):
+            text = " ".join(rnd.choice(words) for _ in range(60))
+            link = rnd.choice([
+                f"<a href='/p{rnd.randrange(1000)}/'>внутр</a>",
+                f"<a href='https://www.site.com/p{rnd.randrange(1000)}/'>абс</a>",
+                f"<a href='https://ext{rnd.randrange(50)}.com/x'>внеш</a>",
+                "<a href='#top'>якорь</a>",
+            ])
+            parts.append(f"<p>{text} {link}</p>")
+        return {"id": i, "link": f"https://site.com/post{i}/", "title": {"rendered": f"T{i}"},
+                "content": {"rendered": "".join(parts)}, "modified": "2024-01-01T00:00:00",
+                "excerpt": {"rendered": "<p>...</p>" * 20}}
+
+    posts = [make_post(i) for i in range(3000)]
+
+    def old_metrics(item):
+        """Прежний разбор (BeautifulSoup html.parser + два urlparse на ссылку)."""
+        from bs4 import BeautifulSoup
+        url = item["link"]
+        soup = BeautifulSoup(item["content"]["rendered"], "html.parser")
+        word_count = len(soup.get_text(separator=" ", strip=True).split())
+        obl, internal = 0, []
+        for link in soup.find_all("a", href=True):
+            href = link["href"].strip()
+            if not href or href.startswith("#"):
+                continue
+            abs_href = urljoin(url, href)
+            ph, pb = urlparse(abs_href), urlparse(url)
+            if ph.netloc and ph.netloc.replace("www.", "") != pb.netloc.replace("www.", ""):
+                obl += 1
+            else:
+                internal.append(_clean_url(abs_href))
+        return word_count, obl, internal
+
+    try:
+        t0 = time.perf_counter()
+        old = [old_metrics(p) for p in posts]
+        old_rate = len(posts) / (time.perf_counter() - t0)
+        same = all((m["word_count"], m["obl"], m["links"]) == o
+                   for m, o in zip(map(item_metrics, posts), old))
+        print(f"BeautifulSoup: {old_rate:.0f} постов/с, результаты lxml совпадают: {same}")
+    except ImportError:
+        print("BeautifulSoup не установлен — сравнение с прежним разбором пропущено")
+
+    with PostMetricsPool(workers=1) as pool:
+        pool.map(posts)
+        print(f"lxml, один поток: {pool.posts_per_sec():.0f} постов/с")
+
+    with PostMetricsPool() as pool:
+        pool.map(posts[:64])  # Прогрев: запуск процессов
+        pool.posts, pool.busy_seconds = 0, 0.0
+        metrics = pool.map(posts)
+        print(f"lxml, пул из {pool.workers} процессов: {pool.posts_per_sec():.0f} постов/с")
+
+    sample = metrics[0]
+    print(f"Пример: слов {sample['word_count']}, OBL {sample['obl']}, внутренних {len(sample['links'])}")
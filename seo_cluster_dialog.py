@@ -15,6 +15,7 @@ dialog.exec()
 
 import os
 import random
+from datetime import datetime
 from urllib.parse import urlparse
 from typing import Dict, List, Optional, Any
 
@@ -31,7 +32,8 @@ from PyQt6.QtGui import QColor, QFont
 # Импортируем основной модуль
 from seo_cluster_linker import (
     SEOClusterLinker, AnchorMorpher, CoverageAnalyzer,
-    Cluster, Link, Page, LinkInserter
+    Cluster, Link, Page, LinkInserter, InsertionJournal, LinkRemover,
+    domains_template_index
 )
 from graph_dialog import GraphDialog
 
@@ -77,10 +79,16 @@ class LinkWorker(QThread):
     finished = pyqtSignal(dict)
     error = pyqtSignal(str)
 
-    def __init__(self, linker: SEOClusterLinker, use_existing: bool = True):
+    def __init__(self,
+                 linker: SEOClusterLinker,
+                 use_existing: bool = True,
+                 workers: int = 1,
+                 journal_dir: Optional[str] = None):
         super().__init__()
         self.linker = linker
         self.use_existing = use_existing
+        self.workers = workers
+        self.journal_dir = journal_dir
 
     def run(self):
         try:
@@ -102,14 +110,174 @@ class LinkWorker(QThread):
                 )
 
             # Вставляем ссылки
-            self.progress.emit("Вставка ссылок в HTML...")
-            stats = self.linker.insert_all_links()
+            self.progress.emit(f"Вставка ссылок в HTML (процессов: {self.workers})...")
+            stats = self.linker.insert_all_links(workers=self.workers,
+                                                 journal_dir=self.journal_dir)
 
             self.finished.emit(stats)
 
         except Exception as e:
             self.error.emit(str(e))
 
+
+class RemoveLinksWorker(QThread):
+    """Поток для массового удаления вставленных ссылок."""
+    finished = pyqtSignal(dict, bool)  # stats, dry_run
+    error = pyqtSignal(str)
+
+    def __init__(self, remover: LinkRemover, directory: str, dry_run: bool, workers: int = 1):
+        super().__init__()
+        self.remover = remover
+        self.directory = directory
+        self.dry_run = dry_run
+        self.workers = workers
+
+    def run(self):
+        try:
+            stats = self.remover.run(self.directory, dry_run=self.dry_run, workers=self.workers)
+            self.finished.emit(stats, self.dry_run)
+        except Exception as e:
+            self.error.emit(str(e))
+
+
+class UndoInsertionsWorker(QThread):
+    """Поток для отката вставки ссылок по журналу."""
+    finished = pyqtSignal(dict)  # {'restored', 'conflicts', 'missing'}
+    error = pyqtSignal(str)
+
+    def __init__(self, journal_dir: str, run_id: Optional[str] = None):
+        super().__init__()
+        self.journal_dir = journal_dir
+        self.run_id = run_id
+
+    def run(self):
+        journal = InsertionJournal(self.journal_dir)
+        try:
+            self.finished.emit(journal.undo(self.run_id))
+        except Exception as e:
+            self.error.emit(str(e))
+        finally:
+            journal.close()
+
+
+class TemplateIndexWorker(QThread):
+    """Поток для построения (обновления) индекса шаблонов доменов."""
+    finished = pyqtSignal(object)  # TemplateIndex или None
+
+    def __init__(self, base_dir: str, workers: int = 1, batch_size: Optional[int] = None):
+        super().__init__()
+        self.base_dir = base_dir
+        self.workers = workers
+        self.batch_size = batch_size
+
+    def run(self):
+        self.finished.emit(domains_template_index(self.base_dir, self.workers,
+                                                  batch_size=self.batch_size))
+
+
+class LinkRemovalDialog(QDialog):
+    """Массовое удаление ссылок по id запуска, целям или доменам."""
+
+    def __init__(self, base_directory: str, workers: int = 1, last_run_id: str = "", parent=None):
+        super().__init__(parent)
+        self.base_dir = base_directory
+        self.workers = workers
+        self.worker: Optional[RemoveLinksWorker] = None
+
+        self.setWindowTitle("🧹 Удаление вставленных ссылок")
+        self.setMinimumSize(640, 420)
+        self._init_ui(last_run_id)
+        self.setStyleSheet(Styles().get_dark())
+
+    def _init_ui(self, last_run_id: str):
+        layout = QVBoxLayout(self)
+
+        help_label = QLabel(
+            "Значения через запятую или с новой строки. Пустое поле не ограничивает, "
+            "заполненные поля объединяются по И. Удаляются только ссылки, "
+            "вставленные программой (атрибут data-lk); текст восстанавливается как был."
+        )
+        help_label.setWordWrap(True)
+        help_label.setStyleSheet("color: #999999; font-size: 10px;")
+        layout.addWidget(help_label)
+
+        layout.addWidget(QLabel("ID запусков:"))
+        self.run_ids_edit = QPlainTextEdit(last_run_id)
+        self.run_ids_edit.setMaximumHeight(50)
+        layout.addWidget(self.run_ids_edit)
+
+        layout.addWidget(QLabel("Целевые URL:"))
+        self.targets_edit = QPlainTextEdit()
+        self.targets_edit.setMaximumHeight(70)
+        layout.addWidget(self.targets_edit)
+
+        layout.addWidget(QLabel("Целевые домены:"))
+        self.domains_edit = QPlainTextEdit()
+        self.domains_edit.setMaximumHeight(50)
+        layout.addWidget(self.domains_edit)
+
+        self.result_label = QLabel("")
+        self.result_label.setWordWrap(True)
+        layout.addWidget(self.result_label)
+
+        btn_row = QHBoxLayout()
+        self.count_btn = QPushButton("🔢 Посчитать (без изменений)")
+        self.count_btn.clicked.connect(lambda: self._start(dry_run=True))
+        btn_row.addWidget(self.count_btn)
+        btn_row.addStretch()
+        self.remove_btn = QPushButton("🧹 Удалить")
+        self.remove_btn.clicked.connect(lambda: self._start(dry_run=False))
+        btn_row.addWidget(self.remove_btn)
+        layout.addLayout(btn_row)
+
+    @staticmethod
+    def _values(edit: QPlainTextEdit) -> Optional[set]:
+        parts = edit.toPlainText().replace(",", "\n").split("\n")
+        values = {p.strip() for p in parts if p.strip()}
+        return values or None
+
+    def _start(self, dry_run: bool):
+        remover = LinkRemover(
+            run_ids=self._values(self.run_ids_edit),
+            targets=self._values(self.targets_edit),
+            domains=self._values(self.domains_edit),
+        )
+
+        if not dry_run:
+            no_filters = remover.run_ids is None and remover.targets is None and remover.domains is None
+            warning = "\n\nФильтры не заданы — будут удалены ВСЕ вставленные ссылки!" if no_filters else ""
+            reply = QMessageBox.question(
+                self, "Подтверждение",
+                f"Удалить подходящие ссылки во всех файлах {self.base_dir}?{warning}",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            )
+            if reply != QMessageBox.StandardButton.Yes:
+                return
+
+        self.count_btn.setEnabled(False)
+        self.remove_btn.setEnabled(False)
+        self.result_label.setText("⏳ Обработка...")
+
+        self.worker = RemoveLinksWorker(remover, self.base_dir, dry_run, self.workers)
+        self.worker.finished.connect(self._on_finished)
+        self.worker.error.connect(self._on_error)
+        self.worker.start()
+
+    def _on_finished(self, stats: dict, dry_run: bool):
+        self.count_btn.setEnabled(True)
+        self.remove_btn.setEnabled(True)
+        action = "Найдено" if dry_run else "Удалено"
+        self.result_label.setText(
+            f"{action} ссылок: {stats['links']} в {stats['files_matched']} файлах "
+            f"(просмотрено {stats['files']}, ошибок {stats['errors']})"
+        )
+
+    def _on_error(self, message: str):
+        self.count_btn.setEnabled(True)
+        self.remove_btn.setEnabled(True)
+        self.result_label.setText(f"❌ {message}")
+
+
 class LinkingExamplesDialog(QDialog):
     """Диалог с наглядными примерами схем перелинковки."""
 
@@ -378,11 +546,16 @@ class SEOClusterDialog(QDialog):
         'hub_spoke': 'Hub & Spoke',
     }
 
+    # Журнал вставки внутри базовой директории (сканер пропускает dot-папки)
+    JOURNAL_DIR_NAME = ".linkovalka_journal"
+
     def __init__(self, base_directory: str, parent=None):
         super().__init__(parent)
         self.base_dir = base_directory
         self.linker: Optional[SEOClusterLinker] = None
         self.clusters: Dict[str, Cluster] = {}
+        # Id последнего запуска вставки (атрибут data-lk у ссылок)
+        self.last_run_id = ""
 
         self.setWindowTitle("🔗 SEO Кластерная Перелинковка")
         self.setMinimumSize(1400, 900)
@@ -454,6 +627,16 @@ class SEOClusterDialog(QDialog):
 
         btn_layout.addStretch()
 
+        self.undo_btn = QPushButton("↩ Откатить вставку")
+        self.undo_btn.setToolTip("Восстановить файлы по журналу вставки")
+        self.undo_btn.clicked.connect(self._on_undo_insertions)
+        btn_layout.addWidget(self.undo_btn)
+
+        self.remove_links_btn = QPushButton("🧹 Удалить ссылки")
+        self.remove_links_btn.setToolTip("Удалить вставленные ссылки по id запуска, целям или доменам")
+        self.remove_links_btn.clicked.connect(self._on_remove_links)
+        btn_layout.addWidget(self.remove_links_btn)
+
         self.export_btn = QPushButton("📤 Экспорт JSON")
         self.export_btn.clicked.connect(self._on_export)
         self.export_btn.setEnabled(False)
@@ -586,6 +769,35 @@ class SEOClusterDialog(QDialog):
         min_len_help.setWordWrap(True)
         params_layout.addWidget(min_len_help)
 
+        # Параллельная вставка
+        workers_row = QHBoxLayout()
+        workers_row.addWidget(QLabel("Процессов для вставки:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, max(1, os.cpu_count() or 1))
+        self.workers_spin.setValue(max(1, os.cpu_count() or 1))
+        workers_row.addWidget(self.workers_spin)
+        workers_row.addStretch()
+        params_layout.addLayout(workers_row)
+
+        workers_help = QLabel("Файлы обрабатываются независимо в пуле процессов (1 = последовательно)")
+        workers_help.setStyleSheet("color: #999999; font-size: 10px;")
+        workers_help.setWordWrap(True)
+        params_layout.addWidget(workers_help)
+
+        # Журнал вставки
+        self.journal_cb = QCheckBox("Вести журнал вставки (продолжение после сбоя и откат)")
+        self.journal_cb.setChecked(True)
+        params_layout.addWidget(self.journal_cb)
+
+        journal_help = QLabel(
+            f"Журнал хранится в {self.JOURNAL_DIR_NAME} внутри директории сайтов. "
+            "Прерванный запуск при повторе продолжается с места сбоя; "
+            f"откат отменяет последний запуск (хранятся {InsertionJournal.KEEP_RUNS})"
+        )
+        journal_help.setStyleSheet("color: #999999; font-size: 10px;")
+        journal_help.setWordWrap(True)
+        params_layout.addWidget(journal_help)
+
 
         # Опции
         self.ensure_coverage_cb = QCheckBox("Гарантировать полный охват (все страницы получат ссылки)")
@@ -840,11 +1052,13 @@ class SEOClusterDialog(QDialog):
         ok = stats.get("success", 0)
         failed = stats.get("failed", 0)
         skipped = stats.get("skipped", 0)
+        duplicates = stats.get("duplicates", 0)
 
         msg = (
             f"Вставка ссылок из Visual Linker завершена.\n\n"
             f"Успешно: {ok}\n"
             f"Пропущено: {skipped}\n"
+            f"Дубликатов: {duplicates}\n"
             f"Ошибок: {failed}"
         )
         QMessageBox.information(self, "Visual Linker", msg)
@@ -987,6 +1201,8 @@ class SEOClusterDialog(QDialog):
         self._external_pages = []
         self._external_anchors = []
         self._external_anchor_index = 0
+        self._external_templates = None
+        self.template_worker = None
 
     def _on_external_load_file(self):
         """Загрузка HTML-ссылок из файла."""
@@ -1025,10 +1241,25 @@ class SEOClusterDialog(QDialog):
 
         self.external_log.append(f"\n✅ Найдено страниц: {len(self._external_pages)}")
 
+        # Шаблоны страниц: контейнер ищется один раз на шаблон.
+        # Индекс строится в фоне; вставка до его готовности идёт без шаблонов
+        self._external_templates = None
+        if self.template_worker is None or not self.template_worker.isRunning():
+            self.template_worker = TemplateIndexWorker(self.base_dir, self.workers_spin.value(),
+                                                       batch_size=len(self._external_pages))
+            self.template_worker.finished.connect(self._on_external_templates_ready)
+            self.template_worker.start()
+
         # Парсим ссылки
         self._sync_external_anchors()
         self.external_log.append(f"🔗 Загружено ссылок/HTML: {len(self._external_anchors)}")
 
+    def _on_external_templates_ready(self, templates):
+        """Индекс шаблонов построен (None — работа без шаблонов)."""
+        self._external_templates = templates
+        if templates is not None:
+            self.external_log.append(f"🧩 Шаблонов: {len(templates)}")
+
     def _sync_external_anchors(self):
         """Синхронизация списка ссылок из поля ввода."""
         text = self.external_anchor_input.toPlainText()
@@ -1094,8 +1325,11 @@ class SEOClusterDialog(QDialog):
         total_inserted = 0
         total_failed = 0
 
-        # Создаём LinkInserter с нужными параметрами
-        inserter = LinkInserter(min_text_length=min_text_len)
+        # Создаём LinkInserter с нужными параметрами.
+        # У внешних ссылок фиктивный target — проверка дубликатов не нужна
+        templates = self._external_templates
+        inserter = LinkInserter(min_text_length=min_text_len, skip_duplicates=False,
+                                templates=templates)
 
         for page_info in self._external_pages:
             file_path = page_info['full_path']
@@ -1142,7 +1376,9 @@ class SEOClusterDialog(QDialog):
             # Вставляем ссылки
             if html_mode:
                 # Режим HTML-блока — вставка после элемента
-                stats = self._insert_external_html_blocks(file_path, page_links, min_text_len, fallback_on)
+                template = templates.template_of(file_path) if templates is not None else None
+                stats = self._insert_external_html_blocks(file_path, page_links, min_text_len, fallback_on,
+                                                          inserter=inserter, template=template)
             else:
                 # Режим анкора внутрь текста — используем LinkInserter
                 stats = inserter.insert_links(page_links)
@@ -1175,9 +1411,15 @@ class SEOClusterDialog(QDialog):
         )
 
     def _insert_external_html_blocks(self, file_path: str, links: List[Link],
-                                      min_text_len: int, fallback_on: bool) -> dict:
+                                      min_text_len: int, fallback_on: bool,
+                                      inserter: Optional[LinkInserter] = None,
+                                      template: Optional[str] = None) -> dict:
         """
         Вставляет HTML-блоки ПОСЛЕ текстовых элементов (режим произвольного HTML).
+
+        Если известен шаблон страницы, блоки ставятся в контейнер статьи,
+        найденный inserter'ом (решение общее для шаблона); без подходящих
+        элементов в контейнере — по всей странице, как раньше.
         """
         import chardet
         from lxml import html as lxml_html
@@ -1193,18 +1435,26 @@ class SEOClusterDialog(QDialog):
 
             doc = lxml_html.fromstring(html_content)
 
-            # Ищем подходящие блоки для вставки после них
-            candidates = doc.xpath('//p | //div | //section | //article')
-            valid_candidates = []
+            def find_candidates(root, prefix):
+                # Ищем подходящие блоки для вставки после них
+                found = []
+                for el in root.xpath(f'{prefix}p | {prefix}div | {prefix}section | {prefix}article'):
+                    text = el.text_content().strip()
+                    if len(text) < min_text_len:
+                        continue
+                    # Проверка на запрещённые области
+                    if self._is_forbidden_element(el):
+                        continue
+                    found.append(el)
+                return found
 
-            for el in candidates:
-                text = el.text_content().strip()
-                if len(text) < min_text_len:
-                    continue
-                # Проверка на запрещённые области
-                if self._is_forbidden_element(el):
-                    continue
-                valid_candidates.append(el)
+            valid_candidates = []
+            if template is not None and inserter is not None:
+                container = inserter.content_container(doc, template)
+                if container is not None:
+                    valid_candidates = find_candidates(container, './/')
+            if not valid_candidates:
+                valid_candidates = find_candidates(doc, '//')
 
             if not valid_candidates and not fallback_on:
                 stats['skipped'] = len(links)
@@ -1532,13 +1782,92 @@ class SEOClusterDialog(QDialog):
         self.progress_bar.setRange(0, 0)
 
         # Запускаем вставку БЕЗ пересоздания ссылок
-        self.link_worker = LinkWorker(self.linker, use_existing=True)
+        self.link_worker = LinkWorker(self.linker, use_existing=True,
+                                      workers=self.workers_spin.value(),
+                                      journal_dir=self._journal_dir())
         self.link_worker.progress.connect(self._on_link_progress)
         self.link_worker.link_created.connect(self._on_link_created)
         self.link_worker.finished.connect(self._on_generate_finished)
         self.link_worker.error.connect(self._on_error)
         self.link_worker.start()
 
+    def _journal_dir(self) -> Optional[str]:
+        """Директория журнала вставки или None, если журнал выключен."""
+        if not self.journal_cb.isChecked() or not self.base_dir:
+            return None
+        return os.path.join(self.base_dir, self.JOURNAL_DIR_NAME)
+
+    def _on_remove_links(self):
+        """Диалог массового удаления вставленных ссылок."""
+        if not self.base_dir or not os.path.isdir(self.base_dir):
+            QMessageBox.warning(self, "Ошибка", "Директория сайтов не найдена.")
+            return
+
+        dialog = LinkRemovalDialog(
+            self.base_dir,
+            workers=self.workers_spin.value(),
+            last_run_id=self.last_run_id,
+            parent=self
+        )
+        dialog.exec()
+
+    def _on_undo_insertions(self):
+        """Откат вставленных ссылок по журналу."""
+        journal_dir = os.path.join(self.base_dir or "", self.JOURNAL_DIR_NAME)
+        runs = []
+        if os.path.isdir(journal_dir):
+            runs = [r for r in InsertionJournal(journal_dir).runs() if r.get('status') != 'undone']
+        if not runs:
+            QMessageBox.information(self, "Откат", "В журнале нет запусков для отката.")
+            return
+
+        run = runs[-1]
+        started = datetime.fromtimestamp(run.get('started', 0)).strftime('%d.%m.%Y %H:%M')
+        state = " (прерван)" if run.get('status') == 'open' else ""
+        reply = QMessageBox.question(
+            self, "Подтверждение",
+            f"Откатить последний запуск вставки {run['run_id']} от {started}{state}?\n\n"
+            "Восстановятся файлы, изменённые этим запуском; "
+            "файлы, которые правились после вставки, будут пропущены.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+
+        # Вставка во время отката испортила бы файлы; состояние кнопки вернём после
+        self._generate_enabled = self.generate_btn.isEnabled()
+        self.undo_btn.setEnabled(False)
+        self.generate_btn.setEnabled(False)
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setRange(0, 0)
+
+        self.undo_worker = UndoInsertionsWorker(journal_dir, run['run_id'])
+        self.undo_worker.finished.connect(self._on_undo_finished)
+        self.undo_worker.error.connect(self._on_undo_error)
+        self.undo_worker.start()
+
+    def _on_undo_finished(self, stats: dict):
+        """Откат завершён."""
+        self.undo_btn.setEnabled(True)
+        self.generate_btn.setEnabled(self._generate_enabled)
+        self.progress_bar.setVisible(False)
+        self.report_text.append(
+            f"↩ Откат запуска {stats.get('run_id')}: восстановлено {stats['restored']}, "
+            f"конфликтов {stats['conflicts']}, без бэкапа {stats['missing']}"
+        )
+        QMessageBox.information(
+            self, "Откат",
+            f"Восстановлено файлов: {stats['restored']}\n"
+            f"Изменены после вставки (пропущены): {stats['conflicts']}\n"
+            f"Не найдены: {stats['missing']}"
+        )
+
+    def _on_undo_error(self, error: str):
+        self.undo_btn.setEnabled(True)
+        self.generate_btn.setEnabled(self._generate_enabled)
+        self.progress_bar.setVisible(False)
+        QMessageBox.critical(self, "Ошибка", error)
+
     def _on_link_progress(self, msg: str):
         """Прогресс создания ссылок."""
         self.report_text.append(msg)
@@ -1551,6 +1880,7 @@ class SEOClusterDialog(QDialog):
         """Генерация завершена."""
         self.generate_btn.setEnabled(True)
         self.progress_bar.setVisible(False)
+        self.last_run_id = stats.get('run_id', "")
 
         # Берём фактический список ссылок, по которым работал инсертер
         links = getattr(self.linker, "all_links", [])
@@ -1569,6 +1899,10 @@ class SEOClusterDialog(QDialog):
                 status_item.setText("✅ Вставлено")
                 status_item.setForeground(QColor("#3ca55a"))
                 status_item.setToolTip("Ссылка успешно вставлена в HTML")
+            elif context.startswith(LinkInserter.DUPLICATE_CONTEXT):
+                status_item.setText("⏭ Уже есть")
+                status_item.setForeground(QColor("#d19a66"))
+                status_item.setToolTip(context)
             else:
                 status_item.setText("❌ Ошибка")
                 status_item.setForeground(QColor("#e06c75"))
@@ -1587,7 +1921,9 @@ class SEOClusterDialog(QDialog):
             f"✅ Перелинковка завершена!\n\n"
             f"Успешно: {stats.get('success', 0)}\n"
             f"Ошибок: {stats.get('failed', 0)}\n"
-            f"Пропущено: {stats.get('skipped', 0)}"
+            f"Пропущено: {stats.get('skipped', 0)}\n"
+            f"Дубликатов (ссылка уже была): {stats.get('duplicates', 0)}\n\n"
+            f"ID запуска: {self.last_run_id}"
         )
 
 
@@ -1717,7 +2053,8 @@ class SEOClusterDialog(QDialog):
             f"Вставка связей Visual Linker завершена\n\n"
             f"Успешно: {stats.get('success', 0)}\n"
             f"Ошибок: {stats.get('failed', 0)}\n"
-            f"Пропущено: {stats.get('skipped', 0)}"
+            f"Пропущено: {stats.get('skipped', 0)}\n"
+            f"Дубликатов: {stats.get('duplicates', 0)}"
         )
 
     def _show_linking_examples(self):
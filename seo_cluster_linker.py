@@ -27,17 +27,26 @@ seo_cluster_linker.py — Продвинутый SEO-модуль кластер
 import os
 import re
 import json
+import time
 import random
+import shutil
+import hashlib
 import logging
 import chardet
+from html import unescape
 from copy import deepcopy
 from typing import Dict, List, Set, Tuple, Optional, Any, NamedTuple
 from dataclasses import dataclass, field
 from collections import defaultdict
-from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse, urljoin
 from lxml import html, etree
 from lxml.html import HtmlElement
 
+from html_splice import HtmlSplicer
+from xpath_registry import LINK_CONTENT_XPATHS, compile_xpath
+from template_clusters import TEMPLATE_INDEX_FILE, TemplateIndex, site_template_index
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # LOGGING
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -103,6 +112,62 @@ class Cluster:
         return dict(result)
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# URL — НОРМАЛИЗАЦИЯ
+# ═══════════════════════════════════════════════════════════════════════════════
+_NON_PAGE_HREF_PREFIXES = ('#', 'mailto:', 'tel:', 'javascript:')
+
+
+def normalize_url(url: str) -> str:
+    """
+    Ключ для сравнения URL страниц.
+
+    Без query/fragment, host в нижнем регистре, без .html и завершающего '/'.
+    Общий для LinkInserter и визуального редактора.
+    """
+    try:
+        p = urlparse(url)
+        scheme = p.scheme or "https"
+        netloc = (p.netloc or "").lower()
+        path = p.path or "/"
+
+        if path.endswith(".html"):
+            path = path[:-5]
+        if path.endswith("/"):
+            path = path[:-1]
+        if not path.startswith("/"):
+            path = "/" + path
+
+        return f"{scheme}://{netloc}{path}"
+    except Exception:
+        return url
+
+
+def new_run_id() -> str:
+    """Короткий идентификатор запуска вставки: base36(время) + 2 случайных символа."""
+    alphabet = '0123456789abcdefghijklmnopqrstuvwxyz'
+    value = int(time.time())
+    out = ''
+    while value:
+        value, rem = divmod(value, 36)
+        out = alphabet[rem] + out
+    return out + ''.join(random.choice(alphabet) for _ in range(2))
+
+
+def domain_matches(netloc: str, domains: Set[str]) -> bool:
+    """Хост совпадает с одним из доменов или является его поддоменом (www. и т.п.)."""
+    host = netloc.lower().split(':')[0]
+    return any(host == d or host.endswith('.' + d) for d in domains)
+
+
+def resolve_href(page_url: str, href: str) -> Optional[str]:
+    """Абсолютный URL ссылки на странице page_url или None (якорь, mailto и т.п.)."""
+    href = (href or "").strip()
+    if not href or href.startswith(_NON_PAGE_HREF_PREFIXES):
+        return None
+    return urljoin(page_url, href)
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # ANCHOR MORPHER — МОРФОЛОГИЯ АНКОРОВ
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -1507,7 +1572,8 @@ class ClusterBuilder:
         for domain in os.listdir(self.base_dir):
             domain_path = os.path.join(self.base_dir, domain)
 
-            if not os.path.isdir(domain_path):
+            # Служебные директории (журнал вставки и т.п.)
+            if domain.startswith('.') or not os.path.isdir(domain_path):
                 continue
 
             logger.info(f"Сканирование домена: {domain}")
@@ -1663,13 +1729,451 @@ class ClusterBuilder:
         return synonyms
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# INSERTION JOURNAL — ЖУРНАЛ ВСТАВКИ (ПРОДОЛЖЕНИЕ И ОТКАТ)
+# ═══════════════════════════════════════════════════════════════════════════════
+def _sha1(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+def _atomic_write(file_path: str, data: bytes, fsync: bool = False):
+    """Пишет во временный файл рядом и атомарно подменяет им file_path."""
+    directory, name = os.path.split(os.path.abspath(file_path))
+    tmp_path = os.path.join(directory, f".{name}.lk-tmp")
+
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+    try:
+        shutil.copymode(file_path, tmp_path)
+    except OSError:
+        pass
+    os.replace(tmp_path, file_path)
+
+
+class InsertionJournal:
+    """
+    Write-ahead журнал вставки ссылок.
+
+    Журнал ведётся по запускам: runs/<run_id>/ — сегменты записей и run.json
+    со статусом ('open' → 'complete', после отката 'undone'). На каждый файл:
+    1. intent — хэши до/после, набор ссылок и результат по каждой;
+       исходник сохраняется в blobs/<sha> (жёсткая ссылка, при неудаче — копия);
+    2. атомарная подмена файла (tmp + os.replace);
+    3. commit.
+
+    begin() продолжает незавершённый (прерванный) запуск или открывает новый;
+    продолжение пропускает только файлы, которые остались такими, какими их
+    записал этот запуск (текущий хэш равен «после»). finish() закрывает
+    запуск — следующие кампании завершённые запуски не пропускают.
+    undo() откатывает один запуск (по умолчанию последний). Хранятся
+    KEEP_RUNS последних завершённых запусков, старые удаляются вместе
+    с ненужными бэкапами.
+
+    Каждый процесс пишет в свой сегмент (segment-<pid>.jsonl), поэтому
+    журнал работает и с пулом процессов без блокировок.
+
+    Пример:
+    ```python
+    journal = InsertionJournal("/path/to/sites/.linkovalka_journal")
+    inserter = LinkInserter(journal=journal)
+    inserter.insert_links(links)   # после сбоя — тот же вызов продолжит
+    journal.undo()                 # откат последнего запуска
+    ```
+    """
+
+    SEGMENT_PREFIX = "segment-"
+    BLOBS_DIR = "blobs"
+    RUNS_DIR = "runs"
+    RUN_FILE = "run.json"
+    KEEP_RUNS = 20
+
+    def __init__(self, journal_dir: str, fsync: bool = False):
+        """
+        Args:
+            journal_dir: Директория журнала (создаётся при необходимости)
+            fsync: Сбрасывать записи на диск (медленнее, переживает отключение питания)
+        """
+        self.journal_dir = os.path.abspath(journal_dir)
+        self.fsync = fsync
+        self.run_id: Optional[str] = None
+        self._handle = None
+        self._handle_pid = None
+        # path → последняя запись (intent / commit) текущего запуска
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._loaded = False
+
+    def __getstate__(self):
+        # В дочерние процессы передаём только настройки и id запуска
+        state = self.__dict__.copy()
+        state['_handle'] = None
+        state['_handle_pid'] = None
+        state['_state'] = {}
+        state['_loaded'] = False
+        return state
+
+    # ─── Запуски ───────────────────────────────────────────────────────────────
+    def _run_dir(self, run_id: str) -> str:
+        return os.path.join(self.journal_dir, self.RUNS_DIR, run_id)
+
+    def _write_run(self, info: Dict[str, Any]):
+        run_dir = self._run_dir(info['run_id'])
+        os.makedirs(run_dir, exist_ok=True)
+        data = json.dumps(info, ensure_ascii=False).encode('utf-8')
+        _atomic_write(os.path.join(run_dir, self.RUN_FILE), data, fsync=self.fsync)
+
+    def runs(self) -> List[Dict[str, Any]]:
+        """Запуски журнала от старых к новым: {'run_id', 'started', 'status', ...}."""
+        self._migrate_legacy()
+        runs_dir = os.path.join(self.journal_dir, self.RUNS_DIR)
+        if not os.path.isdir(runs_dir):
+            return []
+
+        runs = []
+        for name in os.listdir(runs_dir):
+            try:
+                with open(os.path.join(runs_dir, name, self.RUN_FILE), 'r', encoding='utf-8') as f:
+                    runs.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        runs.sort(key=lambda r: r.get('started', 0))
+        return runs
+
+    def begin(self, run_id: Optional[str] = None) -> str:
+        """
+        Начинает запуск: продолжает незавершённый или открывает новый.
+
+        Returns:
+            Id запуска (у продолжения — id прерванного запуска)
+        """
+        self.close()
+        self._state = {}
+        self._loaded = False
+
+        open_runs = [r for r in self.runs() if r.get('status') == 'open']
+        if open_runs:
+            info = open_runs[-1]
+            logger.info(f"Журнал: продолжение прерванного запуска {info['run_id']}")
+        else:
+            info = {'run_id': run_id or new_run_id(), 'started': time.time(), 'status': 'open'}
+            self._write_run(info)
+        self.run_id = info['run_id']
+        return self.run_id
+
+    def finish(self):
+        """Закрывает запуск: продолжать его больше нечего, остаётся откат."""
+        if self.run_id is None:
+            return
+        self.close()
+        info = self._run_info(self.run_id) or {'run_id': self.run_id, 'started': time.time()}
+        self._write_run({**info, 'status': 'complete', 'finished': time.time()})
+        self.run_id = None
+        self._state = {}
+        self._loaded = False
+        self._rotate()
+
+    def _run_info(self, run_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self._run_dir(run_id), self.RUN_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _rotate(self):
+        """Оставляет KEEP_RUNS последних закрытых запусков и их бэкапы."""
+        runs = self.runs()
+        closed = [r for r in runs if r.get('status') != 'open']
+        stale = closed[:-self.KEEP_RUNS] if len(closed) > self.KEEP_RUNS else []
+        if not stale:
+            return
+        for info in stale:
+            shutil.rmtree(self._run_dir(info['run_id']), ignore_errors=True)
+
+        stale_ids = {r['run_id'] for r in stale}
+        used = {record.get('blob')
+                for info in runs if info['run_id'] not in stale_ids
+                for record in self._read_records(info['run_id'])}
+        blobs_dir = os.path.join(self.journal_dir, self.BLOBS_DIR)
+        for name in os.listdir(blobs_dir) if os.path.isdir(blobs_dir) else ():
+            if os.path.join(self.BLOBS_DIR, name) not in used:
+                try:
+                    os.remove(os.path.join(blobs_dir, name))
+                except OSError:
+                    pass
+        logger.info(f"Журнал: удалено старых запусков: {len(stale)}")
+
+    def _migrate_legacy(self):
+        """Сегменты старого формата (без запусков) — один завершённый запуск."""
+        if not os.path.isdir(self.journal_dir):
+            return
+        legacy = [n for n in os.listdir(self.journal_dir)
+                  if n.startswith(self.SEGMENT_PREFIX) and n.endswith('.jsonl')]
+        if not legacy:
+            return
+        info = {'run_id': 'legacy-' + new_run_id(), 'started': 0, 'status': 'complete'}
+        run_dir = self._run_dir(info['run_id'])
+        os.makedirs(run_dir, exist_ok=True)
+        for name in legacy:
+            os.replace(os.path.join(self.journal_dir, name), os.path.join(run_dir, name))
+        self._write_run(info)
+
+    # ─── Чтение ────────────────────────────────────────────────────────────────
+    def _read_records(self, run_id: str) -> List[Dict[str, Any]]:
+        """Все записи всех сегментов запуска в порядке времени."""
+        records = []
+        run_dir = self._run_dir(run_id)
+        if not os.path.isdir(run_dir):
+            return records
+
+        for name in os.listdir(run_dir):
+            if not (name.startswith(self.SEGMENT_PREFIX) and name.endswith('.jsonl')):
+                continue
+            with open(os.path.join(run_dir, name), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # Оборванная последняя строка после сбоя
+                        continue
+
+        records.sort(key=lambda r: r.get('ts', 0))
+        return records
+
+    def load(self):
+        """Восстанавливает состояние файлов текущего запуска из журнала."""
+        self._state = {}
+        if self.run_id is not None:
+            for record in self._read_records(self.run_id):
+                if record.get('path') and record.get('op'):
+                    self.load_record(record)
+        self._loaded = True
+
+    # ─── Запись ────────────────────────────────────────────────────────────────
+    def _append(self, record: Dict[str, Any], run_id: Optional[str] = None):
+        run_id = run_id or self.run_id
+        if run_id is None:
+            raise RuntimeError("Журнал: запуск не начат (begin())")
+        pid = os.getpid()
+        segment = os.path.join(self._run_dir(run_id), f"{self.SEGMENT_PREFIX}{pid}.jsonl")
+        if self._handle is None or self._handle_pid != pid or self._handle.name != segment:
+            self.close()
+            os.makedirs(os.path.dirname(segment), exist_ok=True)
+            self._handle = open(segment, 'a', encoding='utf-8')
+            self._handle_pid = pid
+
+        record['ts'] = time.time_ns()
+        self._handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._handle.flush()
+        if self.fsync:
+            os.fsync(self._handle.fileno())
+
+        if self._loaded and run_id == self.run_id:
+            self.load_record(record)
+
+    def load_record(self, record: Dict[str, Any]):
+        """Обновляет состояние в памяти одной записью."""
+        path = record['path']
+        if record['op'] == 'commit':
+            intent = self._state.get(path)
+            if intent and intent.get('op') == 'intent':
+                record = {**intent, 'op': 'commit', 'ts': record['ts']}
+        self._state[path] = record
+
+    def _save_blob(self, file_path: str, sha: str) -> str:
+        """Сохраняет текущий файл как blobs/<sha>. Возвращает относительный путь."""
+        rel = os.path.join(self.BLOBS_DIR, sha)
+        blob_path = os.path.join(self.journal_dir, rel)
+        if os.path.exists(blob_path):
+            return rel
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            # Файл будет подменён через os.replace, поэтому старый inode
+            # остаётся только у blob — копирование не нужно
+            os.link(file_path, blob_path)
+        except OSError:
+            shutil.copyfile(file_path, blob_path)
+        return rel
+
+    @staticmethod
+    def plan_digest(links: List['Link']) -> str:
+        """Отпечаток набора ссылок файла (цель + анкор, в порядке вставки)."""
+        plan = "\n".join(f"{l.target.url}\t{l.anchor}" for l in links)
+        return _sha1(plan.encode('utf-8'))
+
+    def write_file(self,
+                   file_path: str,
+                   raw: bytes,
+                   data: bytes,
+                   links: List['Link']):
+        """intent → атомарная подмена файла → commit."""
+        path = os.path.abspath(file_path)
+        before = _sha1(raw)
+        self._append({
+            'op': 'intent',
+            'path': path,
+            'before': before,
+            'after': _sha1(data),
+            'blob': self._save_blob(path, before),
+            'plan': self.plan_digest(links),
+            'links': [[l.target.url, l.anchor] for l in links],
+            'inserted': [bool(l.inserted) for l in links],
+        })
+        _atomic_write(path, data, fsync=self.fsync)
+        self._append({'op': 'commit', 'path': path})
+
+    # ─── Продолжение ───────────────────────────────────────────────────────────
+    def resume_outcomes(self, file_path: str, links: List['Link']) -> Optional[List[bool]]:
+        """
+        Результат прерванного запуска для файла, если его можно пропустить.
+
+        Решение принимается по хэшу файла, а не по набору ссылок: ссылки
+        генерируются случайно, и после сбоя новый набор почти всегда другой —
+        повторная вставка в уже записанный файл дала бы дубли. Пропускается
+        только файл, который этот запуск записал и который с тех пор не менялся.
+
+        Returns:
+            [inserted, ...] по ссылкам файла или None — файл нужно обработать
+        """
+        if not self._loaded:
+            self.load()
+
+        path = os.path.abspath(file_path)
+        record = self._state.get(path)
+        if not record or record['op'] not in ('intent', 'commit'):
+            return None
+
+        try:
+            with open(path, 'rb') as f:
+                current = _sha1(f.read())
+        except OSError:
+            return None
+
+        if current != record['after']:
+            # Подмена не успела произойти, файл восстановлен или изменён
+            # позже — обрабатываем заново
+            return None
+
+        if record['op'] == 'intent':
+            # Сбой между подменой файла и commit — файл уже записан
+            logger.info(f"Журнал: восстановлен незавершённый commit: {path}")
+            self._append({'op': 'commit', 'path': path})
+
+        return self._match_outcomes(record, links)
+
+    def _match_outcomes(self, record: Dict[str, Any], links: List['Link']) -> List[bool]:
+        """
+        Результат прошлого запуска для текущего набора ссылок файла.
+
+        Тот же набор — результаты как есть; другой — ссылка считается
+        вставленной, если такая же (цель + анкор) была вставлена прошлым запуском.
+        """
+        inserted = record.get('inserted') or []
+        if record.get('plan') == self.plan_digest(links) and len(inserted) == len(links):
+            return list(inserted)
+
+        done = {tuple(pair) for pair, ok in zip(record.get('links') or [], inserted) if ok}
+        return [(l.target.url, l.anchor) in done for l in links]
+
+    # ─── Откат ─────────────────────────────────────────────────────────────────
+    def undo(self, run_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Откатывает записи одного запуска в обратном порядке.
+
+        Файл восстанавливается только если он не менялся после вставки
+        (текущий хэш равен записанному «после»).
+
+        Args:
+            run_id: Запуск; None — последний не откаченный
+
+        Returns:
+            {'restored': N, 'conflicts': N, 'missing': N, 'run_id': id или None}
+        """
+        stats = {'restored': 0, 'conflicts': 0, 'missing': 0, 'run_id': None}
+
+        candidates = [r for r in self.runs() if r.get('status') != 'undone']
+        if run_id is not None:
+            candidates = [r for r in candidates if r['run_id'] == run_id]
+        if not candidates:
+            return stats
+        info = candidates[-1]
+        stats['run_id'] = info['run_id']
+
+        pending: Dict[str, Dict[str, Any]] = {}
+        applied: List[Dict[str, Any]] = []
+        for record in self._read_records(info['run_id']):
+            op = record.get('op')
+            path = record.get('path')
+            if op == 'intent':
+                pending[path] = record
+            elif op == 'commit' and path in pending:
+                applied.append(pending.pop(path))
+        # intent без commit: подмена могла успеть произойти
+        applied.extend(pending.values())
+        applied.sort(key=lambda r: r['ts'])
+
+        for record in reversed(applied):
+            path = record['path']
+            try:
+                with open(path, 'rb') as f:
+                    current = _sha1(f.read())
+            except OSError:
+                stats['missing'] += 1
+                continue
+
+            if current == record['before']:
+                continue
+            if current != record['after']:
+                logger.warning(f"Журнал: файл изменён после вставки, откат пропущен: {path}")
+                stats['conflicts'] += 1
+                continue
+
+            blob_path = os.path.join(self.journal_dir, record['blob'])
+            try:
+                with open(blob_path, 'rb') as f:
+                    original = f.read()
+            except OSError:
+                stats['missing'] += 1
+                continue
+
+            _atomic_write(path, original, fsync=self.fsync)
+            self._append({'op': 'undo', 'path': path}, run_id=info['run_id'])
+            stats['restored'] += 1
+
+        self.close()
+        self._write_run({**info, 'status': 'undone', 'undone': time.time()})
+        if info['run_id'] == self.run_id:
+            self.run_id = None
+        self._loaded = False
+        logger.info(f"Откат журнала: {stats}")
+        return stats
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+            self._handle_pid = None
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # LINK INSERTER — ВСТАВКА ССЫЛОК В HTML (FIXED)
 # ═══════════════════════════════════════════════════════════════════════════════
+# template_id → XPath контейнера, найденного на странице этого шаблона
+# (свой в каждом процессе пула, как theme_profile_cache в content_engine)
+_template_containers: Dict[str, str] = {}
+
+
 class LinkInserter:
     """
     Вставляет ссылки в HTML-файлы.
     v1.1 - Fix: Расширенный поиск текстовых узлов (не только <p>)
+
+    С templates (TemplateIndex) контейнер ищется полным перебором
+    CONTENT_SELECTORS один раз на шаблон; на следующих страницах шаблона
+    сначала проверяется найденный XPath.
     """
 
     # Запрещённые родительские теги (где нельзя ставить ссылки)
@@ -1690,37 +2194,149 @@ class LinkInserter:
         'widget-area', 'ad-banner', 'breadcrumbs'
     ])
 
-    # Расширенный список контейнеров
-    CONTENT_SELECTORS = [
-        "//div[contains(@class, 'entry-content')]",
-        "//div[contains(@class, 'post-content')]",
-        "//div[contains(@class, 'article-content')]",
-        "//div[contains(@class, 'page-content')]",
-        "//div[contains(@class, 'text-content')]",
-        "//div[contains(@class, 'content-area')]",
-        "//div[contains(@id, 'content')]",
-        "//section",
-        "//article",
-        "//main",
-    ]
+    # Теги, в прямой текст которых можно вставить ссылку
+    TEXT_TAGS = frozenset(['p', 'div', 'li', 'span', 'blockquote'])
 
-    def __init__(self, min_text_length: int = 50):
+    # Сколько уровней (элемент + предки) охватывает запрещённая зона
+    FORBIDDEN_DEPTH = 6
+
+    # Слово для выбора позиции вставки
+    _WORD_RE = re.compile(r'\S+')
+
+    # Контекст ссылки, пропущенной как дубликат
+    DUPLICATE_CONTEXT = "Ссылка на эту страницу уже есть"
+
+    # Атрибут с id запуска: по нему LinkRemover находит вставленные ссылки
+    RUN_ATTR = "data-lk"
+
+    # Расширенный список контейнеров (см. xpath_registry.py)
+    CONTENT_SELECTORS = list(LINK_CONTENT_XPATHS)
+
+    def __init__(self,
+                 min_text_length: int = 50,
+                 journal: Optional[InsertionJournal] = None,
+                 skip_duplicates: bool = True,
+                 run_id: Optional[str] = None,
+                 templates: Optional[TemplateIndex] = None):
+        """
+        Args:
+            min_text_length: Минимальная длина прямого текста узла
+            journal: Журнал вставки (продолжение и откат)
+            templates: Индекс шаблонов (template_clusters.py) — контейнер
+                запоминается на шаблон
+            skip_duplicates: Не вставлять ссылку, если страница уже ссылается
+                на тот же URL (сравнение через normalize_url)
+            run_id: Id запуска для атрибута data-lk. None — новый id
+                на каждый вызов insert_links()
+        """
         self.min_text_length = min_text_length
-        self.stats = {'success': 0, 'failed': 0, 'skipped': 0}
+        self.journal = journal
+        self.skip_duplicates = skip_duplicates
+        self.run_id = run_id
+        self.templates = templates
+        self.active_run_id = run_id or new_run_id()
+        self.stats = self._new_stats()
+
+    def __getstate__(self):
+        # Индекс шаблонов в процессы не передаём — template_id идёт в задаче
+        state = self.__dict__.copy()
+        state['templates'] = None
+        return state
+
+    def _template_of(self, file_path: str) -> Optional[str]:
+        return self.templates.template_of(file_path) if self.templates is not None else None
+
+    @staticmethod
+    def _new_stats() -> Dict[str, int]:
+        return {'success': 0, 'failed': 0, 'skipped': 0, 'duplicates': 0}
+
+    def insert_links(self, links: List[Link], workers: int = 1) -> Dict[str, Any]:
+        """
+        Вставляет ссылки, сгруппированные по файлам-источникам.
+
+        Args:
+            links: Список ссылок
+            workers: Количество процессов. При workers > 1 файлы
+                обрабатываются параллельно в пуле процессов
 
-    def insert_links(self, links: List[Link]) -> Dict[str, Any]:
+        Returns:
+            Статистика вставки
+        """
         links_by_file: Dict[str, List[Link]] = defaultdict(list)
         for link in links:
             links_by_file[link.source.file_path].append(link)
 
-        self.stats = {'success': 0, 'failed': 0, 'skipped': 0}
+        self.stats = self._new_stats()
+        self.active_run_id = self.run_id or new_run_id()
 
-        for file_path, file_links in links_by_file.items():
-            self._process_file(file_path, file_links)
+        if self.journal is not None:
+            # Прерванный запуск продолжается под своим id (data-lk тоже его)
+            self.active_run_id = self.journal.begin(self.active_run_id)
+            self._resume_from_journal(links_by_file)
+
+        if workers > 1 and len(links_by_file) > 1:
+            self._insert_parallel(links_by_file, workers)
+        else:
+            for file_path, file_links in links_by_file.items():
+                self._process_file(file_path, file_links, self._template_of(file_path))
 
+        if self.journal is not None:
+            self.journal.finish()
+        self.stats['run_id'] = self.active_run_id
         return self.stats
 
-    def _process_file(self, file_path: str, links: List[Link]):
+    def _resume_from_journal(self, links_by_file: Dict[str, List[Link]]):
+        """Убирает из обработки файлы, уже записанные прерванным запуском."""
+        resumed = 0
+        for file_path in list(links_by_file):
+            file_links = links_by_file[file_path]
+            outcomes = self.journal.resume_outcomes(file_path, file_links)
+            if outcomes is None or len(outcomes) != len(file_links):
+                continue
+
+            for link, inserted in zip(file_links, outcomes):
+                link.inserted = inserted
+                link.context = "" if inserted else "Не вставлена в прерванном запуске (журнал)"
+                self.stats['success' if inserted else 'failed'] += 1
+            del links_by_file[file_path]
+            resumed += 1
+
+        if resumed:
+            self.stats['resumed'] = resumed
+            logger.info(f"Журнал: пропущено уже обработанных файлов: {resumed}")
+
+    def _insert_parallel(self, links_by_file: Dict[str, List[Link]], workers: int):
+        """
+        Обрабатывает группы файлов в пуле процессов.
+
+        Файлы независимы, поэтому каждый процесс получает группу
+        (файл + его ссылки) и возвращает статистику и результат по
+        каждой ссылке. Результаты переносятся обратно в объекты Link.
+        """
+        groups = list(links_by_file.items())
+        workers = min(workers, len(groups))
+        # Крупные чанки снижают накладные расходы на IPC,
+        # но оставляем запас для балансировки неравных файлов
+        chunksize = max(1, len(groups) // (workers * 8))
+
+        tasks = [(self, file_path, file_links, self._template_of(file_path))
+                 for file_path, file_links in groups]
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_insert_worker) as pool:
+            results = pool.map(_process_file_group, tasks, chunksize=chunksize)
+
+            for (file_path, file_links), (stats, outcomes) in zip(groups, results):
+                for key, value in stats.items():
+                    self.stats[key] = self.stats.get(key, 0) + value
+
+                for link, (inserted, context) in zip(file_links, outcomes):
+                    link.inserted = inserted
+                    link.context = context
+
+        logger.info(f"Параллельная вставка: {len(groups)} файлов, {workers} процессов")
+
+    def _process_file(self, file_path: str, links: List[Link], template: Optional[str] = None):
         if not os.path.isfile(file_path):
             self.stats['failed'] += len(links)
             return
@@ -1738,7 +2354,7 @@ class LinkInserter:
             doc = html.fromstring(html_content)
 
             # Ищем контейнер
-            content_container = self._find_content_container(doc)
+            content_container = self._find_content_container(doc, template)
             if content_container is None:
                 # Если не нашли спец контейнер, берем body, но аккуратно
                 body = doc.xpath('//body')
@@ -1754,10 +2370,23 @@ class LinkInserter:
 
             random.shuffle(text_nodes)
 
+            # Индекс уже существующих ссылок страницы (тот же разбор документа)
+            existing = self._collect_hrefs(doc, links[0].source.url) if self.skip_duplicates else None
+
             inserted_count = 0
             node_idx = 0
+            # элемент → [исходный elem.text, сколько ссылок вставлено]
+            edits: Dict[HtmlElement, List[Any]] = {}
 
             for link in links:
+                target_key = None
+                if existing is not None:
+                    target_key = normalize_url(link.target.url)
+                    if target_key in existing:
+                        self.stats['duplicates'] += 1
+                        link.context = f"{self.DUPLICATE_CONTEXT}: {link.target.url}"
+                        continue
+
                 # Циклический перебор узлов, если ссылок больше чем узлов
                 if node_idx >= len(text_nodes):
                     random.shuffle(text_nodes)
@@ -1771,7 +2400,10 @@ class LinkInserter:
                     if node_idx >= len(text_nodes):
                         random.shuffle(text_nodes)
                         node_idx = 0
-                    if self._insert_single_link(text_nodes[node_idx], link):
+                    elem = text_nodes[node_idx]
+                    original_text = elem.text or ""
+                    if self._insert_single_link(elem, link):
+                        edits.setdefault(elem, [original_text, 0])[1] += 1
                         inserted = True
                         break
                     node_idx += 1
@@ -1780,6 +2412,8 @@ class LinkInserter:
                 if inserted:
                     link.inserted = True
                     inserted_count += 1
+                    if target_key is not None:
+                        existing.add(target_key)
                     self.stats['success'] += 1
                     # Для удачных можно чисто на всякий случай очистить контекст
                     link.context = ""
@@ -1800,111 +2434,165 @@ class LinkInserter:
 
             # Сохраняем только если были изменения
             if inserted_count > 0:
-                self._save_file(file_path, doc, original_head, encoding)
+                self._save_file(file_path, raw, doc, edits, original_head, encoding, links)
 
         except Exception as e:
             logger.error(f"Error processing {file_path}: {e}")
             self.stats['failed'] += len(links)
 
-    def _find_content_container(self, doc: HtmlElement) -> Optional[HtmlElement]:
+    @staticmethod
+    def _collect_hrefs(doc: HtmlElement, page_url: str) -> Set[str]:
+        """Нормализованные URL всех ссылок документа."""
+        hrefs: Set[str] = set()
+        for a_tag in doc.iter('a'):
+            target = resolve_href(page_url, a_tag.get('href'))
+            if target:
+                hrefs.add(normalize_url(target))
+        return hrefs
+
+    def _find_content_container(self, doc: HtmlElement,
+                                template: Optional[str] = None) -> Optional[HtmlElement]:
+        if template is not None:
+            xpath = _template_containers.get(template)
+            if xpath is not None:
+                container = self._pick_container(compile_xpath(xpath)(doc))
+                if container is not None:
+                    return container
+                # Страница шаблона свёрстана иначе — полный перебор и новое решение
+                del _template_containers[template]
+
         for xpath in self.CONTENT_SELECTORS:
-            results = doc.xpath(xpath)
-            # Берем самый длинный по тексту контейнер из найденных (чтобы не взять пустой div)
-            if results:
-                valid_results = [r for r in results if len(r.text_content() or "") > 500]
-                if valid_results:
-                    return valid_results[0]
-                # Если все короткие, берем первый
-                return results[0]
+            # compile_xpath кэширует скомпилированное выражение
+            container = self._pick_container(compile_xpath(xpath)(doc))
+            if container is not None:
+                if template is not None:
+                    _template_containers[template] = xpath
+                return container
+        return None
+
+    def content_container(self, doc: HtmlElement, template: Optional[str] = None) -> Optional[HtmlElement]:
+        """Контейнер статьи (решение запоминается на шаблон) или None."""
+        return self._find_content_container(doc, template)
+
+    @staticmethod
+    def _pick_container(results: List[HtmlElement]) -> Optional[HtmlElement]:
+        # Берем самый длинный по тексту контейнер из найденных (чтобы не взять пустой div)
+        if results:
+            valid_results = [r for r in results if len(r.text_content() or "") > 500]
+            if valid_results:
+                return valid_results[0]
+            # Если все короткие, берем первый
+            return results[0]
         return None
 
     def _find_text_nodes(self, container: HtmlElement) -> List[HtmlElement]:
         """
         Поиск текстовых узлов с многоступенчатым фоллбеком.
 
-        1) Ищем контейнеры по CONTENT_SELECTORS.
+        1) Ищем p/div/li/span/blockquote внутри выбранного контейнера.
         2) Если пусто — ищем <p> внутри <body>.
-        3) Если пусто — ищем <div> с текстом ≥ min_text_length.
+        3) Если пусто — ищем <div> внутри <body>.
 
+        Каждый шаг — один обход дерева (см. _walk_text_nodes).
         Если в документе есть достаточно длинный текст, должны найти хотя бы один узел.
         """
+        candidates = self._walk_text_nodes(container, self.TEXT_TAGS)
+        if candidates:
+            return candidates
 
-        def is_suitable(elem: HtmlElement) -> bool:
-            # Запрещённые зоны
-            if self._is_forbidden(elem):
-                return False
-            # Не вставляем внутрь ссылок
-            if elem.xpath('ancestor::a'):
-                return False
-            # Проверяем ПРЯМОЙ текст элемента (elem.text), а не text_content()!
-            direct_text = (elem.text or "").strip()
-            return len(direct_text) >= self.min_text_length
-
-        # Определяем корень документа
+        # Fallback: один обход <body> собирает и <p>, и <div>
         try:
             root = container.getroottree().getroot()
         except Exception:
             root = container
+        body = root.find('body') if root.tag == 'html' else None
+        if body is None:
+            body = root
 
-        # 1) Поиск по CONTENT_SELECTORS
-        candidates: List[HtmlElement] = []
-        for xpath_expr in self.CONTENT_SELECTORS:
-            try:
-                blocks = root.xpath(xpath_expr)
-            except Exception:
-                continue
-
-            for block in blocks:
-                if not isinstance(block, HtmlElement):
-                    continue
-                # Ищем внутри блока текстовые элементы
-                for elem in block.xpath(".//*[self::p or self::div or self::li or self::span or self::blockquote]"):
-                    if is_suitable(elem):
-                        candidates.append(elem)
-
-        if candidates:
-            return candidates
+        fallback = self._walk_text_nodes(body, frozenset(['p', 'div']))
 
         # 2) Жёсткий fallback: <p> внутри <body>
-        bodies = root.xpath("//body")
-        if bodies:
-            body = bodies[0]
-            p_nodes = body.xpath(".//p")
-            p_suitable = [p for p in p_nodes if is_suitable(p)]
-            if p_suitable:
-                return p_suitable
+        p_suitable = [e for e in fallback if e.tag == 'p']
+        if p_suitable:
+            return p_suitable
 
         # 3) Последний fallback: любые <div> с достаточной длиной текста
-        div_nodes = root.xpath("//div")
-        div_suitable = [d for d in div_nodes if is_suitable(d)]
-        if div_suitable:
-            return div_suitable
+        return [e for e in fallback if e.tag == 'div']
 
-        return []
+    def _walk_text_nodes(self, root: HtmlElement, tags: frozenset) -> List[HtmlElement]:
+        """
+        Один обход поддерева root (без самого root).
 
-    def _is_forbidden(self, elem: HtmlElement) -> bool:
-        """Умная проверка на запрещенные зоны."""
-        current = elem
-        depth = 0
+        Состояние передаётся от родителя к детям:
+        - forbidden: сколько уровней вниз ещё действует запрещённая зона
+          (как у прежней проверки — элемент и 5 его предков);
+        - inside_a: элемент лежит внутри <a> — такие поддеревья отсекаются.
 
-        # Проверяем вверх на 5 уровней, а не до корня сайта
-        # Это предотвращает бан всего контента из-за класса в body
-        while current is not None and depth < 6:
-            if current.tag in self.FORBIDDEN_TAGS:
-                return True
+        Каждый элемент посещается ровно один раз, дубликатов нет.
+        """
+        forbidden, inside_a = self._ancestor_state(root)
+        if inside_a:
+            return []
 
-            # Получаем классы и ID
-            cls = str(current.get('class', '')).lower()
-            cid = str(current.get('id', '')).lower()
-            combined = cls + ' ' + cid
+        found: List[HtmlElement] = []
+        stack = [(child, forbidden) for child in reversed(root)]
 
-            for pattern in self.FORBIDDEN_PATTERNS:
-                if pattern in combined:
-                    return True
+        while stack:
+            elem, parent_forbidden = stack.pop()
+            tag = elem.tag
+            # Комментарии и processing instructions
+            if not isinstance(tag, str):
+                continue
+            # Внутрь ссылок не вставляем — всё поддерево пропускаем
+            if tag == 'a':
+                continue
 
+            if self._is_forbidden_self(elem):
+                forbidden = self.FORBIDDEN_DEPTH
+            else:
+                forbidden = parent_forbidden - 1 if parent_forbidden > 0 else 0
+
+            if forbidden == 0 and tag in tags:
+                # Проверяем ПРЯМОЙ текст элемента (elem.text), а не text_content()!
+                direct_text = (elem.text or "").strip()
+                if len(direct_text) >= self.min_text_length:
+                    found.append(elem)
+
+            stack.extend((child, forbidden) for child in reversed(elem))
+
+        return found
+
+    def _ancestor_state(self, elem: HtmlElement) -> Tuple[int, bool]:
+        """Начальное состояние обхода: запрещённая зона и <a> среди предков elem."""
+        forbidden = 0
+        depth = 0
+        current = elem
+
+        # Запрещённая зона действует на 5 уровней вниз, а не до корня сайта.
+        # Это предотвращает бан всего контента из-за класса в body
+        while current is not None and depth < self.FORBIDDEN_DEPTH:
+            if self._is_forbidden_self(current):
+                forbidden = max(forbidden, self.FORBIDDEN_DEPTH - depth)
             current = current.getparent()
             depth += 1
 
+        inside_a = elem.tag == 'a' or any(a.tag == 'a' for a in elem.iterancestors())
+        return forbidden, inside_a
+
+    def _is_forbidden_self(self, elem: HtmlElement) -> bool:
+        """Является ли сам элемент запрещённой зоной (тег, класс или id)."""
+        if elem.tag in self.FORBIDDEN_TAGS:
+            return True
+
+        cls = elem.get('class')
+        cid = elem.get('id')
+        if not cls and not cid:
+            return False
+
+        combined = f"{cls or ''} {cid or ''}".lower()
+        for pattern in self.FORBIDDEN_PATTERNS:
+            if pattern in combined:
+                return True
         return False
 
     def _insert_single_link(self, elem: HtmlElement, link: Link) -> bool:
@@ -1913,6 +2601,10 @@ class LinkInserter:
 
         БЕЗОПАСНЫЙ режим: работаем ТОЛЬКО с elem.text,
         никогда не трогаем дочерние элементы!
+
+        Исходный текст не переформатируется: ссылка и один пробел
+        вставляются перед началом слова, поэтому в файле меняется
+        только место вставки.
         """
         try:
             # Работаем ТОЛЬКО с прямым текстом элемента (не text_content!)
@@ -1922,27 +2614,22 @@ class LinkInserter:
             if len(raw_text.strip()) < self.min_text_length:
                 return False
 
-            words = raw_text.split()
-            if len(words) < 6:
+            word_starts = [m.start() for m in self._WORD_RE.finditer(raw_text)]
+            if len(word_starts) < 6:
                 return False
 
             # Выбираем позицию для вставки (не в начале и не в конце)
-            pos = random.randint(2, len(words) - 3)
+            pos = random.randint(2, len(word_starts) - 3)
+            split_at = word_starts[pos]
 
-            before = " ".join(words[:pos])
-            after = " ".join(words[pos:])
-
-            # Сохраняем пробелы
-            if raw_text.startswith((' ', '\n', '\t')):
-                before = raw_text[0] + before.lstrip()
-            if before and not before.endswith(' '):
-                before += ' '
-            if after and not after.startswith(' '):
-                after = ' ' + after
+            # before заканчивается исходным пробельным символом
+            before = raw_text[:split_at]
+            after = " " + raw_text[split_at:]
 
             # Создаём тег ссылки
             a_tag = etree.Element("a")
             a_tag.set("href", link.target.url)
+            a_tag.set(self.RUN_ATTR, self.active_run_id)
             a_tag.text = link.anchor
             a_tag.tail = after
 
@@ -1958,9 +2645,76 @@ class LinkInserter:
             return False
 
 
-    def _save_file(self, file_path: str, doc: HtmlElement, original_head: str, encoding: str):
+    def _save_file(self,
+                   file_path: str,
+                   raw: bytes,
+                   doc: HtmlElement,
+                   edits: Dict[HtmlElement, List[Any]],
+                   original_head: str,
+                   encoding: str,
+                   links: List[Link]):
+        """
+        Сохраняет файл.
+
+        Сначала пробуем точечную вставку в исходные байты (html_splice):
+        остальной файл остаётся байт-в-байт. Если сопоставить узлы
+        с исходником не удалось — полная пересборка через lxml.
+
+        Файл подменяется атомарно; при наличии журнала — через intent/commit.
+        """
+        data = self._splice_edits(raw, doc, edits, encoding)
+        if data is None:
+            logger.debug(f"Splice недоступен, полная пересборка: {file_path}")
+            data = self._serialize_document(doc, original_head, encoding)
+            if data is None:
+                return
+
+        if self.journal is not None:
+            self.journal.write_file(file_path, raw, data, links)
+        else:
+            _atomic_write(file_path, data)
+
+    def _splice_edits(self,
+                      raw: bytes,
+                      doc: HtmlElement,
+                      edits: Dict[HtmlElement, List[Any]],
+                      encoding: str) -> Optional[bytes]:
+        """Переносит вставленные ссылки в исходные байты. None — если не получилось."""
+        splicer = HtmlSplicer(raw, encoding)
+        if not splicer.supported:
+            return None
+
+        tags = {elem.tag for elem in edits}
+        splicer.index_tags(tags)
+
+        # Порядковый номер элемента среди одноимённых тегов документа
+        ordinals: Dict[HtmlElement, int] = {}
+        for tag in tags:
+            for i, elem in enumerate(doc.iter(tag)):
+                if elem in edits:
+                    ordinals[elem] = i
+
+        for elem, (original_text, count) in edits.items():
+            # Ссылки — первые count детей; каждая стоит перед словом,
+            # а её tail = " " + следующий кусок исходного текста
+            insertions = []
+            text_pos = len(elem.text or "")
+            for a_tag in elem[:count]:
+                fragment = html.tostring(a_tag, encoding='unicode', method='html', with_tail=False)
+                insertions.append((text_pos, fragment + " "))
+                text_pos += len(a_tag.tail or "") - 1
+
+            if elem not in ordinals or not splicer.insert_into_text(
+                    elem.tag, ordinals[elem], original_text, insertions):
+                return None
+
+        return splicer.result()
+
+    def _serialize_document(self, doc: HtmlElement, original_head: str, encoding: str) -> Optional[bytes]:
+        """Полная пересборка документа через lxml (fallback)."""
         body = doc.xpath('//body')
-        if not body: return
+        if not body:
+            return None
 
         # tostring может вернуть байты
         body_content = html.tostring(body[0], encoding='unicode', method='html')
@@ -1972,9 +2726,180 @@ class LinkInserter:
                 original_head = html.tostring(head[0], encoding='unicode', method='html')
 
         new_html = f"<!DOCTYPE html>\n<html>\n{original_head}\n{body_content}\n</html>"
+        return new_html.encode(encoding, errors='replace')
 
-        with open(file_path, 'w', encoding=encoding, errors='replace') as f:
-            f.write(new_html)
+
+def domains_template_index(base_dir: str, workers: int = 1,
+                           batch_size: Optional[int] = None) -> Optional[TemplateIndex]:
+    """
+    Индекс шаблонов доменов base_dir (поддиректория — домен, служебные
+    «.»-директории пропускаются). Хранится в base_dir/TEMPLATE_INDEX_FILE.
+    batch_size — см. site_template_index().
+    """
+    if not base_dir or not os.path.isdir(base_dir):
+        return None
+    site_dirs = [os.path.join(base_dir, d) for d in sorted(os.listdir(base_dir))
+                 if not d.startswith('.') and os.path.isdir(os.path.join(base_dir, d))]
+    return site_template_index(site_dirs, os.path.join(base_dir, TEMPLATE_INDEX_FILE),
+                               workers=workers, batch_size=batch_size)
+
+
+def _init_insert_worker():
+    """Инициализация процесса вставки: свой seed, чтобы форки не повторяли позиции."""
+    random.seed()
+
+
+def _process_file_group(task: Tuple['LinkInserter', str, List[Link], Optional[str]]):
+    """
+    Обрабатывает один файл в дочернем процессе.
+
+    Returns:
+        (stats, [(inserted, context), ...]) в порядке ссылок группы
+    """
+    inserter, file_path, links, template = task
+    inserter.stats = inserter._new_stats()
+    inserter._process_file(file_path, links, template)
+    return inserter.stats, [(link.inserted, link.context) for link in links]
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# LINK REMOVER — МАССОВОЕ УДАЛЕНИЕ ВСТАВЛЕННЫХ ССЫЛОК
+# ═══════════════════════════════════════════════════════════════════════════════
+class LinkRemover:
+    """
+    Удаляет ссылки, вставленные LinkInserter, по id запуска, целям или доменам.
+
+    Работает на байтах без разбора HTML: вставка добавляет ровно
+    `<a href="…" data-lk="ID">анкор</a> ` перед словом, поэтому удаление
+    этого фрагмента возвращает исходный текст байт-в-байт.
+
+    Фильтры объединяются по И; не заданный фильтр не ограничивает.
+
+    Пример:
+    ```python
+    remover = LinkRemover(domains={'deindexed.com'})
+    remover.run('/path/to/sites', dry_run=True)   # только подсчёт
+    remover.run('/path/to/sites', workers=8)      # удаление
+    ```
+    """
+
+    TAG_RE = re.compile(
+        rb'<a href="([^"]*)" ' + LinkInserter.RUN_ATTR.encode('ascii') +
+        rb'="([0-9a-z]+)">[^<]*</a> ?'
+    )
+    MARKER = LinkInserter.RUN_ATTR.encode('ascii') + b'="'
+
+    def __init__(self,
+                 run_ids: Optional[Set[str]] = None,
+                 targets: Optional[Set[str]] = None,
+                 domains: Optional[Set[str]] = None):
+        """
+        Args:
+            run_ids: Id запусков (stats['run_id'] вставки)
+            targets: URL целевых страниц (сравнение через normalize_url)
+            domains: Домены целевых страниц (вместе с поддоменами)
+        """
+        self.run_ids = {r.strip().lower() for r in run_ids if r.strip()} if run_ids else None
+        self.targets = {normalize_url(t.strip()) for t in targets if t.strip()} if targets else None
+        self.domains = {d.strip().lower() for d in domains if d.strip()} if domains else None
+
+        # Байтовый префильтр: файл без маркера даже не проверяется регуляркой
+        if self.run_ids:
+            self._markers = [self.MARKER + r.encode('ascii', 'ignore') + b'"' for r in self.run_ids]
+        else:
+            self._markers = [self.MARKER]
+
+    def _matches(self, href: bytes, run_id: bytes) -> bool:
+        if self.run_ids is not None and run_id.decode('ascii') not in self.run_ids:
+            return False
+        if self.targets is None and self.domains is None:
+            return True
+
+        url = unescape(href.decode('utf-8', errors='replace'))
+        if self.targets is not None and normalize_url(url) not in self.targets:
+            return False
+        if self.domains is not None and not domain_matches(urlparse(url).netloc, self.domains):
+            return False
+        return True
+
+    def strip_bytes(self, raw: bytes) -> Tuple[bytes, int]:
+        """Удаляет подходящие ссылки. Returns: (новые байты, сколько удалено)."""
+        if not any(marker in raw for marker in self._markers):
+            return raw, 0
+
+        removed = 0
+
+        def replace(m):
+            nonlocal removed
+            if self._matches(m.group(1), m.group(2)):
+                removed += 1
+                return b''
+            return m.group(0)
+
+        return self.TAG_RE.sub(replace, raw), removed
+
+    def process_file(self, file_path: str, dry_run: bool = False) -> int:
+        """Обрабатывает один файл. Returns: количество (найденных) удалённых ссылок."""
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+
+        data, removed = self.strip_bytes(raw)
+        if removed and not dry_run:
+            _atomic_write(file_path, data)
+        return removed
+
+    @staticmethod
+    def iter_html_files(directory: str):
+        """HTML-файлы директории (служебные dot-папки пропускаются)."""
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in files:
+                if name.endswith('.html'):
+                    yield os.path.join(root, name)
+
+    def run(self, directory: str, dry_run: bool = False, workers: int = 1) -> Dict[str, int]:
+        """
+        Проходит по корпусу и удаляет (или считает при dry_run) ссылки.
+
+        Returns:
+            {'files': просмотрено, 'files_matched': с совпадениями,
+             'links': ссылок, 'errors': ошибок чтения/записи}
+        """
+        stats = {'files': 0, 'files_matched': 0, 'links': 0, 'errors': 0}
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                tasks = ((self, path, dry_run) for path in self.iter_html_files(directory))
+                results = pool.map(_remove_links_in_file, tasks, chunksize=64)
+                for removed in results:
+                    self._count(stats, removed)
+        else:
+            for path in self.iter_html_files(directory):
+                self._count(stats, _remove_links_in_file((self, path, dry_run)))
+
+        action = "Найдено" if dry_run else "Удалено"
+        logger.info(f"{action} ссылок: {stats['links']} в {stats['files_matched']} файлах "
+                    f"(просмотрено {stats['files']})")
+        return stats
+
+    @staticmethod
+    def _count(stats: Dict[str, int], removed: int):
+        stats['files'] += 1
+        if removed < 0:
+            stats['errors'] += 1
+        elif removed:
+            stats['files_matched'] += 1
+            stats['links'] += removed
+
+
+def _remove_links_in_file(task: Tuple[LinkRemover, str, bool]) -> int:
+    """Удаление в одном файле (в том числе в дочернем процессе). -1 — ошибка."""
+    remover, file_path, dry_run = task
+    try:
+        return remover.process_file(file_path, dry_run=dry_run)
+    except Exception as e:
+        logger.error(f"Error removing links in {file_path}: {e}")
+        return -1
 
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -2193,10 +3118,16 @@ class SEOClusterLinker:
 
         return self.all_links
 
-    def insert_all_links(self) -> Dict[str, Any]:
+    def insert_all_links(self, workers: int = 1, journal_dir: Optional[str] = None) -> Dict[str, Any]:
         """
         Вставляет все созданные ссылки в HTML-файлы.
 
+        Args:
+            workers: Количество процессов для параллельной вставки
+            journal_dir: Директория журнала вставки. Если задана — прерванный
+                запуск продолжится с места остановки, а завершённый запуск
+                можно откатить через undo_insertions()
+
         Returns:
             Статистика вставки
         """
@@ -2204,7 +3135,35 @@ class SEOClusterLinker:
             logger.warning("Нет ссылок для вставки. Вызовите create_links() сначала.")
             return {}
 
-        return self.link_inserter.insert_links(self.all_links)
+        journal = InsertionJournal(journal_dir) if journal_dir else None
+        self.link_inserter.journal = journal
+        files = {link.source.file_path for link in self.all_links}
+        self.link_inserter.templates = self.template_index(workers, batch_size=len(files))
+        try:
+            return self.link_inserter.insert_links(self.all_links, workers=workers)
+        finally:
+            self.link_inserter.journal = None
+            self.link_inserter.templates = None
+            if journal is not None:
+                journal.close()
+
+    def template_index(self, workers: int = 1,
+                       batch_size: Optional[int] = None) -> Optional[TemplateIndex]:
+        """Индекс шаблонов всех доменов (base_dir/.linkovalka_templates.json)."""
+        return domains_template_index(self.base_dir, workers, batch_size=batch_size)
+
+    def undo_insertions(self, journal_dir: str, run_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Откатывает один запуск вставки по журналу (по умолчанию последний).
+
+        Returns:
+            {'restored': N, 'conflicts': N, 'missing': N, 'run_id': id}
+        """
+        journal = InsertionJournal(journal_dir)
+        try:
+            return journal.undo(run_id)
+        finally:
+            journal.close()
 
     def get_coverage_analysis(self, topic: str = None) -> Dict[str, Dict[str, Any]]:
         """
@@ -19,7 +19,7 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 from PyQt6.QtWebChannel import QWebChannel
 
-from seo_cluster_linker import AnchorMorpher
+from seo_cluster_linker import AnchorMorpher, normalize_url
 
 try:
     from pills import KEYWORDS
@@ -402,22 +402,7 @@ class VisualEditorWidget(QWidget):
 
     @staticmethod
     def _normalize_url(url: str) -> str:
-        try:
-            p = urlparse(url)
-            scheme = p.scheme or "https"
-            netloc = (p.netloc or "").lower()
-            path = p.path or "/"
-
-            if path.endswith(".html"):
-                path = path[:-5]
-            if path.endswith("/"):
-                path = path[:-1]
-            if not path.startswith("/"):
-                path = "/" + path
-
-            return f"{scheme}://{netloc}{path}"
-        except Exception:
-            return url
+        return normalize_url(url)
 
     def _resolve_href(self, page: VisualPage, href: str) -> Optional[str]:
         href = href.strip()
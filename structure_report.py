@@ -0,0 +1,448 @@
+"""
+structure_report.py — Пакетный анализ структуры страниц перед массовой заменой
+
+analyze_page_structure() работает с одной страницей; здесь тот же анализ
+прогоняется по всему корпусу (одному или нескольким сайтам) в пуле процессов,
+а результаты кэшируются по хешу файла. Повторный прогон по 20k страниц читает
+только изменившиеся файлы и занимает секунды.
+
+Принципы:
+1. Кэш — JSON в корне сайта (.linkovalka_structure.json): путь → sha1, размер,
+   mtime и результат. Совпал stat — файл не читается; изменился stat, но хеш
+   тот же — результат берётся из кэша без разбора.
+2. Разбор (ContentEngine) выполняется в пуле процессов с ограниченным окном
+   задач; кэш и сбор результатов — только в вызывающем потоке.
+3. Итог агрегируется по (домен, тип страницы) и выгружается в CSV.
+"""
+
+import os
+import csv
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import chardet
+
+from content_engine import analyze_page_structure
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LOGGING
+# ─────────────────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КОНСТАНТЫ
+# ─────────────────────────────────────────────────────────────────────────────
+CACHE_FILE_NAME = ".linkovalka_structure.json"
+
+# Меняется при изменении логики анализа: старый кэш тогда игнорируется
+ANALYZER_VERSION = 2
+
+# Статусы страницы (от лучшего к худшему)
+STATUS_OK = "ok"
+STATUS_NO_H1 = "no_h1"
+STATUS_NO_CONTAINER = "no_container"
+STATUS_NO_LISTING = "no_listing"
+STATUS_ERROR = "error"
+
+STATUSES = (STATUS_OK, STATUS_NO_H1, STATUS_NO_CONTAINER, STATUS_NO_LISTING, STATUS_ERROR)
+
+STATUS_LABELS = {
+    STATUS_OK: "OK",
+    STATUS_NO_H1: "Нет H1",
+    STATUS_NO_CONTAINER: "Нет контейнера",
+    STATUS_NO_LISTING: "Нет листинга",
+    STATUS_ERROR: "Ошибка",
+}
+
+LISTING_PAGE_TYPES = ("CATEGORY", "ARCHIVE")
+
+CSV_FIELDS = ("domain", "path", "status", "page_type", "container_selector",
+              "h1_text", "articles_count", "template", "error")
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# АНАЛИЗ ОДНОГО ФАЙЛА (выполняется в пуле процессов)
+# ─────────────────────────────────────────────────────────────────────────────
+def classify(analysis: Dict[str, Any]) -> str:
+    """Статус страницы по результату analyze_page_structure."""
+    if not analysis.get('container_found'):
+        if analysis.get('page_type') in LISTING_PAGE_TYPES:
+            return STATUS_NO_LISTING
+        return STATUS_NO_CONTAINER
+    if not analysis.get('h1_found'):
+        return STATUS_NO_H1
+    return STATUS_OK
+
+
+def analyze_file(path: str,
+                 domain: Optional[str] = None,
+                 known_sha1: Optional[str] = None,
+                 template: Optional[str] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Анализирует один HTML-файл.
+
+    Args:
+        path: Путь к файлу
+        domain: Ключ кэша профилей тем (директория сайта)
+        known_sha1: Хеш из кэша; если совпал — разбор пропускается
+        template: id шаблона (template_clusters.py) — профиль темы на шаблон
+
+    Returns:
+        (sha1, result) — result is None, если хеш совпал с known_sha1
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    sha1 = hashlib.sha1(raw).hexdigest()
+    if sha1 == known_sha1:
+        return sha1, None
+
+    try:
+        encoding = chardet.detect(raw).get('encoding') or 'utf-8'
+        analysis = analyze_page_structure(raw.decode(encoding, errors='replace'),
+                                          domain=domain, template=template)
+        analysis['status'] = classify(analysis)
+        analysis['error'] = ''
+    except Exception as e:
+        analysis = {
+            'page_type': 'UNKNOWN',
+            'container_found': False,
+            'container_selector': None,
+            'h1_found': False,
+            'h1_text': None,
+            'articles_count': 0,
+            'status': STATUS_ERROR,
+            'error': str(e),
+        }
+    return sha1, analysis
+
+
+def _analyze_task(task):
+    """Обёртка для пула процессов: (path, domain, known_sha1, template) → результат."""
+    return analyze_file(*task)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КЭШ
+# ─────────────────────────────────────────────────────────────────────────────
+class StructureCache:
+    """
+    Кэш результатов анализа одного сайта.
+
+    Записи: {rel_path: {'sha1', 'size', 'mtime', 'result'}}.
+    """
+
+    def __init__(self, site_dir: str):
+        self.path = os.path.join(site_dir, CACHE_FILE_NAME)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Кэш структуры повреждён, игнорирую: {self.path}: {e}")
+            return
+
+        if data.get('version') == ANALYZER_VERSION:
+            self.entries = data.get('files', {})
+
+    def lookup(self, rel_path: str, st: os.stat_result) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Returns:
+            (result, None) — файл не менялся (по stat);
+            (None, sha1) — stat изменился, нужна проверка хеша;
+            (None, None) — записи нет.
+        """
+        entry = self.entries.get(rel_path)
+        if entry is None:
+            return None, None
+        if entry['size'] == st.st_size and entry['mtime'] == st.st_mtime_ns:
+            return entry['result'], None
+        return None, entry['sha1']
+
+    def store(self, rel_path: str, st: os.stat_result, sha1: str, result: Dict[str, Any]):
+        self.entries[rel_path] = {
+            'sha1': sha1,
+            'size': st.st_size,
+            'mtime': st.st_mtime_ns,
+            'result': result,
+        }
+        self.dirty = True
+
+    def prune(self, alive: Iterable[str]):
+        """Удаляет записи о файлах, которых больше нет."""
+        alive = set(alive)
+        for rel_path in [p for p in self.entries if p not in alive]:
+            del self.entries[rel_path]
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = {'version': ANALYZER_VERSION, 'files': self.entries}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ОТЧЁТ
+# ─────────────────────────────────────────────────────────────────────────────
+def iter_site_html(site_dir: str):
+    """HTML-файлы сайта (служебные dot-директории пропускаются)."""
+    for root, dirs, files in os.walk(site_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for fname in files:
+            if fname.endswith('.html'):
+                full_path = os.path.join(root, fname)
+                yield os.path.relpath(full_path, site_dir)
+
+
+class StructureReport:
+    """
+    Пакетный анализ структуры страниц одного или нескольких сайтов.
+
+    Пример:
+    ```python
+    report = StructureReport(['/sites/a.com', '/sites/b.com'])
+    report.run(workers=8)
+    for row in report.summary():
+        print(row)
+    report.export_csv('report.csv')
+    ```
+    """
+
+    def __init__(self, site_dirs: List[str], templates=None):
+        """
+        Args:
+            site_dirs: Директории сайтов (имя директории — домен)
+            templates: TemplateIndex (template_clusters.py) — страницы одного
+                шаблона делят профиль темы, в отчёте появляется колонка template
+        """
+        self.site_dirs = [os.path.abspath(d) for d in site_dirs]
+        self.templates = templates
+        self.rows: List[Dict[str, Any]] = []
+        self.stats = {'files': 0, 'cached': 0, 'analyzed': 0, 'errors': 0}
+
+    @staticmethod
+    def domain_of(site_dir: str) -> str:
+        return os.path.basename(os.path.normpath(site_dir))
+
+    def _make_row(self, site_dir: str, rel_path: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        row = {'domain': self.domain_of(site_dir), 'path': rel_path}
+        row.update(result)
+        if self.templates is not None:
+            row['template'] = self.templates.template_of(os.path.join(site_dir, rel_path))
+        if row.get('status') == STATUS_ERROR:
+            self.stats['errors'] += 1
+        return row
+
+    def run(self,
+            workers: int = 1,
+            progress_callback: Optional[Callable[[int, int], None]] = None,
+            is_cancelled: Optional[Callable[[], bool]] = None) -> List[Dict[str, Any]]:
+        """
+        Анализирует все сайты.
+
+        Args:
+            workers: Размер пула процессов (1 — без пула)
+            progress_callback: callback(done, total)
+            is_cancelled: Проверка отмены; при True новые задачи не выдаются
+
+        Returns:
+            Строки отчёта (по одной на страницу)
+        """
+        is_cancelled = is_cancelled or (lambda: False)
+        self.rows = []
+        self.stats = {'files': 0, 'cached': 0, 'analyzed': 0, 'errors': 0}
+
+        caches: Dict[str, StructureCache] = {}
+        tasks = []   # (site_dir, rel_path, stat, known_sha1)
+
+        for site_dir in self.site_dirs:
+            cache = caches[site_dir] = StructureCache(site_dir)
+            rel_paths = list(iter_site_html(site_dir))
+            cache.prune(rel_paths)
+
+            for rel_path in rel_paths:
+                try:
+                    st = os.stat(os.path.join(site_dir, rel_path))
+                except OSError:
+                    continue
+                result, known_sha1 = cache.lookup(rel_path, st)
+                if result is not None:
+                    self.rows.append(self._make_row(site_dir, rel_path, result))
+                    self.stats['cached'] += 1
+                else:
+                    tasks.append((site_dir, rel_path, st, known_sha1))
+
+        total = len(self.rows) + len(tasks)
+        self.stats['files'] = total
+        done = len(self.rows)
+        if progress_callback:
+            progress_callback(done, total)
+
+        def handle(task, outcome):
+            nonlocal done
+            site_dir, rel_path, st, known_sha1 = task
+            cache = caches[site_dir]
+            sha1, result = outcome
+            if result is None:
+                result = cache.entries[rel_path]['result']
+                self.stats['cached'] += 1
+            else:
+                self.stats['analyzed'] += 1
+            cache.store(rel_path, st, sha1, result)
+            self.rows.append(self._make_row(site_dir, rel_path, result))
+            done += 1
+            if progress_callback:
+                progress_callback(done, total)
+
+        def job(task):
+            site_dir, rel_path, st, known_sha1 = task
+            path = os.path.join(site_dir, rel_path)
+            template = self.templates.template_of(path) if self.templates is not None else None
+            return path, site_dir, known_sha1, template
+
+        try:
+            if workers <= 1 or len(tasks) <= 1:
+                for task in tasks:
+                    if is_cancelled():
+                        break
+                    try:
+                        handle(task, analyze_file(*job(task)))
+                    except OSError as e:
+                        logger.warning(f"Не удалось прочитать {task[1]}: {e}")
+            else:
+                self._run_pool(tasks, job, handle, workers, is_cancelled)
+        finally:
+            # Частичный результат тоже полезен при следующем прогоне
+            for cache in caches.values():
+                try:
+                    cache.save()
+                except OSError as e:
+                    logger.warning(f"Не удалось сохранить кэш {cache.path}: {e}")
+
+        self.rows.sort(key=lambda r: (r['domain'], r['path']))
+        return self.rows
+
+    @staticmethod
+    def _run_pool(tasks, job, handle, workers, is_cancelled):
+        """Пул процессов с ограниченным окном задач (как в ReplaceWorker)."""
+        pending = iter(tasks)
+        in_flight = {}
+        window = workers * 4
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                while not is_cancelled() and len(in_flight) < window:
+                    task = next(pending, None)
+                    if task is None:
+                        break
+                    in_flight[pool.submit(_analyze_task, job(task))] = task
+
+                if not in_flight or is_cancelled():
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = in_flight.pop(future)
+                    try:
+                        handle(task, future.result())
+                    except OSError as e:
+                        logger.warning(f"Не удалось прочитать {task[1]}: {e}")
+
+            for future in in_flight:
+                future.cancel()
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # АГРЕГАЦИЯ И ЭКСПОРТ
+    # ─────────────────────────────────────────────────────────────────────────
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Сводка по (домен, тип страницы).
+
+        Returns:
+            [{'domain', 'page_type', 'total', <статус>: count, ...}, ...]
+        """
+        groups: Dict[Tuple[str, str], Dict[str, Any]] = OrderedDict()
+        for row in sorted(self.rows, key=lambda r: (r['domain'], r['page_type'])):
+            key = (row['domain'], row['page_type'])
+            group = groups.get(key)
+            if group is None:
+                group = {'domain': key[0], 'page_type': key[1], 'total': 0}
+                group.update({status: 0 for status in STATUSES})
+                groups[key] = group
+            group['total'] += 1
+            group[row['status']] += 1
+        return list(groups.values())
+
+    def problems(self) -> List[Dict[str, Any]]:
+        """Страницы, на которых замена контента не пройдёт или пройдёт неполно."""
+        return [r for r in self.rows if r['status'] != STATUS_OK]
+
+    def export_csv(self, path: str, summary: bool = False):
+        """
+        Выгружает отчёт в CSV (разделитель ';', UTF-8 с BOM — открывается в Excel).
+
+        Args:
+            path: Куда сохранить
+            summary: True — сводка по доменам/типам, False — построчно
+        """
+        if summary:
+            fields = ('domain', 'page_type', 'total') + STATUSES
+            rows = self.summary()
+        else:
+            fields = CSV_FIELDS
+            rows = self.rows
+
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, delimiter=';', extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({k: ('' if row.get(k) is None else row.get(k)) for k in fields})
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ТЕСТ
+# ─────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    import sys
+    import time
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if len(sys.argv) < 2:
+        print("Использование: python structure_report.py <site_dir> [site_dir ...] [--csv report.csv]")
+        sys.exit(1)
+
+    args = sys.argv[1:]
+    csv_path = None
+    if '--csv' in args:
+        i = args.index('--csv')
+        csv_path = args[i + 1]
+        args = args[:i] + args[i + 2:]
+
+    report = StructureReport(args)
+    for attempt in ("холодный", "из кэша"):
+        t0 = time.perf_counter()
+        report.run(workers=os.cpu_count() or 1)
+        print(f"Прогон ({attempt}): {time.perf_counter() - t0:.2f}s {report.stats}")
+
+    for group in report.summary():
+        counts = ", ".join(f"{STATUS_LABELS[s]}: {group[s]}" for s in STATUSES if group[s])
+        print(f"{group['domain']:<30} {group['page_type']:<10} {group['total']:>6}  {counts}")
+
+    if csv_path:
+        report.export_csv(csv_path)
+        print(f"CSV: {csv_path}")
@@ -0,0 +1,580 @@
+"""
+template_clusters.py — Кластеризация страниц корпуса по шаблонам (темам)
+
+На 300 доменах всего пара десятков тем, но движки (ContentEngine, LinkInserter)
+разбирают каждую страницу как незнакомую. Здесь страницы группируются
+по структуре DOM, чтобы решения (где контейнер, листинг, H1) принимались
+один раз на шаблон.
+
+Принципы:
+1. Подпись страницы — множество «путей тегов» от body вглубь (тег + классы
+   без цифр), ограниченное по глубине. Текст и порядок блоков не важны.
+2. MinHash сжимает множество до NUM_PERM чисел; LSH по полосам (bands)
+   даёт кандидатов без попарного сравнения — O(n), масштабируется до 100k.
+3. Кандидаты с оценкой сходства ≥ SIMILARITY_THRESHOLD объединяются
+   через union-find; компонента связности — шаблон.
+4. template_id стабилен между прогонами (хеш подписи представителя)
+   и передаётся в ContentEngine(template=...) — ThemeProfileCache тогда
+   хранит профиль на шаблон, общий для всех доменов этой темы;
+   LinkInserter(templates=...) так же запоминает контейнер на шаблон.
+5. load_or_build_index() хранит индекс рядом с сайтами вместе с подписями
+   страниц и при изменениях подписывает только новые и изменённые файлы;
+   остальные берутся из сохранённого индекса. Для небольших пакетов
+   (меньше MIN_INDEX_BATCH страниц) индекс не строится вовсе.
+"""
+
+import os
+import re
+import json
+import zlib
+import hashlib
+import logging
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import chardet
+from lxml import html
+
+from content_engine import FINGERPRINT_SKIP_TAGS
+from html_splice import locate_body
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LOGGING
+# ─────────────────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КОНСТАНТЫ
+# ─────────────────────────────────────────────────────────────────────────────
+# Максимальная глубина пути тегов (глубже — уже содержимое записи)
+SHINGLE_DEPTH = 8
+
+# Размер MinHash-подписи и разбиение на полосы LSH (BANDS * ROWS == NUM_PERM).
+# Порог срабатывания LSH ≈ (1 / BANDS) ** (1 / ROWS) ≈ 0.5
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+
+# Минимальное оценённое сходство (Жаккар) для объединения в шаблон
+SIMILARITY_THRESHOLD = 0.7
+
+# Сколько страниц хранится в одной корзине LSH: страницам одного шаблона
+# хватает нескольких представителей, а сравнений остаётся O(n)
+LSH_BUCKET_CAP = 8
+
+# Файл индекса в директории сайта (сайтов)
+TEMPLATE_INDEX_FILE = ".linkovalka_templates.json"
+INDEX_VERSION = 2
+
+# Пакет меньше — индекс не строится (берётся сохранённый, если есть):
+# подпись страницы стоит дороже, чем выигрыш движков на паре страниц
+MIN_INDEX_BATCH = 200
+
+_DIGITS_RE = re.compile(r'\d+')
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Фиксированные коэффициенты: подписи сравнимы между процессами и прогонами
+_OPH_A = 0x1f3d5b79a2c4e6f1 % _MERSENNE_PRIME
+_OPH_B = 0x0badc0ffee123457 % _MERSENNE_PRIME
+_OPH_STEP = 0x9e3779b1
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ПОДПИСЬ СТРАНИЦЫ
+# ─────────────────────────────────────────────────────────────────────────────
+def _node_label(elem) -> str:
+    classes = ' '.join(sorted({_DIGITS_RE.sub('', c) for c in (elem.get('class') or '').split()}))
+    return f"{elem.tag}.{classes}" if classes else elem.tag
+
+
+def tag_path_shingles(html_content: str, depth: int = SHINGLE_DEPTH) -> Set[int]:
+    """
+    Множество хешей путей тегов body (до depth уровней).
+
+    Разбирается только диапазон <body>, как в ContentEngine.
+    """
+    span = locate_body(html_content)
+    source = html_content[span[0]:span[1]] if span else html_content
+    try:
+        doc = html.document_fromstring(source)
+    except Exception:
+        return set()
+    body = doc.find('body')
+    if body is None:
+        return set()
+
+    shingles = set()
+    stack = [(child, 'body', 1) for child in body]
+    while stack:
+        elem, parent_path, level = stack.pop()
+        if not isinstance(elem.tag, str) or elem.tag in FINGERPRINT_SKIP_TAGS:
+            continue
+        path = f"{parent_path}/{_node_label(elem)}"
+        shingles.add(zlib.crc32(path.encode('utf-8')))
+        if level < depth:
+            stack.extend((child, path, level + 1) for child in elem)
+    return shingles
+
+
+def minhash(shingles: Iterable[int]) -> Tuple[int, ...]:
+    """
+    MinHash-подпись множества (NUM_PERM значений).
+
+    One permutation hashing: каждый элемент хешируется один раз и попадает
+    в одну из NUM_PERM корзин, в корзине берётся минимум — O(n) вместо
+    O(n * NUM_PERM). Пустые корзины заполняются из ближайшей непустой
+    справа со сдвигом на расстояние (densification), поэтому подписи
+    маленьких множеств остаются сравнимыми.
+    """
+    mins = [None] * NUM_PERM
+    for s in shingles:
+        h = (_OPH_A * s + _OPH_B) % _MERSENNE_PRIME
+        slot = h % NUM_PERM
+        value = (h // NUM_PERM) & _MAX_HASH
+        current = mins[slot]
+        if current is None or value < current:
+            mins[slot] = value
+
+    if all(v is None for v in mins):
+        return (_MAX_HASH,) * NUM_PERM
+
+    signature = list(mins)
+    for i in range(NUM_PERM):
+        if signature[i] is None:
+            distance = 1
+            while mins[(i + distance) % NUM_PERM] is None:
+                distance += 1
+            signature[i] = (mins[(i + distance) % NUM_PERM] + distance * _OPH_STEP) & _MAX_HASH
+    return tuple(signature)
+
+
+def signature_similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """Оценка сходства Жаккара по двум подписям."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def page_signature(path: str) -> Tuple[Tuple[int, ...], int]:
+    """
+    Подпись HTML-файла (выполняется в пуле процессов).
+
+    Returns:
+        (minhash, число путей тегов)
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    encoding = chardet.detect(raw).get('encoding') or 'utf-8'
+    shingles = tag_path_shingles(raw.decode(encoding, errors='replace'))
+    return minhash(shingles), len(shingles)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LSH + UNION-FIND
+# ─────────────────────────────────────────────────────────────────────────────
+class _UnionFind:
+    def __init__(self):
+        self.parent: List[int] = []
+
+    def add(self) -> int:
+        self.parent.append(len(self.parent))
+        return len(self.parent) - 1
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # Меньший индекс — корень: представитель не зависит от порядка слияний
+            if rb < ra:
+                ra, rb = rb, ra
+            self.parent[rb] = ra
+
+
+@dataclass
+class TemplateGroup:
+    """Шаблон (тема) — группа структурно похожих страниц."""
+    template_id: str
+    pages: List[str] = field(default_factory=list)
+    domains: Counter = field(default_factory=Counter)
+    cohesion: float = 0.0        # Среднее сходство страниц с представителем
+    avg_paths: float = 0.0       # Среднее число путей тегов на страницу
+
+    @property
+    def size(self) -> int:
+        return len(self.pages)
+
+    def stats(self) -> Dict:
+        return {
+            'template_id': self.template_id,
+            'pages': self.size,
+            'domains': len(self.domains),
+            'top_domains': self.domains.most_common(5),
+            'cohesion': round(self.cohesion, 3),
+            'avg_paths': round(self.avg_paths, 1),
+            'example': self.pages[0] if self.pages else None,
+        }
+
+
+class TemplateClusterer:
+    """
+    Группировка подписей страниц в шаблоны.
+
+    Пример:
+    ```python
+    clusterer = TemplateClusterer()
+    for path, domain in pages:
+        clusterer.add(path, *page_signature(path), domain=domain)
+    for group in clusterer.groups():
+        print(group.stats())
+    ```
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self.page_ids: List[str] = []
+        self.domains: List[Optional[str]] = []
+        self.signatures: List[Tuple[int, ...]] = []
+        self.path_counts: List[int] = []
+        self._buckets: List[Dict[Tuple[int, ...], List[int]]] = [
+            defaultdict(list) for _ in range(LSH_BANDS)
+        ]
+        self._uf = _UnionFind()
+        self.comparisons = 0
+
+    def add(self, page_id: str, signature: Tuple[int, ...], path_count: int = 0,
+            domain: Optional[str] = None):
+        """Добавляет страницу и сразу объединяет её с похожими кандидатами LSH."""
+        idx = self._uf.add()
+        self.page_ids.append(page_id)
+        self.domains.append(domain)
+        self.signatures.append(signature)
+        self.path_counts.append(path_count)
+
+        # Кандидаты — страницы с совпадающей хотя бы одной полосой
+        candidates = Counter()
+        for band, buckets in enumerate(self._buckets):
+            key = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+            bucket = buckets[key]
+            candidates.update(bucket)
+            if len(bucket) < LSH_BUCKET_CAP:
+                bucket.append(idx)
+
+        # Сначала кандидаты с большим числом общих полос; компонента, с которой
+        # уже объединились, дальше не сравнивается (кандидатов не больше
+        # LSH_BANDS * LSH_BUCKET_CAP)
+        for other, _ in sorted(candidates.items(), key=lambda kv: (-kv[1], kv[0])):
+            if self._uf.find(other) == self._uf.find(idx):
+                continue
+            self.comparisons += 1
+            if signature_similarity(signature, self.signatures[other]) >= self.threshold:
+                self._uf.union(idx, other)
+
+    def groups(self) -> List[TemplateGroup]:
+        """Шаблоны, от крупных к мелким."""
+        members: Dict[int, List[int]] = defaultdict(list)
+        for idx in range(len(self.page_ids)):
+            members[self._uf.find(idx)].append(idx)
+
+        result = []
+        for root, idxs in members.items():
+            rep_sig = self.signatures[root]
+            raw = ','.join(map(str, rep_sig)).encode('ascii')
+            group = TemplateGroup(template_id='tpl-' + hashlib.sha1(raw).hexdigest()[:12])
+            for idx in idxs:
+                group.pages.append(self.page_ids[idx])
+                if self.domains[idx]:
+                    group.domains[self.domains[idx]] += 1
+            group.cohesion = sum(signature_similarity(rep_sig, self.signatures[i]) for i in idxs) / len(idxs)
+            group.avg_paths = sum(self.path_counts[i] for i in idxs) / len(idxs)
+            result.append(group)
+
+        result.sort(key=lambda g: (-g.size, g.template_id))
+        return result
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ИНДЕКС ШАБЛОНОВ КОРПУСА
+# ─────────────────────────────────────────────────────────────────────────────
+@dataclass
+class _PageEntry:
+    domain: Optional[str]
+    path_count: int
+    signature: Tuple[int, ...]
+    stamp: Optional[List[float]]     # [размер, mtime] на момент подписи
+
+
+class TemplateIndex:
+    """
+    Результат кластеризации: страница → template_id и статистика шаблонов.
+
+    template_of(path) передаётся движкам как ключ профиля
+    (ContentEngine(template=...), replace_content_file(..., template=...)).
+    entries — подписи страниц в порядке кластеризации (для пересчёта
+    только изменившихся файлов).
+    """
+
+    def __init__(self, groups: List[TemplateGroup],
+                 entries: Optional[Dict[str, _PageEntry]] = None):
+        self.groups = groups
+        self.entries: Dict[str, _PageEntry] = entries or {}
+        self._by_page: Dict[str, str] = {}
+        for group in groups:
+            for page in group.pages:
+                self._by_page[os.path.abspath(page)] = group.template_id
+
+    def template_of(self, path: str) -> Optional[str]:
+        return self._by_page.get(os.path.abspath(path))
+
+    def pages(self) -> Set[str]:
+        return set(self._by_page)
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def stats(self) -> List[Dict]:
+        return [group.stats() for group in self.groups]
+
+    def save(self, path: str):
+        data = {
+            'version': INDEX_VERSION,
+            'groups': [
+                {'template_id': g.template_id, 'pages': g.pages, 'domains': dict(g.domains),
+                 'cohesion': g.cohesion, 'avg_paths': g.avg_paths}
+                for g in self.groups
+            ],
+            'pages': [
+                [page, e.domain, e.path_count, _signature_hex(e.signature), e.stamp]
+                for page, e in self.entries.items()
+            ],
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TemplateIndex':
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+            raise ValueError("старый формат индекса шаблонов")
+        groups = [
+            TemplateGroup(template_id=d['template_id'], pages=d['pages'],
+                          domains=Counter(d['domains']), cohesion=d['cohesion'],
+                          avg_paths=d['avg_paths'])
+            for d in data['groups']
+        ]
+        entries = {
+            page: _PageEntry(domain, count, _signature_from_hex(sig_hex), stamp)
+            for page, domain, count, sig_hex, stamp in data['pages']
+        }
+        return cls(groups, entries)
+
+
+def _signature_hex(signature: Tuple[int, ...]) -> str:
+    return b''.join(v.to_bytes(4, 'big') for v in signature).hex()
+
+
+def _signature_from_hex(value: str) -> Tuple[int, ...]:
+    raw = bytes.fromhex(value)
+    return tuple(int.from_bytes(raw[i:i + 4], 'big') for i in range(0, len(raw), 4))
+
+
+def _stamp(path: str) -> Optional[List[float]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime]
+
+
+def _collect_pages(site_dirs: List[str]) -> List[Tuple[str, str]]:
+    """[(абсолютный путь HTML-файла, домен), ...] в детерминированном порядке."""
+    tasks = []
+    for site_dir in site_dirs:
+        domain = os.path.basename(os.path.normpath(site_dir))
+        for root, dirs, files in os.walk(site_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for fname in files:
+                if fname.endswith('.html'):
+                    tasks.append((os.path.abspath(os.path.join(root, fname)), domain))
+    # Порядок добавления определяет представителей
+    tasks.sort()
+    return tasks
+
+
+def build_template_index(site_dirs: List[str],
+                         workers: int = 1,
+                         progress_callback: Optional[Callable[[int, int], None]] = None) -> TemplateIndex:
+    """
+    Кластеризует все HTML-файлы сайтов по шаблонам.
+
+    Подписи считаются в пуле процессов (ограниченное окно задач),
+    LSH и union-find — в вызывающем потоке по мере готовности.
+
+    Args:
+        site_dirs: Директории сайтов (имя директории — домен)
+        workers: Размер пула процессов (1 — без пула)
+        progress_callback: callback(done, total)
+    """
+    return _build_index(_collect_pages(site_dirs), workers, progress_callback)
+
+
+def load_index(index_path: str) -> Optional[TemplateIndex]:
+    """Сохранённый индекс или None (нет файла, старый формат, ошибка чтения)."""
+    if not os.path.isfile(index_path):
+        return None
+    try:
+        return TemplateIndex.load(index_path)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Индекс шаблонов не прочитан: {e}")
+        return None
+
+
+def load_or_build_index(site_dirs: List[str],
+                        index_path: str,
+                        workers: int = 1,
+                        progress_callback: Optional[Callable[[int, int], None]] = None) -> TemplateIndex:
+    """
+    Индекс HTML-файлов сайтов с обновлением сохранённого в index_path.
+
+    Подписи неизменившихся файлов (тот же размер и mtime) берутся из
+    сохранённого индекса и кластеризуются первыми — их шаблоны и
+    template_id сохраняются; подписываются только новые и изменённые файлы.
+    """
+    tasks = _collect_pages(site_dirs)
+    saved = load_index(index_path)
+    known = saved.entries if saved is not None else {}
+
+    stamps = {path: _stamp(path) for path, _ in tasks}
+    kept = {path: entry for path, entry in known.items()
+            if path in stamps and entry.stamp is not None and entry.stamp == stamps[path]}
+    if saved is not None and len(kept) == len(known) == len(tasks):
+        return saved
+
+    fresh = [(path, domain) for path, domain in tasks if path not in kept]
+    index = _build_index(fresh, workers, progress_callback, known=kept, stamps=stamps)
+    logger.info(f"Индекс шаблонов: подписано {len(fresh)} из {len(tasks)} страниц")
+    try:
+        index.save(index_path)
+    except OSError as e:
+        logger.warning(f"Не удалось сохранить индекс шаблонов: {e}")
+    return index
+
+
+def site_template_index(site_dirs: List[str],
+                        index_path: str,
+                        workers: int = 1,
+                        progress_callback: Optional[Callable[[int, int], None]] = None,
+                        batch_size: Optional[int] = None) -> Optional[TemplateIndex]:
+    """
+    load_or_build_index() для движков: при ошибке — None (работа без шаблонов,
+    профили по домену, как раньше).
+
+    batch_size — сколько страниц обработает вызывающий; меньше
+    MIN_INDEX_BATCH — только сохранённый индекс, без подписи страниц.
+    """
+    if batch_size is not None and batch_size < MIN_INDEX_BATCH:
+        return load_index(index_path)
+    try:
+        return load_or_build_index(site_dirs, index_path, workers, progress_callback)
+    except Exception as e:
+        logger.warning(f"Индекс шаблонов недоступен: {e}")
+        return None
+
+
+def _build_index(tasks: List[Tuple[str, str]],
+                 workers: int,
+                 progress_callback: Optional[Callable[[int, int], None]],
+                 known: Optional[Dict[str, _PageEntry]] = None,
+                 stamps: Optional[Dict[str, Optional[List[float]]]] = None) -> TemplateIndex:
+    total = len(tasks)
+    clusterer = TemplateClusterer()
+    entries: Dict[str, _PageEntry] = {}
+    for path, entry in (known or {}).items():
+        clusterer.add(path, entry.signature, entry.path_count, domain=entry.domain)
+        entries[path] = entry
+
+    results: Dict[int, Tuple[Tuple[int, ...], int]] = {}
+    next_to_add = 0
+
+    def flush():
+        # Добавляем в порядке tasks, даже если пул вернул результаты вразнобой
+        nonlocal next_to_add
+        while next_to_add in results:
+            path, domain = tasks[next_to_add]
+            signature, count = results.pop(next_to_add)
+            if signature is not None:
+                clusterer.add(path, signature, count, domain=domain)
+                entries[path] = _PageEntry(domain, count, signature, (stamps or {}).get(path))
+            next_to_add += 1
+            if progress_callback:
+                progress_callback(next_to_add, total)
+
+    def compute(i):
+        try:
+            return page_signature(tasks[i][0])
+        except OSError as e:
+            logger.warning(f"Не удалось прочитать {tasks[i][0]}: {e}")
+            return None, 0
+
+    if workers <= 1 or total <= 1:
+        for i in range(total):
+            results[i] = compute(i)
+            flush()
+    else:
+        pending = iter(range(total))
+        in_flight = {}
+        window = workers * 4
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                while len(in_flight) < window:
+                    i = next(pending, None)
+                    if i is None:
+                        break
+                    in_flight[pool.submit(page_signature, tasks[i][0])] = i
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = in_flight.pop(future)
+                    try:
+                        results[i] = future.result()
+                    except OSError as e:
+                        logger.warning(f"Не удалось прочитать {tasks[i][0]}: {e}")
+                        results[i] = (None, 0)
+                flush()
+
+    groups = clusterer.groups()
+    logger.info(f"Шаблонов: {len(groups)} на {len(entries)} страниц "
+                f"(сравнений подписей: {clusterer.comparisons})")
+    return TemplateIndex(groups, entries)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ТЕСТ
+# ─────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    import sys
+    import time
+
+    logging.basicConfig(level=logging.INFO)
+
+    if len(sys.argv) < 2:
+        print("Использование: python template_clusters.py <site_dir> [site_dir ...]")
+        sys.exit(1)
+
+    t0 = time.perf_counter()
+    index = build_template_index(sys.argv[1:], workers=os.cpu_count() or 1)
+    print(f"Готово за {time.perf_counter() - t0:.2f}s, шаблонов: {len(index)}")
+    for s in index.stats()[:30]:
+        print(f"{s['template_id']}  страниц: {s['pages']:>6}  доменов: {s['domains']:>4}  "
+              f"сходство: {s['cohesion']:.2f}  пример: {s['example']}")
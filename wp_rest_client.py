@@ -0,0 +1,449 @@
+"""
+wp_rest_client.py — Общий HTTP-клиент для WordPress REST API
+
+Анализ PBN ходит на сотни доменов; по одному домену за раз и с новым
+соединением на каждый запрос это почти час ожидания сети. Клиент держит
+один пул соединений и раздаёт запросы из пула потоков.
+
+Принципы:
+1. Один requests.Session на всё: keep-alive и TLS-сессии переиспользуются.
+2. Два лимита: общий (concurrency) и на хост (per_host) — чужой сайт
+   не получает больше per_host одновременных запросов.
+3. Таймауты (connect, read) на каждый запрос; 429/5xx и обрывы соединения
+   повторяются urllib3 Retry с экспоненциальной паузой (учитывая Retry-After).
+4. map_domains() отдаёт результаты по мере готовности — таблица
+   заполняется, не дожидаясь самого медленного домена.
+5. С cache (HttpResponseCache) коллекции запрашиваются условно:
+   неизменившийся ответ приходит как 304 без тела.
+6. Пагинация: после первой страницы X-WP-TotalPages известен, страницы
+   2..N запрашиваются параллельно (в пределах per_host) и собираются
+   по порядку. Без заголовка — последовательно, как раньше.
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+import urllib3
+from http_cache import CachedResponse, HttpResponseCache, cache_key
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ─────────────────────────────────────────────────────────────────────────────
+# LOGGING
+# ─────────────────────────────────────────────────────────────────────────────
+logger = logging.getLogger(__name__)
+
+# Сертификаты PBN-доменов часто битые — проверка отключена, как и раньше
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КОНСТАНТЫ
+# ─────────────────────────────────────────────────────────────────────────────
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+DEFAULT_CONCURRENCY = 16     # Одновременных запросов всего
+DEFAULT_PER_HOST = 2         # Одновременных запросов к одному сайту
+DEFAULT_TIMEOUT = (5, 15)    # (connect, read), сек
+DEFAULT_RETRIES = 2
+DEFAULT_PER_PAGE = 100       # Максимум WP REST API
+DEFAULT_MAX_PAGES = 20       # Не больше 2000 записей на коллекцию; None — без лимита
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class WpRestClient:
+    """
+    Потокобезопасный клиент WP REST API с пулом соединений и лимитами.
+
+    Пример:
+    ```python
+    client = WpRestClient(concurrency=16, per_host=2)
+    for domain, posts, error in client.map_domains(
+            lambda d: client.fetch_collection(d, "posts"), domains):
+        ...
+    client.close()
+    ```
+    """
+
+    def __init__(self,
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 per_host: int = DEFAULT_PER_HOST,
+                 timeout=DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES,
+                 user_agent: str = DEFAULT_USER_AGENT,
+                 verify: bool = False,
+                 cache: Optional[HttpResponseCache] = None):
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.verify = verify
+        self.cache = cache
+        self.bytes_downloaded = 0
+
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": user_agent, "Accept": "application/json"})
+        retry = Retry(
+            total=retries, connect=retries, read=retries, status=retries,
+            backoff_factor=0.5, status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            respect_retry_after_header=True, raise_on_status=False,
+        )
+        # pool_connections — сколько хостов держать «тёплыми», pool_maxsize —
+        # соединений на хост (не меньше per_host, иначе лишние закрываются)
+        adapter = HTTPAdapter(pool_connections=self.concurrency * 2,
+                              pool_maxsize=self.per_host, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._host_slots = {}
+        self._host_lock = threading.Lock()
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc.lower()
+        with self._host_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return slot
+
+    def get(self, url: str, params=None, timeout=None, headers=None) -> requests.Response:
+        """GET с учётом лимитов; исключения requests пробрасываются."""
+        return self.get_timed(url, params=params, timeout=timeout, headers=headers)[0]
+
+    def get_timed(self, url: str, params=None, timeout=None,
+                  headers=None) -> Tuple[requests.Response, float]:
+        """GET + время ответа (без ожидания свободного слота)."""
+        with self._host_slot(url), self._slots:
+            started = time.perf_counter()
+            response = self.session.get(url, params=params, headers=headers,
+                                        timeout=timeout or self.timeout, verify=self.verify)
+            elapsed = time.perf_counter() - started
+        with self._host_lock:
+            self.bytes_downloaded += len(response.content)
+        return response, elapsed
+
+    def get_cached(self, url: str, params=None, timeout=None) -> Tuple[CachedResponse, float]:
+        """
+        GET через HttpResponseCache: свежая запись — без запроса,
+        иначе условный запрос; на 304 тело берётся из кэша.
+
+        Время ответа: сетевое, а для свежей записи — сохранённое.
+        """
+        if self.cache is None:
+            response, elapsed = self.get_timed(url, params=params, timeout=timeout)
+            return response, elapsed
+
+        key = cache_key(url, params)
+        entry = self.cache.load(key)
+        if entry is not None and self.cache.is_fresh(entry):
+            return self.cache.response(entry, "fresh"), entry.get("elapsed", 0.0)
+
+        conditional = self.cache.conditional_headers(entry) if entry is not None else None
+        response, elapsed = self.get_timed(url, params=params, timeout=timeout, headers=conditional)
+
+        if response.status_code == 304 and entry is not None:
+            cached = self.cache.response(entry, "revalidated")
+            # Продлеваем свежесть и обновляем валидаторы
+            self.cache.store(key, url, cached, elapsed, headers=response.headers)
+            return cached, elapsed
+
+        self.cache.count_miss()
+        if response.status_code == 200:
+            self.cache.store(key, url, response, elapsed)
+        return response, elapsed
+
+    def _fetch_page(self, url: str, params: Optional[dict], page: int,
+                    per_page: int) -> Tuple[Optional[list], Any, float]:
+        """Одна страница коллекции: (элементы или None, заголовки, время ответа)."""
+        r, elapsed = self.get_cached(url, params={**(params or {}), "per_page": per_page, "page": page})
+        if r.status_code != 200:
+            return None, r.headers, elapsed
+        data = r.json()
+        return (data if isinstance(data, list) else None), r.headers, elapsed
+
+    def fetch_pages(self, url: str, params: Optional[dict] = None,
+                    per_page: int = DEFAULT_PER_PAGE,
+                    max_pages: Optional[int] = DEFAULT_MAX_PAGES,
+                    is_cancelled: Callable[[], bool] = None) -> List[Tuple[list, float]]:
+        """
+        Все страницы коллекции WP REST API: [(элементы, время ответа), ...] по порядку.
+
+        Первая страница сообщает X-WP-TotalPages, остальные (до max_pages)
+        запрашиваются параллельно, не больше per_host одновременно.
+        Ошибка на странице обрывает результат перед ней — пропусков в середине нет;
+        после ошибки или отмены метод не ждёт страниц, которые уже не нужны.
+        """
+        def cancelled():
+            return is_cancelled is not None and is_cancelled()
+
+        try:
+            data, headers, elapsed = self._fetch_page(url, params, 1, per_page)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"API Error [{url}]: {e}")
+            return []
+        if not data:
+            return []
+        pages = [(data, elapsed)]
+
+        try:
+            total = int(headers.get("X-WP-TotalPages", ""))
+        except ValueError:
+            total = None
+
+        if total is None:
+            # Заголовок срезан прокси/плагином — идём по страницам, пока они полные
+            page = 1
+            while len(data) >= per_page and (max_pages is None or page < max_pages) and not cancelled():
+                page += 1
+                try:
+                    data, _, elapsed = self._fetch_page(url, params, page, per_page)
+                except (requests.RequestException, ValueError) as e:
+                    logger.warning(f"API Error [{url}, page {page}]: {e}")
+                    break
+                if not data:
+                    break
+                pages.append((data, elapsed))
+            return pages
+
+        last = total if max_pages is None else min(total, max_pages)
+        if last < total:
+            logger.warning(f"{url}: {total} страниц, загружено {last} (max_pages)")
+        if last < 2:
+            return pages
+
+        def fetch(page):
+            if cancelled():
+                return None
+            try:
+                return self._fetch_page(url, params, page, per_page)
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"API Error [{url}, page {page}]: {e}")
+                return None
+
+        window = min(self.per_host, last - 1)
+        next_page = 2
+        stop = None              # Первая страница, которая не пришла
+        loaded = {}
+        in_flight = {}
+        pool = ThreadPoolExecutor(max_workers=window)
+        try:
+            while True:
+                # Не больше window запросов и не дальше 2×window страниц от самой
+                # медленной: медленная страница может оказаться сбоем, всё за ней —
+                # лишняя работа. После сбоя или отмены новые запросы не уходят
+                while (len(in_flight) < window and next_page <= last
+                       and next_page < min(in_flight.values(), default=next_page) + 2 * window
+                       and stop is None and not cancelled()):
+                    in_flight[pool.submit(fetch, next_page)] = next_page
+                    next_page += 1
+                if not in_flight or cancelled():
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page = in_flight.pop(future)
+                    result = future.result()
+                    if result is None or not result[0]:
+                        stop = page if stop is None else min(stop, page)
+                    else:
+                        loaded[page] = (result[0], result[2])
+                if stop is not None:
+                    # Страницы за сбоем всё равно отбросим — не ждём их
+                    for future in [f for f, page in in_flight.items() if page > stop]:
+                        future.cancel()
+                        del in_flight[future]
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        for page in range(2, last + 1):
+            if page not in loaded:
+                break
+            pages.append(loaded[page])
+        return pages
+
+    def fetch_collection(self, domain: str, endpoint: str,
+                         max_pages: Optional[int] = DEFAULT_MAX_PAGES,
+                         per_page: int = DEFAULT_PER_PAGE, is_cancelled: Callable[[], bool] = None,
+                         params: Optional[dict] = None) -> List[dict]:
+        """
+        Элементы коллекции /wp-json/wp/v2/<endpoint> (до max_pages страниц).
+
+        params — дополнительные параметры запроса (_fields, include, ...).
+        К каждому элементу добавляются '_response_time' и '_has_ssl'.
+        """
+        base_url = f"https://{domain}/wp-json/wp/v2/{endpoint}"
+        results = []
+        for data, response_time in self.fetch_pages(base_url, params, per_page, max_pages, is_cancelled):
+            for item in data:
+                item['_response_time'] = response_time
+                item['_has_ssl'] = base_url.startswith('https')
+            results.extend(data)
+        return results
+
+    def map_domains(self, fn: Callable[[str], object], domains: Iterable[str],
+                    is_cancelled: Callable[[], bool] = None) -> Iterator[Tuple[str, object, Optional[Exception]]]:
+        """
+        Выполняет fn(domain) для всех доменов параллельно.
+
+        Yields:
+            (domain, результат, исключение) — в порядке завершения.
+            После is_cancelled() новые домены не запускаются.
+        """
+        pending = iter(domains)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while True:
+                while len(in_flight) < self.concurrency and not (is_cancelled and is_cancelled()):
+                    domain = next(pending, None)
+                    if domain is None:
+                        break
+                    in_flight[pool.submit(fn, domain)] = domain
+                if not in_flight:
+                    return
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    domain = in_flight.pop(future)
+                    error = future.exception()
+                    yield domain, None if error else future.result(), error
+
+    def close(self):
+        self.session.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ТЕСТ
+# ─────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    import json
+    import hashlib
+    import tempfile
+    from urllib.parse import parse_qs
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    LATENCY = 0.1
+    active = {}
+    peak = {}
+    served = []
+    lock = threading.Lock()
+
+    class MockWp(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            host = self.headers.get("Host")
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                peak[host] = max(peak.get(host, 0), active[host])
+            time.sleep(LATENCY)
+            query = parse_qs(urlparse(self.path).query)
+            page = int(query.get("page", ["1"])[0])
+            per_page = int(query.get("per_page", ["20"])[0])
+            total_pages = 10 if "/paged" in self.path else 200 if "/broken" in self.path else 1
+            with lock:
+                served.append(page)
+            if "/broken" in self.path and page == 3:
+                self.send_response(500)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                with lock:
+                    active[host] -= 1
+                return
+            body = json.dumps([{"id": (page - 1) * per_page + i, "link": f"https://{host}/p{i}/",
+                                "content": {"rendered": "<p>text</p>" * 500}}
+                               for i in range(per_page)]).encode()
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            else:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("ETag", etag)
+                self.send_header("X-WP-TotalPages", str(total_pages))
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            with lock:
+                active[host] -= 1
+
+    # Весь 127.0.0.0/8 — loopback: 127.0.0.N играют роль разных сайтов
+    server = ThreadingHTTPServer(("0.0.0.0", 0), MockWp)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    domains = [f"127.0.0.{i}:{port}" for i in range(1, 41)]
+
+    t0 = time.perf_counter()
+    for domain in domains:
+        for _ in range(3):  # robots + posts + pages, как у анализатора
+            requests.get(f"http://{domain}/", timeout=5)
+    sequential = time.perf_counter() - t0
+    print(f"Последовательно, requests.get: {len(domains)} доменов за {sequential:.2f}s")
+
+    client = WpRestClient(concurrency=16, per_host=2)
+
+    def fetch_three(domain):
+        for _ in range(3):
+            client.get(f"http://{domain}/")
+        return 3
+
+    t0 = time.perf_counter()
+    finished = [d for d, _, err in client.map_domains(fetch_three, domains) if err is None]
+    parallel = time.perf_counter() - t0
+    print(f"WpRestClient(16 потоков): {len(finished)} доменов за {parallel:.2f}s "
+          f"(x{sequential / parallel:.1f})")
+
+    # Лимит на хост: 10 запросов к одному сайту — не больше per_host одновременно
+    peak.clear()
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        list(pool.map(lambda _: client.get(f"http://{domains[0]}/"), range(10)))
+    print(f"Один хост, 10 запросов: одновременно не больше {max(peak.values())} (per_host=2)")
+
+    client.close()
+
+    # Пагинация: 10 страниц по X-WP-TotalPages — страницы 2..10 параллельно
+    for per_host in (1, 4):
+        client = WpRestClient(per_host=per_host)
+        peak.clear()
+        t0 = time.perf_counter()
+        pages = client.fetch_pages(f"http://{domains[0]}/paged", per_page=10)
+        elapsed = time.perf_counter() - t0
+        ids = [item["id"] for data, _ in pages for item in data]
+        print(f"Пагинация, per_host={per_host}: {len(pages)} страниц за {elapsed:.2f}s, "
+              f"порядок сохранён: {ids == list(range(100))}, одновременно {max(peak.values())}")
+        client.close()
+
+    # Сбой на 3-й странице из 200: новые страницы не запрашиваются, лишние не ждём
+    client = WpRestClient(per_host=4)
+    served.clear()
+    t0 = time.perf_counter()
+    pages = client.fetch_pages(f"http://{domains[0]}/broken", per_page=10, max_pages=None)
+    print(f"Сбой на странице 3 из 200: {len(pages)} страниц за {time.perf_counter() - t0:.2f}s, "
+          f"запрошено {len(served)} страниц")
+    client.close()
+
+    # Условные запросы: второй проход по тем же доменам — только 304
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in ("первый", "повторный"):
+            # fresh_seconds=0: каждый раз спрашиваем сервер, тело берём из кэша на 304
+            client = WpRestClient(concurrency=16, cache=HttpResponseCache(tmp, fresh_seconds=0))
+            pages = [client.get_cached(f"http://{d}/wp-json/wp/v2/posts", params={"page": 1})[0]
+                     for d in domains]
+            stats = client.cache.stats()
+            print(f"HTTP-кэш, {run} проход: загружено {client.bytes_downloaded / 1024:.0f} КБ, "
+                  f"304: {stats['revalidated']}, на диске {stats['bytes'] / 1024:.0f} КБ (zlib), "
+                  f"X-WP-TotalPages из кэша: {pages[0].headers.get('X-WP-TotalPages')}")
+            client.close()
+
+    server.shutdown()
@@ -0,0 +1,379 @@
+"""
+xpath_registry.py — Реестр селекторов и скомпилированных XPath
+
+Все XPath-селекторы ContentEngine и LinkInserter живут здесь и компилируются
+один раз при импорте (etree.XPath). Раньше строки передавались в .xpath()
+на каждой странице, и lxml заново разбирал каждое выражение.
+
+Принципы:
+1. Исходные строки остаются читаемыми (contains(@class, '...')), а при
+   компиляции проверка класса переписывается в сравнение по ТОКЕНУ:
+   'entry-content' больше не совпадает с 'entry-content-wrap'.
+2. Намеренно частичные фрагменты (PARTIAL_CLASS_FRAGMENTS) не переписываются.
+3. Динамические выражения (из кэша профилей тем) компилируются через
+   compile_xpath() с LRU-кэшем.
+
+Запуск модуля — микро-бенчмарк стоимости селекторов на страницу.
+"""
+
+import re
+from functools import lru_cache
+from typing import Tuple
+
+from lxml import etree
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ТОКЕН-МАТЧЕР КЛАССОВ
+# ─────────────────────────────────────────────────────────────────────────────
+# Фрагменты, которые ищутся как подстрока специально (любой *content*, *posts*…)
+PARTIAL_CLASS_FRAGMENTS = frozenset(['content', 'posts', 'flavor', 'td-module', 'sidebar'])
+
+_CLASS_CONTAINS_RE = re.compile(r"""contains\(\s*@class\s*,\s*(['"])([^'"]+)\1\s*\)""")
+
+
+def class_token_xpath(expr: str) -> str:
+    """
+    Переписывает contains(@class, 'x') в проверку целого токена класса.
+
+    contains(concat(' ', normalize-space(@class), ' '), ' x ')
+    """
+    def replace(m):
+        value = m.group(2).strip()
+        if value in PARTIAL_CLASS_FRAGMENTS or ' ' in value:
+            return m.group(0)
+        return f"contains(concat(' ', normalize-space(@class), ' '), ' {value} ')"
+
+    return _CLASS_CONTAINS_RE.sub(replace, expr)
+
+
+@lru_cache(maxsize=1024)
+def compile_xpath(expr: str) -> etree.XPath:
+    """Компилирует выражение (с токен-матчером классов). Повторные вызовы — из кэша."""
+    return etree.XPath(class_token_xpath(expr))
+
+
+def compile_all(exprs: Tuple[str, ...]) -> Tuple[Tuple[str, etree.XPath], ...]:
+    """(исходная строка, скомпилированный XPath) — строка нужна для логов и профилей тем."""
+    return tuple((expr, compile_xpath(expr)) for expr in exprs)
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# СЕЛЕКТОРЫ КОНТЕЙНЕРОВ (XPath, от узких к широким)
+# ─────────────────────────────────────────────────────────────────────────────
+CONTENT_XPATHS: Tuple[str, ...] = (
+    # === 1. Page Builders (самые точные) ===
+    # Elementor
+    "//div[contains(@class, 'elementor-widget-theme-post-content')]//div[contains(@class, 'elementor-widget-container')]",
+    "//div[contains(@class, 'elementor-widget-text-editor')]//div[contains(@class, 'elementor-widget-container')]",
+    "//div[contains(@class, 'elementor-text-editor')]",
+    # Divi
+    "//div[contains(@class, 'et_pb_post_content')]",
+    "//div[contains(@class, 'et_pb_text_inner')]",
+    "//div[contains(@class, 'et_pb_module_inner')]",
+    # WPBakery
+    "//div[contains(@class, 'wpb_text_column')]//div[contains(@class, 'wpb_wrapper')]",
+    "//div[contains(@class, 'wpb_content_element')]//div[contains(@class, 'wpb_wrapper')]",
+    # Beaver Builder
+    "//div[contains(@class, 'fl-post-content')]",
+    "//div[contains(@class, 'fl-module-content')]",
+    "//div[contains(@class, 'fl-rich-text')]",
+    # Bricks
+    "//div[contains(@class, 'brxe-post-content')]",
+    "//div[contains(@class, 'brxe-text-basic')]",
+    "//div[contains(@class, 'brxe-text')]",
+    # Oxygen
+    "//div[contains(@class, 'ct-text-block')]",
+    "//div[contains(@class, 'oxy-post-content')]",
+    "//div[contains(@class, 'ct-content-block')]",
+    # Gutenberg
+    "//div[contains(@class, 'wp-block-post-content')]",
+    # Thrive
+    "//div[contains(@class, 'thrv_text_element')]",
+    "//div[contains(@class, 'tve_shortcode_rendered')]",
+    # Brizy
+    "//div[contains(@class, 'brz-rich-text')]",
+    "//div[contains(@class, 'brz-text')]",
+    # SeedProd
+    "//div[contains(@class, 'seedprod-text')]",
+
+    # === 2. Специфичные темы ===
+    # Flavor / flavor variations
+    "//div[contains(@class, 'single-content')]",
+    "//div[contains(@class, 'w-post-elm') and contains(@class, 'post_content')]",
+    "//div[contains(@class, 'uk-margin-medium-top') and @property='text']",
+    "//div[@property='text']",
+    "//div[contains(@class, 'l-section-h')]//div[contains(@class, 'w-post-elm')]",
+    # Astra
+    "//div[contains(@class, 'ast-post-content')]",
+    "//div[contains(@class, 'ast-article-post')]//div[contains(@class, 'entry-content')]",
+    # GeneratePress
+    "//div[contains(@class, 'inside-article')]//div[contains(@class, 'entry-content')]",
+    # OceanWP
+    "//div[contains(@class, 'oceanwp-post-content')]",
+    # flavor theme ct- classes
+    "//div[contains(@class, 'ct-page-content')]",
+    "//div[contains(@class, 'ct-container-content')]",
+    "//div[contains(@class, 'ct-inner-content')]",
+    # Magazine themes
+    "//div[contains(@class, 'td-post-content')]",
+    "//div[contains(@class, 'jeg_post_content')]",
+    "//div[contains(@class, 'tdb-block-inner')]",
+    # flavor theme vc
+    "//div[contains(@class, 'vc_row')]//div[contains(@class, 'wpb_wrapper')]",
+
+    # === 3. WooCommerce ===
+    "//div[contains(@class, 'woocommerce-product-details__short-description')]",
+    "//div[@id='tab-description']",
+    "//div[contains(@class, 'woocommerce-Tabs-panel--description')]",
+    "//div[contains(@class, 'product-short-description')]",
+
+    # === 4. Стандарты WordPress ===
+    "//div[contains(@class, 'entry-content')]",
+    "//div[contains(@class, 'post-content')]",
+    "//div[contains(@class, 'single-post-content')]",
+    "//div[contains(@class, 'article-content')]",
+    "//div[contains(@class, 'the-content')]",
+    "//div[contains(@class, 'page-content')]",
+    "//div[contains(@class, 'blog-single-content')]",
+    "//div[contains(@class, 'post-body')]",
+    "//div[contains(@class, 'content-inner')]",
+    "//div[contains(@class, 'singular-content')]",
+
+    # === 5. Schema.org ===
+    "//*[@itemprop='articleBody']",
+    "//*[@itemprop='text']",
+    "//*[@itemprop='description']",
+
+    # === 6. Fallback (широкие) ===
+    "//div[contains(@class, 'content-area')]//div[contains(@class, 'entry-content')]",
+    "//div[contains(@class, 'content-container')]",
+    "//div[contains(@class, 'content-wrapper')]",
+    "//div[@id='primary']//div[contains(@class, 'content')]",
+    "//div[@id='content']",
+    "//div[@role='main']",
+    "//article//div[contains(@class, 'content')]",
+    "//article",
+    "//div[contains(@class, 'hentry')]",
+
+    # === 7. HTML5 (крайний случай) ===
+    "//main//article",
+    "//article[not(contains(@class, 'sidebar'))]",
+    "//main[not(contains(@class, 'sidebar'))]",
+)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# СЕЛЕКТОРЫ ДЛЯ КАТЕГОРИЙ/АРХИВОВ (листинги постов)
+# ─────────────────────────────────────────────────────────────────────────────
+CATEGORY_LISTING_XPATHS: Tuple[str, ...] = (
+    # === Publisher / flavor themes ===
+    "//div[contains(@class, 'listing-grid')]",
+    "//div[contains(@class, 'listing-blog')]",
+    "//div[contains(@class, 'listing') and contains(@class, 'clearfix')]",
+
+    # === JNews / flavor themes ===
+    "//div[contains(@class, 'jeg_posts')]",
+    "//div[contains(@class, 'jeg_postblock')]",
+    "//div[contains(@class, 'jnews_posts')]",
+
+    # === flavor theme Flavor Flavor ===
+    "//div[contains(@class, 'posts-listing')]",
+    "//div[contains(@class, 'post-listing')]",
+    "//div[contains(@class, 'blog-listing')]",
+
+    # === flavor theme flavor flavor flavor ===
+    "//div[contains(@class, 'td-ss-main-content')]",
+    "//div[contains(@class, 'td_module_wrap')]",
+    "//div[contains(@class, 'tdb-block-inner')]//div[contains(@class, 'td-module')]/..",
+
+    # === Flavor flavor flavor ===
+    "//div[contains(@class, 'elementor-posts-container')]",
+    "//div[contains(@class, 'elementor-posts')]",
+    "//div[contains(@class, 'elementor-loop-container')]",
+
+    # === flavor flavor flavor ===
+    "//div[contains(@class, 'et_pb_blog_grid')]",
+    "//div[contains(@class, 'et_pb_posts')]",
+
+    # === flavor flavor flavor ===
+    "//div[contains(@class, 'theme-flavor-container')]//div[contains(@class, 'posts')]",
+    "//div[contains(@class, 'ast-archive-post')]/..",
+    "//div[contains(@class, 'flavor')]//div[contains(@class, 'posts')]",
+
+    # === flavor Standard ===
+    "//div[contains(@class, 'archive-posts')]",
+    "//div[contains(@class, 'blog-posts')]",
+    "//div[contains(@class, 'posts-wrapper')]",
+    "//div[contains(@class, 'post-list')]",
+    "//div[contains(@class, 'category-posts')]",
+
+    # === flavor flavor flavor (содержит articles) ===
+    "//div[.//article[contains(@class, 'listing-item')]]",
+    "//div[.//article[contains(@class, 'post-item')]]",
+    "//div[.//article[contains(@class, 'type-post')]]",
+    "//section[.//article[contains(@class, 'type-post')]]",
+
+    # === flavor Fallback ===
+    "//main//div[count(.//article) >= 2]",
+    "//div[@id='content']//div[count(.//article) >= 2]",
+    "//div[contains(@class, 'content')]//div[count(.//article) >= 2]",
+)
+
+# XPath для поиска H1 в категориях/архивах
+CATEGORY_HEADER_XPATHS: Tuple[str, ...] = (
+    # === Publisher / flavor themes ===
+    "//section[contains(@class, 'archive-title')]//h1",
+    "//section[contains(@class, 'category-title')]//h1",
+    "//div[contains(@class, 'archive-title')]//h1",
+    "//div[contains(@class, 'category-title')]//h1",
+
+    # === flavor Standard ===
+    "//h1[contains(@class, 'page-heading')]",
+    "//h1[contains(@class, 'page-title')]",
+    "//h1[contains(@class, 'archive-title')]",
+    "//h1[contains(@class, 'category-title')]",
+    "//h1[contains(@class, 'term-title')]",
+
+    # === JNews ===
+    "//div[contains(@class, 'jeg_cat_header')]//h1",
+    "//div[contains(@class, 'jeg_archive_header')]//h1",
+
+    # === flavor flavor ===
+    "//header[contains(@class, 'page-header')]//h1",
+    "//header[contains(@class, 'archive-header')]//h1",
+    "//div[contains(@class, 'page-header')]//h1",
+
+    # === Elementor ===
+    "//div[contains(@class, 'elementor-widget-archive-title')]//h1",
+    "//h1[contains(@class, 'elementor-heading-title')]",
+
+    # === Fallback ===
+    "//h1",
+)
+
+# XPath для поиска H1
+HEADER_XPATHS: Tuple[str, ...] = (
+    # Именно этот класс отвечает за динамический заголовок в твоей теме
+    "//div[contains(@class, 'elementor-widget-theme-post-title')]//h1",
+    "//div[contains(@class, 'elementor-widget-page-title')]//h1",
+    "//*[@data-widget_type='theme-post-title.default']//h1",
+
+    # Баннеры тем
+    "//section[contains(@class, 'page-title')]//h1",
+    "//div[contains(@class, 'page-header')]//h1",
+    "//header[contains(@class, 'entry-header')]//h1",
+    "//div[contains(@class, 'entry-header')]//h1",
+    "//div[contains(@class, 'post-header')]//h1",
+
+    # Elementor
+    "//h1[contains(@class, 'elementor-heading-title')]",
+    "//div[contains(@class, 'elementor-widget-heading')]//h1",
+
+    # Специфичные
+    "//h1[contains(@class, 'entry-title')]",
+    "//h1[contains(@class, 'post-title')]",
+    "//h1[contains(@class, 'page-title')]",
+    "//h1[@id='post_title']",
+
+    # Глобальный fallback
+    "//h1",
+)
+
+# Структурные признаки категории (detect_page_type, fallback после body-классов)
+CATEGORY_STRUCTURE_XPATHS: Tuple[str, ...] = (
+    "//section[contains(@class, 'archive-title')]",
+    "//section[contains(@class, 'category-title')]",
+    "//div[contains(@class, 'archive-title')]",
+    "//h1[contains(@class, 'page-heading')]",
+    "//div[contains(@class, 'listing-grid')]",
+    "//div[contains(@class, 'jeg_posts')]",
+)
+
+# Листинг постов и одиночная статья (detect_page_type)
+LISTING_ARTICLES_XPATH = '//article[contains(@class, "listing-item") or contains(@class, "type-post")]'
+SINGLE_ARTICLE_XPATH = '//article[.//div[contains(@class, "entry-content") or contains(@class, "post-content")]]'
+
+# ─────────────────────────────────────────────────────────────────────────────
+# СЕЛЕКТОРЫ LinkInserter
+# ─────────────────────────────────────────────────────────────────────────────
+LINK_CONTENT_XPATHS: Tuple[str, ...] = (
+    "//div[contains(@class, 'entry-content')]",
+    "//div[contains(@class, 'post-content')]",
+    "//div[contains(@class, 'article-content')]",
+    "//div[contains(@class, 'page-content')]",
+    "//div[contains(@class, 'text-content')]",
+    "//div[contains(@class, 'content-area')]",
+    "//div[contains(@id, 'content')]",
+    "//section",
+    "//article",
+    "//main",
+)
+
+# ─────────────────────────────────────────────────────────────────────────────
+# СКОМПИЛИРОВАННЫЕ НАБОРЫ
+# ─────────────────────────────────────────────────────────────────────────────
+COMPILED_CONTENT = compile_all(CONTENT_XPATHS)
+COMPILED_CATEGORY_LISTING = compile_all(CATEGORY_LISTING_XPATHS)
+COMPILED_CATEGORY_HEADER = compile_all(CATEGORY_HEADER_XPATHS)
+COMPILED_HEADER = compile_all(HEADER_XPATHS)
+COMPILED_CATEGORY_STRUCTURE = compile_all(CATEGORY_STRUCTURE_XPATHS)
+COMPILED_LINK_CONTENT = compile_all(LINK_CONTENT_XPATHS)
+
+LISTING_ARTICLES = compile_xpath(LISTING_ARTICLES_XPATH)
+SINGLE_ARTICLE = compile_xpath(SINGLE_ARTICLE_XPATH)
+
+# Мелкие выражения, которые вызываются на каждом кандидате
+DESCENDANT_P = etree.XPath('.//p')
+DESCENDANT_ARTICLES = etree.XPath('.//article')
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# БЕНЧМАРК
+# ─────────────────────────────────────────────────────────────────────────────
+if __name__ == "__main__":
+    import time
+    from lxml import html
+
+    paragraphs = ''.join(
+        f'<p>Paragraph {i} with some text for the content container.</p>' for i in range(40)
+    )
+    sidebar = ''.join(f'<li><a href="/p{i}/">Recent post {i}</a></li>' for i in range(30))
+    page = (
+        '<html><head><title>t</title></head><body class="single postid-1">'
+        '<div id="page" class="site"><header class="site-header"><nav>menu</nav></header>'
+        '<div class="site-main"><div class="layout"><div class="col">'
+        f'<div class="main-text">{paragraphs}</div></div>'
+        f'<aside class="widget-area"><ul>{sidebar}</ul></aside></div></div>'
+        '<footer class="site-footer">f</footer></div></body></html>'
+    )
+    doc = html.fromstring(page)
+    body = doc.find('body')
+
+    # Худший случай: ни один селектор не совпадает — проходим весь список
+    selector_sets = (
+        ('CONTENT', CONTENT_XPATHS, COMPILED_CONTENT),
+        ('CATEGORY_LISTING', CATEGORY_LISTING_XPATHS, COMPILED_CATEGORY_LISTING),
+        ('CATEGORY_HEADER', CATEGORY_HEADER_XPATHS, COMPILED_CATEGORY_HEADER),
+        ('HEADER', HEADER_XPATHS, COMPILED_HEADER),
+        ('LINK_CONTENT', LINK_CONTENT_XPATHS, COMPILED_LINK_CONTENT),
+    )
+    rounds = 200
+
+    print("=" * 70)
+    print(f"  СТОИМОСТЬ СЕЛЕКТОРОВ НА СТРАНИЦУ ({rounds} прогонов)")
+    print("=" * 70)
+    for name, strings, compiled in selector_sets:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for expr in strings:
+                body.xpath(expr)
+        before = (time.perf_counter() - start) / rounds
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for _expr, xpath in compiled:
+                xpath(body)
+        after = (time.perf_counter() - start) / rounds
+
+        print(f"  {name:<18} {len(strings):>3} выражений: "
+              f"строки {before * 1000:7.3f} мс → скомпилированные {after * 1000:7.3f} мс "
+              f"(x{before / after:.1f})")